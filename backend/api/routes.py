@@ -5,14 +5,25 @@ import asyncio
 import json
 import logging
 import os
-from typing import Optional
+from datetime import datetime
+from typing import Dict, List, Optional
 
 from fastapi import APIRouter, HTTPException, Request
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.concurrency import iterate_in_threadpool
 
+from services.admission import AdmissionRejected, QueueTimeout
+from services.answer_cache import replay_tokens
 from services.indexer import DocumentIndexer
-from services.rag import RAGPipeline
+from services.metrics import BATCH_QUERIES_PENDING, CONTENT_TYPE, REGISTRY
+from services.stage_timer import StageTimer
+from services.streaming import coalesce, dumps, sse_event
+from services.tracing import DEFAULT_SAMPLE_INTERVAL_MS, PROFILE_MODES
+from services.warmup import ComponentFailed
+from services.snapshot import SnapshotError, export_snapshot, import_snapshot
+from services.symbol_index import MATCH_MODES as SYMBOL_MATCH_MODES
+from services.rag import DEFAULT_DIVERSITY, DEFAULT_OVERFETCH, RAGPipeline, SEARCH_MODES, SYSTEM_PROMPT
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -22,10 +33,97 @@ class IndexRequest(BaseModel):
     folder_path: str
 
 
+class SnapshotRequest(BaseModel):
+    snapshot_path: str
+    # Export only this indexed folder; imports always restore the whole snapshot
+    folder_path: Optional[str] = None
+
+
+class SearchFilters(BaseModel):
+    """Restrict retrieval to matching chunks; list fields match any value, fields combine with AND"""
+    # Indexed folders, or directories inside them
+    folders: Optional[List[str]] = None
+    # Extensions such as "md" or ".py"
+    file_types: Optional[List[str]] = None
+    # fnmatch pattern on the full file path, e.g. "*/projects/*.md"
+    path_glob: Optional[str] = None
+    # Frontmatter or inline #tags; a parent tag also matches its nested tags
+    tags: Optional[List[str]] = None
+    modified_after: Optional[datetime] = None
+    modified_before: Optional[datetime] = None
+
+
 class QueryRequest(BaseModel):
     query: str
     model: Optional[str] = "llama3.2:3b"
     top_k: Optional[int] = 5
+    search_mode: Optional[str] = "hybrid"
+    diversity: Optional[float] = Field(DEFAULT_DIVERSITY, ge=0.0, le=1.0)
+    overfetch: Optional[int] = Field(DEFAULT_OVERFETCH, ge=1, le=20)
+    merge_adjacent: Optional[bool] = True
+    context_tokens: Optional[int] = Field(None, ge=1)
+    session_id: Optional[str] = None
+    use_cache: Optional[bool] = True
+    # Join tokens into one event per this many milliseconds; 0 sends every token as it comes
+    coalesce_ms: Optional[float] = Field(0, ge=0, le=1000)
+    filters: Optional[SearchFilters] = None
+    # Add up to this many notes linked to or from the hits
+    expand_links: Optional[int] = Field(0, ge=0, le=20)
+    # Put chunks defining code identifiers named in the query first
+    symbols: Optional[bool] = True
+
+
+# Limits for /query/batch
+MAX_BATCH_QUERIES = 256
+BATCH_FORMATS = ("ndjson", "sse")
+
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_QUERIES)
+    model: Optional[str] = "llama3.2:3b"
+    top_k: Optional[int] = 5
+    search_mode: Optional[str] = "hybrid"
+    diversity: Optional[float] = Field(DEFAULT_DIVERSITY, ge=0.0, le=1.0)
+    overfetch: Optional[int] = Field(DEFAULT_OVERFETCH, ge=1, le=20)
+    merge_adjacent: Optional[bool] = True
+    context_tokens: Optional[int] = Field(None, ge=1)
+    generate: Optional[bool] = True
+    concurrency: Optional[int] = Field(4, ge=1, le=16)
+    use_cache: Optional[bool] = True
+    format: Optional[str] = "ndjson"
+    coalesce_ms: Optional[float] = Field(0, ge=0, le=1000)
+    filters: Optional[SearchFilters] = None
+    expand_links: Optional[int] = Field(0, ge=0, le=20)
+    symbols: Optional[bool] = True
+
+
+class SessionRequest(BaseModel):
+    model: Optional[str] = "llama3.2:3b"
+
+
+class SearchRequest(BaseModel):
+    query: str
+    top_k: Optional[int] = 5
+    search_mode: Optional[str] = "lexical"
+    diversity: Optional[float] = Field(DEFAULT_DIVERSITY, ge=0.0, le=1.0)
+    overfetch: Optional[int] = Field(DEFAULT_OVERFETCH, ge=1, le=20)
+    merge_adjacent: Optional[bool] = True
+    filters: Optional[SearchFilters] = None
+    expand_links: Optional[int] = Field(0, ge=0, le=20)
+    symbols: Optional[bool] = True
+
+
+class ProfileRequest(BaseModel):
+    request_id: str
+    mode: Optional[str] = "stack"
+    interval_ms: Optional[float] = Field(DEFAULT_SAMPLE_INTERVAL_MS, gt=0, le=1000)
+
+
+# Callers sharing a host can identify themselves for fair queueing
+CLIENT_ID_HEADER = "x-client-id"
+
+# Formats for GET /traces/{trace_id}
+TRACE_FORMATS = ("json", "chrome")
 
 
 class FolderInfo(BaseModel):
@@ -37,14 +135,76 @@ class FolderInfo(BaseModel):
 
 @router.get("/health")
 async def health_check(request: Request):
-    """Check backend and Ollama status"""
+    """Check backend and Ollama status; "warming" until the stores have loaded, "degraded" if one failed to"""
     ollama = request.app.state.ollama_client
     ollama_status = await ollama.check_health()
+    warmup = request.app.state.warmup
     
-    return {
-        "status": "healthy",
-        "ollama_status": "connected" if ollama_status else "disconnected"
+    status = "healthy"
+    if warmup.failed:
+        status = "degraded"
+    elif not warmup.ready:
+        status = "warming"
+    
+    response = {
+        "status": status,
+        "ollama_status": "connected" if ollama_status else "disconnected",
+        "components": warmup.status()
     }
+    # A PCA reduction keeps vectors full width until enough documents are indexed to fit it
+    vector_store = getattr(request.app.state, "vector_store", None)
+    if vector_store is not None:
+        response["reduction"] = vector_store.get_reduction_status()
+    return response
+
+
+async def _require(request: Request, *names: str) -> None:
+    """Wait for background-loaded services a route uses; 503 if one failed to load"""
+    try:
+        await request.app.state.warmup.require(*names)
+    except ComponentFailed as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+def _retrieval_components(
+    search_mode: str,
+    use_cache: bool = False,
+    filters: Optional[Dict] = None,
+    expand_links: int = 0
+) -> List[str]:
+    """Services a search in this mode reads; hits are always loaded from the vector store
+    
+    Vector searches do not wait for the lexical index, which reads it as missing until it has loaded.
+    """
+    names = ["vector_store"]
+    if search_mode != "vector":
+        names.append("lexical_index")
+    if filters:
+        names.append("metadata_index")
+    if expand_links:
+        names.append("link_graph")
+    if use_cache:
+        names.append("answer_cache")
+    return names
+
+
+def _filters(filters: Optional[SearchFilters]) -> Optional[Dict]:
+    """Filters that were actually set, or None"""
+    if filters is None:
+        return None
+    return filters.model_dump(exclude_none=True) or None
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """Stage latencies, counters and gauges in Prometheus text format"""
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@router.get("/admission")
+async def get_admission(request: Request):
+    """Generation slots in use and requests waiting for one"""
+    return request.app.state.admission.stats()
 
 
 @router.get("/models")
@@ -117,14 +277,27 @@ async def index_folder(req: IndexRequest, request: Request):
     if not os.path.isdir(folder_path):
         raise HTTPException(status_code=400, detail=f"Invalid folder path: {folder_path}")
     
+    await _require(
+        request, "vector_store", "lexical_index", "metadata_index", "link_graph", "symbol_index", "answer_cache"
+    )
     vector_store = request.app.state.vector_store
     ollama = request.app.state.ollama_client
+    lexical_index = request.app.state.lexical_index
     
-    indexer = DocumentIndexer(vector_store, ollama)
+    indexer = DocumentIndexer(
+        vector_store,
+        ollama,
+        lexical_index=lexical_index,
+        answer_cache=request.app.state.answer_cache,
+        metadata_index=request.app.state.metadata_index,
+        link_graph=request.app.state.link_graph,
+        symbol_index=request.app.state.symbol_index
+    )
     
     async def stream_progress():
         errors = []
         processed = 0
+        deduplicated = 0
         
         try:
             # Send initial status
@@ -140,11 +313,14 @@ async def index_folder(req: IndexRequest, request: Request):
                     yield f"data: {json.dumps(progress)}\n\n"
                 elif progress.get('type') == 'discovery':
                     yield f"data: {json.dumps(progress)}\n\n"
+                elif progress.get('type') == 'dedup':
+                    deduplicated = progress['deduplicated']
+                    yield f"data: {json.dumps(progress)}\n\n"
                 elif progress.get('type') == 'embedding':
                     yield f"data: {json.dumps(progress)}\n\n"
             
             # Send completion
-            yield f"data: {json.dumps({'type': 'done', 'processed': processed, 'errors': len(errors), 'error_files': errors})}\n\n"
+            yield f"data: {json.dumps({'type': 'done', 'processed': processed, 'errors': len(errors), 'error_files': errors, 'deduplicated': deduplicated})}\n\n"
             
         except Exception as e:
             logger.error(f"Indexing failed: {e}")
@@ -159,51 +335,590 @@ async def index_folder(req: IndexRequest, request: Request):
 @router.delete("/folders/{folder_path:path}")
 async def remove_folder(folder_path: str, request: Request):
     """Remove a folder from the index"""
-    vector_store = request.app.state.vector_store
+    await _require(
+        request, "vector_store", "lexical_index", "metadata_index", "link_graph", "symbol_index", "answer_cache"
+    )
+    indexer = DocumentIndexer(
+        request.app.state.vector_store,
+        request.app.state.ollama_client,
+        lexical_index=request.app.state.lexical_index,
+        answer_cache=request.app.state.answer_cache,
+        metadata_index=request.app.state.metadata_index,
+        link_graph=request.app.state.link_graph,
+        symbol_index=request.app.state.symbol_index
+    )
     
     try:
         # Remove documents from this folder
-        vector_store.delete_by_folder(folder_path)
+        indexer.remove_folder(folder_path)
         return {"status": "success", "message": f"Removed {folder_path} from index"}
     except Exception as e:
         logger.error(f"Failed to remove folder: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _snapshot_stream(kind: str, path: str, events):
+    """SSE progress for a snapshot export or import running in a worker thread"""
+    async def stream_progress():
+        yield sse_event({'type': 'start', kind: path})
+        try:
+            async for event in iterate_in_threadpool(events):
+                yield sse_event(event)
+        except SnapshotError as e:
+            yield sse_event({'type': 'error', 'message': str(e)})
+        except Exception as e:
+            logger.error(f"Snapshot {kind} failed: {e}")
+            yield sse_event({'type': 'error', 'message': str(e)})
+    
+    return StreamingResponse(stream_progress(), media_type="text/event-stream")
+
+
+@router.post("/folders/export")
+async def export_folders(req: SnapshotRequest, request: Request):
+    """Write indexed documents and their embeddings to a snapshot file with streaming progress"""
+    parent = os.path.dirname(os.path.abspath(req.snapshot_path))
+    if not os.path.isdir(parent):
+        raise HTTPException(status_code=400, detail=f"Invalid snapshot path: {req.snapshot_path}")
+    
+    await _require(request, "vector_store")
+    events = export_snapshot(request.app.state.vector_store, req.snapshot_path, folder_path=req.folder_path)
+    return _snapshot_stream("export", req.snapshot_path, events)
+
+
+@router.post("/folders/import")
+async def import_folders(req: SnapshotRequest, request: Request):
+    """Restore a snapshot into the index without re-embedding, with streaming progress"""
+    if not os.path.isfile(req.snapshot_path):
+        raise HTTPException(status_code=400, detail=f"Invalid snapshot path: {req.snapshot_path}")
+    
+    await _require(
+        request, "vector_store", "lexical_index", "metadata_index", "link_graph", "symbol_index", "answer_cache"
+    )
+    indexer = DocumentIndexer(
+        request.app.state.vector_store,
+        request.app.state.ollama_client,
+        lexical_index=request.app.state.lexical_index,
+        answer_cache=request.app.state.answer_cache,
+        metadata_index=request.app.state.metadata_index,
+        link_graph=request.app.state.link_graph,
+        symbol_index=request.app.state.symbol_index
+    )
+    return _snapshot_stream("import", req.snapshot_path, import_snapshot(indexer, req.snapshot_path))
+
+
 # ============== Query / Chat ==============
 
+def _validate_search_mode(search_mode: str) -> None:
+    if search_mode not in SEARCH_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid search_mode: {search_mode}. Expected one of {', '.join(SEARCH_MODES)}"
+        )
+
+
+def _enqueue(request: Request, weight: int = 1):
+    """Take a generation slot or a place in the queue; 429 when the queue is full"""
+    client_id = request.headers.get(CLIENT_ID_HEADER) or (request.client.host if request.client else "unknown")
+    try:
+        return request.app.state.admission.enqueue(client_id, weight)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429,
+            detail=e.reason,
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+
+@router.post("/search")
+async def search_documents(req: SearchRequest, request: Request):
+    """Retrieve matching sources without generating an answer"""
+    _validate_search_mode(req.search_mode)
+    filters = _filters(req.filters)
+    await _require(request, *_retrieval_components(req.search_mode, filters=filters, expand_links=req.expand_links))
+    
+    rag = RAGPipeline(
+        request.app.state.vector_store,
+        request.app.state.ollama_client,
+        lexical_index=getattr(request.app.state, "lexical_index", None),
+        metadata_index=getattr(request.app.state, "metadata_index", None),
+        link_graph=getattr(request.app.state, "link_graph", None),
+        # Used once loaded; until then searches run without symbol lookups
+        symbol_index=getattr(request.app.state, "symbol_index", None)
+    )
+    
+    timer = StageTimer()
+    sources = await rag.retrieve(
+        req.query,
+        top_k=req.top_k,
+        mode=req.search_mode,
+        diversity=req.diversity,
+        overfetch=req.overfetch,
+        merge_chunks=req.merge_adjacent,
+        timer=timer,
+        filters=filters,
+        expand_links=req.expand_links,
+        symbols=req.symbols
+    )
+    return {"sources": sources, "timings": timer.to_dict()}
+
+
 @router.post("/query")
 async def query_documents(req: QueryRequest, request: Request):
     """Query indexed documents with RAG"""
+    _validate_search_mode(req.search_mode)
+    filters = _filters(req.filters)
+    await _require(request, *_retrieval_components(
+        req.search_mode, use_cache=req.use_cache and not req.session_id, filters=filters, expand_links=req.expand_links
+    ))
+    
     vector_store = request.app.state.vector_store
     ollama = request.app.state.ollama_client
+    lexical_index = getattr(request.app.state, "lexical_index", None)
+    metadata_index = getattr(request.app.state, "metadata_index", None)
+    link_graph = getattr(request.app.state, "link_graph", None)
+    symbol_index = getattr(request.app.state, "symbol_index", None)
     
-    rag = RAGPipeline(vector_store, ollama, model=req.model)
+    session = None
+    if req.session_id:
+        session = _get_session(req.session_id, request)
+    
+    model = session.model if session else req.model
+    rag = RAGPipeline(
+        vector_store, ollama, model=model,
+        lexical_index=lexical_index, metadata_index=metadata_index, link_graph=link_graph, symbol_index=symbol_index
+    )
+    
+    # Session answers depend on the conversation so far, so they are never cached
+    answer_cache = request.app.state.answer_cache if req.use_cache and session is None else None
+    
+    ticket = _enqueue(request)
     
     async def generate():
         try:
-            # First, retrieve relevant sources
-            sources = await rag.retrieve(req.query, top_k=req.top_k)
+            # Tell a queued client where it stands until a slot frees up
+            try:
+                async for position in ticket.wait():
+                    yield sse_event({'type': 'queued', 'position': position})
+            except QueueTimeout as e:
+                yield sse_event({'type': 'error', 'message': str(e), 'retry_after': e.retry_after})
+                return
+            
+            if session is None:
+                async for event in run_query():
+                    yield event
+                return
+            
+            # Turns of one session run one after another
+            async with session.lock:
+                try:
+                    async for event in run_query():
+                        yield event
+                finally:
+                    request.app.state.chat_sessions.save(session)
+        finally:
+            ticket.release()
+    
+    async def run_query():
+        timer = StageTimer()
+        try:
+            # Load the chat model while the query is embedded and retrieval runs
+            warm_task = request.app.state.model_warmer.ensure_warm(model)
+            if warm_task is not None:
+                timer.track_task("model_warm", warm_task)
+            
+            # The query embedding serves both vector search and the answer cache
+            embedding_task = None
+            if req.search_mode != "lexical":
+                embedding_task = asyncio.create_task(timer.track("embed", rag.embed_query(req.query)))
+            
+            # First, retrieve relevant sources; lexical search overlaps the embedding
+            try:
+                sources = await rag.retrieve(
+                    req.query,
+                    top_k=req.top_k,
+                    mode=req.search_mode,
+                    diversity=req.diversity,
+                    overfetch=req.overfetch,
+                    merge_chunks=req.merge_adjacent,
+                    query_embedding=embedding_task,
+                    timer=timer,
+                    filters=filters,
+                    expand_links=req.expand_links,
+                    symbols=req.symbols
+                )
+                query_embedding = await embedding_task if embedding_task is not None else None
+            finally:
+                if embedding_task is not None and not embedding_task.done():
+                    embedding_task.cancel()
+            
+            # Keep what fits the model's context budget
+            with timer.stage("pack"):
+                sources, context_tokens = rag.pack_context(sources, req.context_tokens)
+            
+            cached = None
+            if answer_cache is not None:
+                with timer.stage("cache_lookup"):
+                    cached = answer_cache.lookup(model, req.query, query_embedding, sources)
             
             # Send sources to frontend
-            yield f"data: {json.dumps({'type': 'sources', 'sources': sources})}\n\n"
+            yield sse_event({'type': 'sources', 'sources': sources, 'context_tokens': context_tokens, 'cached': cached is not None, 'timings': timer.to_dict()})
+            
+            done = {'type': 'done'}
+            if cached is not None:
+                # Replay the earlier answer as a token stream, or in one event when coalescing
+                replay = [cached['answer']] if req.coalesce_ms else replay_tokens(cached['answer'])
+                for token in replay:
+                    yield sse_event({'type': 'token', 'content': token})
+                done['cached'] = {'similarity': cached['similarity'], 'query': cached['query']}
+                done['timings'] = timer.to_dict()
+                yield sse_event(done)
+                return
             
             # Stream the response
-            async for token in rag.generate(req.query, sources):
-                yield f"data: {json.dumps({'type': 'token', 'content': token})}\n\n"
+            if session is None:
+                tokens = rag.generate(req.query, sources)
+            else:
+                tokens = rag.generate_in_session(session, req.query, sources)
+            answer = ""
+            with timer.stage("generate"):
+                async for token in coalesce(tokens, req.coalesce_ms):
+                    if not answer:
+                        timer.mark("first_token")
+                    answer += token
+                    yield sse_event({'type': 'token', 'content': token})
+            
+            # Only complete, successful answers are worth replaying
+            if answer_cache is not None and not answer.startswith("Error:"):
+                answer_cache.put(model, req.query, query_embedding, sources, answer)
             
             # Done
-            yield f"data: {json.dumps({'type': 'done'})}\n\n"
+            done['timings'] = timer.to_dict()
+            if session is not None:
+                done['session_id'] = session.id
+            yield sse_event(done)
             
         except Exception as e:
             logger.error(f"Query failed: {e}")
-            yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+            yield sse_event({'type': 'error', 'message': str(e)})
+    
+    # A body that is never iterated still gives its slot back
+    body = generate()
+    ticket.bind(body)
     
     return StreamingResponse(
-        generate(),
+        body,
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
         }
     )
+
+
+@router.post("/query/batch")
+async def query_documents_batch(req: BatchQueryRequest, request: Request):
+    """Retrieve for many questions at once and answer them with bounded concurrency"""
+    _validate_search_mode(req.search_mode)
+    if req.format not in BATCH_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid format: {req.format}. Expected one of {', '.join(BATCH_FORMATS)}"
+        )
+    filters = _filters(req.filters)
+    await _require(request, *_retrieval_components(
+        req.search_mode, use_cache=req.use_cache, filters=filters, expand_links=req.expand_links
+    ))
+    
+    rag = RAGPipeline(
+        request.app.state.vector_store,
+        request.app.state.ollama_client,
+        model=req.model,
+        lexical_index=getattr(request.app.state, "lexical_index", None),
+        metadata_index=getattr(request.app.state, "metadata_index", None),
+        link_graph=getattr(request.app.state, "link_graph", None),
+        symbol_index=getattr(request.app.state, "symbol_index", None)
+    )
+    answer_cache = request.app.state.answer_cache if req.use_cache else None
+    stream_tokens = req.format == "sse"
+    
+    # Answering takes one generation slot per concurrent question
+    ticket = _enqueue(request, weight=req.concurrency) if req.generate else None
+    
+    if req.generate:
+        request.app.state.model_warmer.ensure_warm(req.model)
+    
+    def encode(event: dict) -> str:
+        if stream_tokens:
+            return sse_event(event)
+        return dumps(event) + "\n"
+    
+    async def answer_one(index: int, sources: list, query_embedding, semaphore, events: asyncio.Queue):
+        query = req.queries[index]
+        with BATCH_QUERIES_PENDING.track_inprogress():
+            async with semaphore:
+                try:
+                    sources, context_tokens = rag.pack_context(sources, req.context_tokens)
+                    result = {'type': 'result', 'index': index, 'query': query, 'sources': sources, 'context_tokens': context_tokens}
+                    
+                    if req.generate:
+                        cached = answer_cache.lookup(req.model, query, query_embedding, sources) if answer_cache else None
+                        if cached is not None:
+                            result['answer'] = cached['answer']
+                            result['cached'] = True
+                        else:
+                            answer = ""
+                            async for token in coalesce(rag.generate(query, sources), req.coalesce_ms):
+                                answer += token
+                                if stream_tokens:
+                                    await events.put({'type': 'token', 'index': index, 'content': token})
+                            if answer_cache is not None and not answer.startswith("Error:"):
+                                answer_cache.put(req.model, query, query_embedding, sources, answer)
+                            result['answer'] = answer
+                            result['cached'] = False
+                    
+                    await events.put(result)
+                except Exception as e:
+                    logger.error(f"Batch query {index} failed: {e}")
+                    await events.put({'type': 'error', 'index': index, 'query': query, 'message': str(e)})
+    
+    async def run_batch():
+        try:
+            if ticket is not None:
+                try:
+                    async for position in ticket.wait():
+                        yield encode({'type': 'queued', 'position': position})
+                except QueueTimeout as e:
+                    yield encode({'type': 'error', 'message': str(e), 'retry_after': e.retry_after})
+                    return
+            
+            async for event in answer_batch():
+                yield event
+        finally:
+            if ticket is not None:
+                ticket.release()
+    
+    async def answer_batch():
+        timer = StageTimer()
+        try:
+            # One embedding request and one vector query for every question
+            all_sources, embeddings = await rag.retrieve_batch(
+                req.queries,
+                top_k=req.top_k,
+                mode=req.search_mode,
+                diversity=req.diversity,
+                overfetch=req.overfetch,
+                merge_chunks=req.merge_adjacent,
+                timer=timer,
+                filters=filters,
+                expand_links=req.expand_links,
+                symbols=req.symbols
+            )
+        except Exception as e:
+            logger.error(f"Batch retrieval failed: {e}")
+            yield encode({'type': 'error', 'message': str(e)})
+            return
+        
+        # Results are emitted as each question finishes, tagged with its index
+        events: asyncio.Queue = asyncio.Queue()
+        # Admission may grant fewer slots than asked for
+        semaphore = asyncio.Semaphore(ticket.weight if ticket is not None else req.concurrency)
+        tasks = [
+            asyncio.create_task(answer_one(i, sources, embeddings[i], semaphore, events))
+            for i, sources in enumerate(all_sources)
+        ]
+        
+        async def finish():
+            await asyncio.gather(*tasks)
+            await events.put(None)
+        
+        finisher = asyncio.create_task(finish())
+        try:
+            with timer.stage("answer"):
+                while True:
+                    event = await events.get()
+                    if event is None:
+                        break
+                    yield encode(event)
+            
+            yield encode({'type': 'done', 'count': len(req.queries), 'timings': timer.to_dict()})
+        finally:
+            # Stop generating if the client went away
+            for task in tasks + [finisher]:
+                task.cancel()
+    
+    body = run_batch()
+    if ticket is not None:
+        ticket.bind(body)
+    
+    return StreamingResponse(
+        body,
+        media_type="text/event-stream" if stream_tokens else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+
+@router.get("/cache")
+async def get_answer_cache(request: Request):
+    """Answer cache size and hit counts"""
+    await _require(request, "answer_cache")
+    return request.app.state.answer_cache.stats()
+
+
+@router.delete("/cache")
+async def clear_answer_cache(request: Request):
+    """Forget all cached answers"""
+    await _require(request, "answer_cache")
+    request.app.state.answer_cache.clear()
+    return {"status": "success", "message": "Cleared answer cache"}
+
+
+# ============== Link Graph ==============
+
+@router.get("/graph/note")
+async def get_graph_note(file_path: str, request: Request):
+    """A note's tags, outgoing links and backlinks"""
+    await _require(request, "link_graph")
+    note = await asyncio.to_thread(request.app.state.link_graph.note, file_path)
+    if note is None:
+        raise HTTPException(status_code=404, detail=f"Not indexed: {file_path}")
+    return note
+
+
+@router.get("/graph/neighbors")
+async def get_graph_neighbors(file_path: str, request: Request, depth: int = 1, limit: int = 200):
+    """Notes within depth links of a note, in either direction"""
+    if not 1 <= depth <= 3:
+        raise HTTPException(status_code=400, detail="depth must be between 1 and 3")
+    await _require(request, "link_graph")
+    neighbors = await asyncio.to_thread(request.app.state.link_graph.neighbors, file_path, depth, limit)
+    return {"file_path": file_path, "neighbors": neighbors}
+
+
+@router.get("/graph/tags")
+async def get_graph_tags(request: Request, tag: Optional[str] = None):
+    """Every tag with its note count, or the notes carrying one tag"""
+    await _require(request, "link_graph")
+    link_graph = request.app.state.link_graph
+    if tag is None:
+        return {"tags": await asyncio.to_thread(link_graph.tags)}
+    return {"tag": tag, "files": await asyncio.to_thread(link_graph.files_with_tag, tag)}
+
+
+# ============== Symbols ==============
+
+@router.get("/symbols")
+async def lookup_symbols(
+    q: str,
+    request: Request,
+    match: str = "prefix",
+    kind: Optional[str] = None,
+    folder_path: Optional[str] = None,
+    limit: int = 50
+):
+    """Where classes, functions and other definitions matching a name are, from the symbol index"""
+    if match not in SYMBOL_MATCH_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid match: {match}. Expected one of {', '.join(SYMBOL_MATCH_MODES)}"
+        )
+    if not 1 <= limit <= 500:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 500")
+    await _require(request, "symbol_index")
+    symbols = await asyncio.to_thread(
+        request.app.state.symbol_index.lookup, q, match=match, kind=kind, folder_path=folder_path, limit=limit
+    )
+    return {"query": q, "match": match, "symbols": symbols}
+
+
+# ============== Chat Sessions ==============
+
+def _get_session(session_id: str, request: Request):
+    session = request.app.state.chat_sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired session: {session_id}")
+    return session
+
+
+@router.post("/sessions")
+async def create_session(req: SessionRequest, request: Request):
+    """Start a conversation whose follow-up queries reuse earlier context"""
+    session = request.app.state.chat_sessions.create(req.model, SYSTEM_PROMPT)
+    return session.summary()
+
+
+@router.get("/sessions")
+async def list_sessions(request: Request):
+    """List active conversations"""
+    return {"sessions": [session.summary() for session in request.app.state.chat_sessions.list()]}
+
+
+@router.get("/sessions/{session_id}")
+async def get_session(session_id: str, request: Request):
+    """Get a conversation and its message history"""
+    session = _get_session(session_id, request)
+    return {**session.summary(), "history": session.messages[1:]}
+
+
+@router.delete("/sessions/{session_id}")
+async def delete_session(session_id: str, request: Request):
+    """End a conversation"""
+    if not request.app.state.chat_sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail=f"Unknown or expired session: {session_id}")
+    return {"status": "success", "message": f"Deleted session {session_id}"}
+
+
+# ============== Tracing ==============
+
+@router.get("/traces")
+async def list_traces(request: Request, limit: int = 50):
+    """Recently finished traces, newest first"""
+    return {"traces": request.app.state.tracer.list(limit)}
+
+
+@router.post("/traces/profile")
+async def arm_profile(req: ProfileRequest, request: Request):
+    """Profile the next request sent with this X-Request-ID"""
+    if req.mode not in PROFILE_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid mode: {req.mode}. Expected one of {', '.join(PROFILE_MODES)}"
+        )
+    request.app.state.tracer.arm_profile(req.request_id, req.mode, req.interval_ms)
+    return {"status": "armed", "request_id": req.request_id, "mode": req.mode}
+
+
+@router.get("/traces/{trace_id}")
+async def get_trace(trace_id: str, request: Request, format: str = "json"):
+    """A trace's span tree, or Chrome trace events to load in Perfetto"""
+    if format not in TRACE_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid format: {format}. Expected one of {', '.join(TRACE_FORMATS)}"
+        )
+    trace = _get_trace(trace_id, request)
+    return trace.to_chrome() if format == "chrome" else trace.to_dict()
+
+
+@router.get("/traces/{trace_id}/profile")
+async def get_trace_profile(trace_id: str, request: Request):
+    """pstats text for cProfile, collapsed stacks for the sampler"""
+    trace = _get_trace(trace_id, request)
+    if trace.profile is None:
+        raise HTTPException(status_code=404, detail=f"Trace {trace_id} was not profiled")
+    if "error" in trace.profile:
+        raise HTTPException(status_code=409, detail=trace.profile["error"])
+    return PlainTextResponse(trace.profile["text"])
+
+
+@router.delete("/traces")
+async def clear_traces(request: Request):
+    """Forget all finished traces"""
+    request.app.state.tracer.clear()
+    return {"status": "success", "message": "Cleared traces"}
+
+
+def _get_trace(trace_id: str, request: Request):
+    trace = request.app.state.tracer.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or evicted trace: {trace_id}")
+    return trace
@@ -0,0 +1,156 @@
+"""
+Filter benchmark - retrieval latency against metadata filter selectivity
+
+Fills a store, lexical index and metadata index with --chunks random chunks
+tagged so that a tag filter matches 100%, 10%, 1% and 0.1% of them, then times
+RAGPipeline.retrieve with each filter in vector, lexical and hybrid mode.
+Filters are resolved to chunk ids up front and only those are scored; a
+filter matching everything is dropped, so the 100% row is the plain search.
+
+For comparison, "postfilter" runs the unfiltered search for the usual
+top_k * overfetch candidates and drops the ones outside the filter, which is
+what a where clause applied after the search would return; it reports how
+many of the top_k slots it could fill:
+
+    cd backend && python -m benchmarks.bench_filters --chunks 50000 --backend float16
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from benchmarks.synthetic_corpus import FILLER_WORDS
+from services.lexical_index import LexicalIndex
+from services.metadata_index import MetadataIndex
+from services.quantized_store import SUPPORTED_DTYPES, QuantizedVectorStore
+from services.rag import DEFAULT_OVERFETCH, RAGPipeline
+from services.vector_store import VectorStore
+
+INSERT_BATCH = 2000
+
+# Tag -> share of chunks carrying it; each chunk's tags nest, so "p1" chunks also carry "p10"
+SELECTIVITY_TAGS = {"all": 1.0, "p10": 0.1, "p1": 0.01, "p01": 0.001}
+
+
+def tags_for(i: int) -> str:
+    slot = i % 1000
+    return ",".join(tag for tag, share in SELECTIVITY_TAGS.items() if slot < share * 1000)
+
+
+def fill(store, lexical_index: LexicalIndex, metadata_index: MetadataIndex, chunks: int, dim: int, seed: int = 0) -> None:
+    rng = np.random.default_rng(seed)
+    words = random.Random(seed)
+    for start in range(0, chunks, INSERT_BATCH):
+        count = min(INSERT_BATCH, chunks - start)
+        vectors = rng.normal(size=(count, dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        ids = [f"chunk-{start + i}" for i in range(count)]
+        documents = [" ".join(words.choices(FILLER_WORDS, k=120)) for _ in range(count)]
+        metadatas = [
+            {
+                "file_path": f"/bench/file-{(start + i) // 10}.md",
+                "folder_path": "/bench",
+                "file_type": "md",
+                "chunk_index": (start + i) % 10,
+                "tags": tags_for(start + i),
+            }
+            for i in range(count)
+        ]
+        store.add_documents(ids, vectors.tolist(), documents, metadatas)
+        lexical_index.add_documents(ids, documents, metadatas, save=False)
+        metadata_index.add_documents(ids, documents, metadatas, save=False)
+
+
+def percentile(values: List[float], q: float) -> float:
+    return round(float(np.percentile(values, q)), 2)
+
+
+async def time_retrieval(rag: RAGPipeline, queries: List[str], vectors: List[List[float]], mode: str, tag: str, args) -> Dict:
+    """Latency of filtered retrieval, and of the same search post-filtered instead"""
+    filters = {"tags": [tag]}
+    # A filter matching every chunk resolves to None and costs nothing
+    matching = rag.metadata_index.resolve(filters)
+    allowed = None if matching is None else set(matching)
+    latencies, postfilter_latencies, postfilter_filled = [], [], []
+    
+    for query, vector in zip(queries, vectors):
+        start = time.perf_counter()
+        await rag.retrieve(
+            query, top_k=args.top_k, mode=mode, diversity=0, merge_chunks=False,
+            query_embedding=vector, filters=filters
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+        
+        start = time.perf_counter()
+        sources = await rag.retrieve(
+            query, top_k=args.top_k * DEFAULT_OVERFETCH, mode=mode, diversity=0, merge_chunks=False,
+            query_embedding=vector, overfetch=1
+        )
+        kept = [source for source in sources if allowed is None or source["chunk_ids"][0] in allowed][:args.top_k]
+        postfilter_latencies.append((time.perf_counter() - start) * 1000)
+        postfilter_filled.append(len(kept) / args.top_k)
+    
+    return {
+        "mode": mode,
+        "selectivity": SELECTIVITY_TAGS[tag],
+        "matching_chunks": len(rag.metadata_index) if allowed is None else len(allowed),
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "postfilter_p50_ms": percentile(postfilter_latencies, 50),
+        "postfilter_filled": round(float(np.mean(postfilter_filled)), 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--backend", choices=("chroma",) + SUPPORTED_DTYPES, default="float16")
+    parser.add_argument("--modes", nargs="+", default=["vector", "lexical", "hybrid"])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+    
+    work_dir = tempfile.mkdtemp(prefix="mnemora-filters-")
+    try:
+        if args.backend == "chroma":
+            store = VectorStore(persist_directory=os.path.join(work_dir, "chromadb"))
+        else:
+            store = QuantizedVectorStore(persist_directory=os.path.join(work_dir, "quantized"), dtype=args.backend)
+        lexical_index = LexicalIndex(persist_path=os.path.join(work_dir, "lexical_index.json"))
+        metadata_index = MetadataIndex(persist_path=os.path.join(work_dir, "metadata_index.json"))
+        
+        build_start = time.perf_counter()
+        fill(store, lexical_index, metadata_index, args.chunks, args.dim)
+        print(json.dumps({"chunks": args.chunks, "backend": args.backend, "fill_seconds": round(time.perf_counter() - build_start, 1)}))
+        
+        # Ollama is never called: every query brings its embedding
+        rag = RAGPipeline(store, None, lexical_index=lexical_index, metadata_index=metadata_index)
+        words = random.Random(1)
+        queries = [" ".join(words.choices(FILLER_WORDS, k=4)) for _ in range(args.queries)]
+        vectors = np.random.default_rng(1).normal(size=(args.queries, args.dim)).astype(np.float32).tolist()
+        
+        results = []
+        for mode in args.modes:
+            for tag in SELECTIVITY_TAGS:
+                result = asyncio.run(time_retrieval(rag, queries, vectors, mode, tag, args))
+                results.append(result)
+                print(json.dumps(result))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
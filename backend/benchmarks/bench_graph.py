@@ -0,0 +1,131 @@
+"""
+Link graph benchmark - build, reload and query times for a vault of linked, tagged notes
+
+Generates --notes notes spread over folders, each linking to --links random
+notes by name and carrying a few of --tags tags, and feeds their chunk
+metadata to LinkGraph the way the indexer does. Reports build, save and load
+times and per-call latency of the graph endpoints and of the lookup that
+link-expanded retrieval makes for its top hits:
+
+    cd backend && python -m benchmarks.bench_graph --notes 50000
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from services.link_graph import LINK_SEPARATOR, LinkGraph
+
+INSERT_BATCH = 2000
+CHUNKS_PER_NOTE = 3
+
+
+def vault_metadata(notes: int, links: int, tags: int, seed: int = 0) -> List[Dict]:
+    """Chunk metadata for a synthetic vault, first chunk of each note carrying its links"""
+    rng = random.Random(seed)
+    metadatas = []
+    for i in range(notes):
+        folder = f"/vault/area-{i % 20}"
+        note_tags = ",".join(sorted({f"topic-{rng.randrange(tags)}" for _ in range(3)}))
+        targets = LINK_SEPARATOR.join(f"Note {rng.randrange(notes)}" for _ in range(links))
+        for chunk_index in range(CHUNKS_PER_NOTE):
+            metadata = {
+                "file_path": f"{folder}/Note {i}.md",
+                "folder_path": folder,
+                "file_type": "md",
+                "chunk_index": chunk_index,
+                "tags": note_tags,
+            }
+            if chunk_index == 0:
+                metadata["links"] = targets
+            metadatas.append(metadata)
+    return metadatas
+
+
+def time_calls(call: Callable, arguments: List) -> Dict:
+    latencies = []
+    for argument in arguments:
+        start = time.perf_counter()
+        call(argument)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--notes", type=int, default=50000)
+    parser.add_argument("--links", type=int, default=5, help="Outgoing links per note")
+    parser.add_argument("--tags", type=int, default=500, help="Distinct tags in the vault")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+    
+    metadatas = vault_metadata(args.notes, args.links, args.tags)
+    ids = [f"chunk-{i}" for i in range(len(metadatas))]
+    documents = [""] * len(metadatas)
+    
+    work_dir = tempfile.mkdtemp(prefix="mnemora-graph-")
+    try:
+        path = os.path.join(work_dir, "link_graph.json")
+        graph = LinkGraph(persist_path=path)
+        
+        start = time.perf_counter()
+        for offset in range(0, len(ids), INSERT_BATCH):
+            end = offset + INSERT_BATCH
+            graph.add_documents(ids[offset:end], documents[offset:end], metadatas[offset:end], save=False)
+        build_seconds = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        graph.save()
+        save_seconds = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        graph = LinkGraph(persist_path=path)
+        load_seconds = time.perf_counter() - start
+        
+        results = {
+            "notes": args.notes,
+            "chunks": len(graph),
+            "build_seconds": round(build_seconds, 2),
+            "save_seconds": round(save_seconds, 2),
+            "load_seconds": round(load_seconds, 2),
+            "file_mb": round(os.path.getsize(path) / 1024 / 1024, 1),
+        }
+        print(json.dumps(results))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    
+    rng = random.Random(1)
+    files = [metadatas[rng.randrange(len(metadatas))]["file_path"] for _ in range(args.calls)]
+    # Retrieval expands from the files of its top hits, usually a handful
+    hits = [[metadatas[rng.randrange(len(metadatas))]["file_path"] for _ in range(5)] for _ in range(args.calls)]
+    tags = [f"topic-{rng.randrange(args.tags)}" for _ in range(args.calls)]
+    
+    timings = {
+        "note": time_calls(graph.note, files),
+        "neighbors_depth_1": time_calls(lambda file_path: graph.neighbors(file_path, depth=1), files),
+        "neighbors_depth_2": time_calls(lambda file_path: graph.neighbors(file_path, depth=2), files),
+        "linked_notes_top_5": time_calls(lambda paths: graph.chunks_of(graph.linked_notes(paths)), hits),
+        "files_with_tag": time_calls(graph.files_with_tag, tags),
+        "tags": time_calls(lambda _: graph.tags(), range(20)),
+    }
+    for name, timing in timings.items():
+        print(json.dumps({"call": name, **timing}))
+    results["calls"] = timings
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Hydration benchmark - loading candidate payloads with the search against after ranking
+
+Fills a store with --chunks random chunks, then for each top_k fetches
+top_k * overfetch candidates the way retrieval does. "eager" loads every
+candidate's text and metadata with the search; "deferred" searches for ids
+and scores only and loads the top_k survivors in one bulk fetch.
+Reports latency and the bytes a query moves, as serialized by the vector
+service, for both:
+
+    cd backend && python -m benchmarks.bench_hydration --chunks 50000 --backend chroma
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from benchmarks.bench_snapshot import fill
+from services.quantized_store import SUPPORTED_DTYPES, QuantizedVectorStore
+from services.rag import DEFAULT_OVERFETCH
+from services.streaming import dumps
+from services.vector_store import VectorStore
+
+
+def percentile(values: List[float], q: float) -> float:
+    return round(float(np.percentile(values, q)), 2)
+
+
+def measure(store, vectors: List[List[float]], top_k: int, overfetch: int, with_embeddings: bool) -> Dict:
+    candidates = top_k * overfetch
+    eager_ms, eager_bytes, deferred_ms, deferred_bytes = [], [], [], []
+    
+    for vector in vectors:
+        start = time.perf_counter()
+        results = store.query(vector, top_k=candidates, include_embeddings=with_embeddings)
+        eager_ms.append((time.perf_counter() - start) * 1000)
+        eager_bytes.append(len(dumps(results)))
+        
+        start = time.perf_counter()
+        results = store.query(vector, top_k=candidates, include_embeddings=with_embeddings, include_payload=False)
+        # Ranking keeps the best top_k here; the pipeline would fuse, dedupe and diversify first
+        documents = store.get_documents([result["id"] for result in results[:top_k]])
+        deferred_ms.append((time.perf_counter() - start) * 1000)
+        deferred_bytes.append(len(dumps(results)) + len(dumps(documents)))
+    
+    return {
+        "top_k": top_k,
+        "candidates": candidates,
+        "embeddings": with_embeddings,
+        "eager_p50_ms": percentile(eager_ms, 50),
+        "deferred_p50_ms": percentile(deferred_ms, 50),
+        "eager_kb": round(float(np.mean(eager_bytes)) / 1024, 1),
+        "deferred_kb": round(float(np.mean(deferred_bytes)) / 1024, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--backend", choices=("chroma",) + SUPPORTED_DTYPES, default="float16")
+    parser.add_argument("--top-k", type=int, nargs="+", default=[5, 20, 50])
+    parser.add_argument("--overfetch", type=int, default=DEFAULT_OVERFETCH)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+    
+    work_dir = tempfile.mkdtemp(prefix="mnemora-hydration-")
+    try:
+        if args.backend == "chroma":
+            store = VectorStore(persist_directory=os.path.join(work_dir, "chromadb"))
+        else:
+            store = QuantizedVectorStore(persist_directory=os.path.join(work_dir, "quantized"), dtype=args.backend)
+        
+        build_start = time.perf_counter()
+        fill(store, args.chunks, args.dim)
+        print(json.dumps({"chunks": args.chunks, "backend": args.backend, "fill_seconds": round(time.perf_counter() - build_start, 1)}))
+        
+        vectors = np.random.default_rng(1).normal(size=(args.queries, args.dim)).astype(np.float32).tolist()
+        results = []
+        for top_k in args.top_k:
+            # MMR needs every candidate's embedding, so both variants carry them when it is on
+            for with_embeddings in (False, True):
+                result = measure(store, vectors, top_k, args.overfetch, with_embeddings)
+                results.append(result)
+                print(json.dumps(result))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
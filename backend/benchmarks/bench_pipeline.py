@@ -0,0 +1,222 @@
+"""
+End-to-end pipeline benchmark - indexing, retrieval quality, latency and TTFT
+
+Generates a synthetic Markdown/code/PDF corpus with planted facts, indexes it
+through DocumentIndexer with a deterministic in-process Ollama stand-in, then
+asks the question for each planted fact. A source counts as a hit when it
+comes from the fact's file and contains the fact sentence.
+
+Reports per corpus size: index throughput, peak RSS, recall@k and MRR per
+search mode, retrieval p50/p99 and time to first token through
+retrieve + pack + generate. Each size runs in its own process so RSS is not
+shared. Results are JSON so runs can be diffed across commits:
+
+    cd backend && python -m benchmarks.bench_pipeline --sizes 1000 10000 --output before.json
+    cd backend && python -m benchmarks.bench_pipeline --sizes 1000 10000 --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.bench_vector_store import BACKENDS, open_store, peak_rss_mb
+from benchmarks.fake_ollama import FakeOllamaClient
+from benchmarks.synthetic_corpus import generate_corpus
+
+MODES = ("hybrid", "vector", "lexical")
+
+# Metrics where a lower value is better, for --compare
+LOWER_IS_BETTER = ("_ms", "_mb", "seconds")
+
+
+def score_sources(sources: List[Dict], fact: Dict) -> Optional[int]:
+    """1-based rank of the first source holding the fact, or None"""
+    for rank, source in enumerate(sources, 1):
+        if source["file_path"] == fact["file_path"] and fact["sentence"] in " ".join(source["content"].split()):
+            return rank
+    return None
+
+
+async def measure(args: argparse.Namespace, size: int, corpus_dir: str, work_dir: str) -> Dict:
+    from services.indexer import DocumentIndexer
+    from services.lexical_index import LexicalIndex
+    from services.rag import RAGPipeline
+    
+    start = time.perf_counter()
+    manifest = generate_corpus(corpus_dir, size, seed=args.seed)
+    generate_seconds = time.perf_counter() - start
+    
+    ollama = FakeOllamaClient(
+        embed_latency_ms=args.embed_latency_ms,
+        chat_ttft_ms=args.chat_ttft_ms,
+        tokens_per_sec=args.tokens_per_sec
+    )
+    vector_store = open_store(args.backend, os.path.join(work_dir, "store"))
+    lexical_index = LexicalIndex(persist_path=os.path.join(work_dir, "lexical_index.json"))
+    indexer = DocumentIndexer(vector_store, ollama, lexical_index=lexical_index)
+    
+    baseline_rss = peak_rss_mb()
+    start = time.perf_counter()
+    stats = await indexer.index_folder(corpus_dir)
+    index_seconds = time.perf_counter() - start
+    index_rss = peak_rss_mb()
+    
+    result = {
+        "size": size,
+        "backend": args.backend,
+        "files": manifest["files"],
+        "chunks": stats["chunk_count"],
+        "generate_seconds": round(generate_seconds, 2),
+        "index_seconds": round(index_seconds, 2),
+        "index_chunks_per_sec": round(stats["chunk_count"] / max(index_seconds, 1e-9), 1),
+        "index_peak_rss_mb": round(index_rss, 1),
+        "index_rss_growth_mb": round(index_rss - baseline_rss, 1),
+    }
+    
+    facts = random.Random(args.seed).sample(manifest["facts"], min(args.queries, len(manifest["facts"])))
+    rag = RAGPipeline(vector_store, ollama, model="llama3.2:3b", lexical_index=lexical_index)
+    
+    for mode in MODES:
+        latencies = []
+        ranks = []
+        for fact in facts:
+            start = time.perf_counter()
+            sources = await rag.retrieve(fact["question"], top_k=args.top_k, mode=mode)
+            latencies.append((time.perf_counter() - start) * 1000)
+            ranks.append(score_sources(sources, fact))
+        
+        result[mode] = {
+            f"recall@{args.top_k}": round(sum(rank is not None for rank in ranks) / len(ranks), 4),
+            "mrr": round(sum(1 / rank for rank in ranks if rank) / len(ranks), 4),
+            "retrieval_p50_ms": round(float(np.percentile(latencies, 50)), 2),
+            "retrieval_p99_ms": round(float(np.percentile(latencies, 99)), 2),
+        }
+    
+    # Time to first token as the /query handler sees it
+    ttfts = []
+    for fact in facts[:args.ttft_queries]:
+        start = time.perf_counter()
+        sources = await rag.retrieve(fact["question"], top_k=args.top_k)
+        sources, _ = rag.pack_context(sources)
+        async for _ in rag.generate(fact["question"], sources):
+            ttfts.append((time.perf_counter() - start) * 1000)
+            break
+    
+    result["ttft_p50_ms"] = round(float(np.percentile(ttfts, 50)), 2)
+    result["ttft_p99_ms"] = round(float(np.percentile(ttfts, 99)), 2)
+    result["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    return result
+
+
+def run_size(args: argparse.Namespace, size: int, result_queue) -> None:
+    import logging
+    logging.basicConfig(level=logging.WARNING)
+    
+    corpus_root = args.corpus_dir or tempfile.mkdtemp(prefix="mnemora-corpus-")
+    corpus_dir = os.path.join(corpus_root, f"corpus-{size}-{args.seed}")
+    work_dir = tempfile.mkdtemp(prefix=f"mnemora-bench-{size}-")
+    try:
+        result_queue.put(asyncio.run(measure(args, size, corpus_dir, work_dir)))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if not args.corpus_dir:
+            shutil.rmtree(corpus_root, ignore_errors=True)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def flatten(result: Dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in result.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(baseline_path: str, results: List[Dict]) -> None:
+    """Print the relative change of every metric against an earlier run"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["size"], r["backend"]): flatten(r) for r in json.load(f)["results"]}
+    
+    for result in results:
+        before = baseline.get((result["size"], result["backend"]))
+        if before is None:
+            continue
+        print(f"\nsize={result['size']} backend={result['backend']} vs {baseline_path}")
+        for metric, value in flatten(result).items():
+            old = before.get(metric)
+            if old in (None, 0) or metric == "size":
+                continue
+            change = (value - old) / abs(old) * 100
+            worse = change > 0 if metric.endswith(LOWER_IS_BETTER) else change < 0
+            flag = "  <-- regression" if worse and abs(change) >= 5 else ""
+            print(f"  {metric:32s} {old:>12} -> {value:<12} {change:+7.1f}%{flag}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="Target chunk counts")
+    parser.add_argument("--backend", default="chroma", choices=BACKENDS)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--ttft-queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="Simulated latency per embedding call")
+    parser.add_argument("--chat-ttft-ms", type=float, default=0.0, help="Simulated model time to first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=0.0)
+    parser.add_argument("--corpus-dir", help="Keep generated corpora here and reuse them across runs")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    parser.add_argument("--compare", help="Earlier --output file to diff against")
+    args = parser.parse_args()
+    
+    context = multiprocessing.get_context("spawn")
+    results: List[Dict] = []
+    for size in args.sizes:
+        queue = context.Queue()
+        process = context.Process(target=run_size, args=(args, size, queue))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            print(f"size {size}: failed with exit code {process.exitcode}", file=sys.stderr)
+            continue
+        result = queue.get()
+        results.append(result)
+        print(json.dumps(result))
+    
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "args": vars(args),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
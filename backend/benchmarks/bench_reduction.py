@@ -0,0 +1,143 @@
+"""
+Embedding reduction benchmark - index size, query latency and recall vs full dimension
+
+Builds one index per reduction setting and scores recall@k against exact
+float32 search over the full-width vectors. Synthetic vectors have a decaying
+per-dimension spectrum like Matryoshka-trained models; pass --embeddings with
+an (N, D) .npy dump of real nomic-embed-text vectors for a faithful run.
+
+    cd backend && python -m benchmarks.bench_reduction --chunks 50000 --dims 128 256 384
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from benchmarks.bench_vector_store import BACKENDS, INSERT_BATCH, exact_top_k, open_store
+from services.embedding_reduction import EmbeddingReducer
+
+
+def make_spectral_corpus(n_chunks: int, dim: int, n_queries: int, seed: int = 0):
+    """Clustered vectors whose variance decays with the dimension index"""
+    rng = np.random.default_rng(seed)
+    spectrum = (np.arange(1, dim + 1, dtype=np.float32)) ** -0.5
+    
+    n_clusters = max(1, n_chunks // 200)
+    centers = rng.normal(size=(n_clusters, dim)).astype(np.float32) * spectrum
+    assignments = rng.integers(0, n_clusters, size=n_chunks)
+    noise = rng.normal(size=(n_chunks, dim)).astype(np.float32) * spectrum
+    vectors = centers[assignments] + 0.5 * noise
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    
+    picks = rng.integers(0, n_chunks, size=n_queries)
+    queries = vectors[picks] + 0.2 * rng.normal(size=(n_queries, dim)).astype(np.float32) * spectrum
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return vectors, queries
+
+
+def run_setting(
+    backend: str,
+    mode: str,
+    dim: int,
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    truth: List[set],
+    top_k: int
+) -> Dict:
+    directory = tempfile.mkdtemp(prefix=f"mnemora-bench-{mode}-")
+    try:
+        reducer = EmbeddingReducer(mode=mode, dim=dim if mode != "none" else None)
+        store = open_store(backend, directory, reducer=reducer)
+        
+        start = time.perf_counter()
+        # PCA is fitted once the store holds enough rows, re-projecting what came before
+        for offset in range(0, len(vectors), INSERT_BATCH):
+            batch = vectors[offset:offset + INSERT_BATCH]
+            store.add_documents(
+                [f"chunk-{i}" for i in range(offset, offset + len(batch))],
+                batch.tolist(),
+                [""] * len(batch),
+                [{"folder_path": "/bench"}] * len(batch)
+            )
+        insert_seconds = time.perf_counter() - start
+        
+        latencies = []
+        hits = 0
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            results = store.query(query.tolist(), top_k=top_k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += len(expected & {r["id"] for r in results})
+        
+        disk_bytes = sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, names in os.walk(directory) for name in names
+        )
+        
+        return {
+            "backend": backend,
+            "reduction": mode,
+            "dim": dim if mode != "none" else vectors.shape[1],
+            "insert_per_sec": round(len(vectors) / insert_seconds, 1),
+            "query_p50_ms": round(float(np.percentile(latencies, 50)), 3),
+            "query_p99_ms": round(float(np.percentile(latencies, 99)), 3),
+            f"recall@{top_k}": round(hits / (len(queries) * top_k), 4),
+            "disk_mb": round(disk_bytes / (1024 * 1024), 2),
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=50_000)
+    parser.add_argument("--full-dim", type=int, default=768)
+    parser.add_argument("--dims", type=int, nargs="+", default=[128, 256, 384])
+    parser.add_argument("--modes", nargs="+", default=["matryoshka", "pca"], choices=["matryoshka", "pca"])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--backend", default="chroma", choices=BACKENDS)
+    parser.add_argument("--embeddings", help="Path to an (N, D) .npy file of real embeddings")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+    
+    if args.embeddings:
+        vectors = np.load(args.embeddings).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        # Hold out real vectors as queries so they stay in-distribution
+        rng = np.random.default_rng(args.seed)
+        picks = rng.choice(len(vectors), size=min(args.queries, len(vectors) // 10), replace=False)
+        queries = vectors[picks]
+        vectors = np.delete(vectors, picks, axis=0)
+    else:
+        vectors, queries = make_spectral_corpus(args.chunks, args.full_dim, args.queries, seed=args.seed)
+    
+    truth = exact_top_k(vectors, queries, args.top_k)
+    
+    settings = [("none", vectors.shape[1])]
+    settings += [(mode, dim) for mode in args.modes for dim in args.dims if dim < vectors.shape[1]]
+    
+    results = []
+    baseline = None
+    for mode, dim in settings:
+        result = run_setting(args.backend, mode, dim, vectors, queries, truth, args.top_k)
+        if baseline is None:
+            baseline = result
+        result["size_ratio"] = round(baseline["disk_mb"] / max(result["disk_mb"], 1e-9), 2)
+        result["speedup_p50"] = round(baseline["query_p50_ms"] / max(result["query_p50_ms"], 1e-9), 2)
+        results.append(result)
+        print(json.dumps(result))
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Chat session benchmark - time to first token on multi-turn conversations
+
+Runs the same scripted conversations three ways against a running Ollama:
+"stateless" sends system prompt + this turn's context + question (the
+sessionless /query layout), "rebuilt" also replays the history but rebuilds
+the context message every turn, and "session" uses ChatSession's append-only
+layout so each turn only prefills what is new. Follow-up turns retrieve
+partly overlapping sources, as real follow-up questions do.
+
+    cd backend && python -m benchmarks.bench_sessions --model llama3.2:1b --conversations 5 --turns 6
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from services.chat_sessions import SESSION_NUM_CTX, ChatSession
+from services.context_packer import build_context
+from services.ollama_client import OLLAMA_BASE_URL, OllamaClient
+from services.rag import SYSTEM_PROMPT
+
+MODES = ("stateless", "rebuilt", "session")
+
+WORDS = (
+    "index query vector chunk folder embedding latency cache model prompt token "
+    "session server client retry backoff deploy config parser markdown runbook "
+    "incident alert metric disk memory thread socket request response schema"
+).split()
+
+
+def make_sources(rng: random.Random, count: int, words_per_chunk: int = 150) -> List[Dict]:
+    """Synthetic retrieved chunks with unique text so runs don't share cache entries"""
+    sources = []
+    for i in range(count):
+        text = " ".join(rng.choice(WORDS) for _ in range(words_per_chunk))
+        sources.append({
+            "file_path": f"/bench/doc{i}.md",
+            "file_name": f"doc{i}.md",
+            "content": f"{rng.random():.6f} {text}",
+            "score": 1.0,
+            "chunk_index": 0,
+        })
+    return sources
+
+
+def script_conversation(seed: str, turns: int, top_k: int, carry_over: int) -> List[Dict]:
+    """Questions with the sources retrieved for each; consecutive turns share carry_over sources"""
+    rng = random.Random(seed)
+    pool = make_sources(rng, turns * top_k)
+    script = []
+    fresh = 0
+    current: List[Dict] = []
+    for turn in range(turns):
+        kept = current[:carry_over] if turn else []
+        new = pool[fresh:fresh + top_k - len(kept)]
+        fresh += len(new)
+        current = kept + new
+        script.append({"question": f"Question {turn} ({seed}): how does {rng.choice(WORDS)} work?", "sources": current})
+    return script
+
+
+async def time_turn(ollama: OllamaClient, model: str, messages: List[Dict], options: Dict) -> Dict:
+    start = time.perf_counter()
+    ttft = None
+    answer = ""
+    async for token in ollama.chat_stream(prompt="", model=model, messages=messages, options=options):
+        if ttft is None:
+            ttft = time.perf_counter() - start
+        answer += token
+    return {"ttft_ms": (ttft or 0) * 1000, "total_ms": (time.perf_counter() - start) * 1000, "answer": answer}
+
+
+async def run_conversation(ollama: OllamaClient, model: str, mode: str, script: List[Dict]) -> List[float]:
+    options = {"num_ctx": SESSION_NUM_CTX}
+    session = ChatSession("bench", model, SYSTEM_PROMPT)
+    history: List[Dict] = []
+    ttfts = []
+    
+    for turn in script:
+        if mode == "session":
+            session.add_context(turn["sources"])
+            session.add_user_message(turn["question"])
+            messages = session.messages
+        else:
+            context = {"role": "system", "content": f"Use the following context to answer the user's question:\n\n{build_context(turn['sources'])}"}
+            replay = history if mode == "rebuilt" else []
+            messages = [{"role": "system", "content": SYSTEM_PROMPT}, context, *replay, {"role": "user", "content": turn["question"]}]
+        
+        result = await time_turn(ollama, model, messages, options)
+        ttfts.append(result["ttft_ms"])
+        
+        if mode == "session":
+            session.add_assistant_message(result["answer"])
+        history += [{"role": "user", "content": turn["question"]}, {"role": "assistant", "content": result["answer"]}]
+    
+    return ttfts
+
+
+async def run(args) -> List[Dict]:
+    ollama = OllamaClient(base_url=args.base_url)
+    if not await ollama.check_health():
+        raise SystemExit(f"Ollama is not reachable at {args.base_url}")
+    
+    # Load the model once so the first measured turn isn't a cold start
+    await time_turn(ollama, args.model, [{"role": "user", "content": "hi"}], {"num_ctx": SESSION_NUM_CTX})
+    
+    results = []
+    for mode in MODES:
+        per_turn: List[List[float]] = [[] for _ in range(args.turns)]
+        for conversation in range(args.conversations):
+            # Distinct seeds per mode keep one mode from warming the cache for the next
+            script = script_conversation(f"{args.seed}-{mode}-{conversation}", args.turns, args.top_k, args.carry_over)
+            for turn, ttft in enumerate(await run_conversation(ollama, args.model, mode, script)):
+                per_turn[turn].append(ttft)
+        
+        follow_ups = [ttft for turn in per_turn[1:] for ttft in turn]
+        result = {
+            "mode": mode,
+            "model": args.model,
+            "first_turn_ttft_ms": round(float(np.median(per_turn[0])), 1),
+            "follow_up_ttft_p50_ms": round(float(np.percentile(follow_ups, 50)), 1) if follow_ups else None,
+            "follow_up_ttft_p90_ms": round(float(np.percentile(follow_ups, 90)), 1) if follow_ups else None,
+            "ttft_by_turn_ms": [round(float(np.median(turn)), 1) for turn in per_turn],
+        }
+        results.append(result)
+        print(json.dumps(result))
+    
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--model", default="llama3.2:1b")
+    parser.add_argument("--base-url", default=OLLAMA_BASE_URL)
+    parser.add_argument("--conversations", type=int, default=5)
+    parser.add_argument("--turns", type=int, default=6)
+    parser.add_argument("--top-k", type=int, default=4)
+    parser.add_argument("--carry-over", type=int, default=2, help="Sources shared by consecutive turns")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+    
+    results = asyncio.run(run(args))
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
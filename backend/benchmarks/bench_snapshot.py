@@ -0,0 +1,161 @@
+"""
+Snapshot benchmark - export and restore an index without re-embedding
+
+Fills a store with --chunks random chunks, exports it to a snapshot, restores
+the snapshot into an empty data directory and checks that searches return the
+same documents. Reports file size and throughput for both directions (and
+peak Python memory with --trace-memory), then flips one byte of the snapshot and
+checks that the restore is refused before anything is written:
+
+    cd backend && python -m benchmarks.bench_snapshot --chunks 50000 --backend chroma
+    cd backend && python -m benchmarks.bench_snapshot --backend int8 --reduction pca --reduced-dim 128
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from typing import Dict
+
+import numpy as np
+
+from benchmarks.synthetic_corpus import FILLER_WORDS
+from services.embedding_reduction import REDUCTION_MODES, EmbeddingReducer
+from services.indexer import DocumentIndexer
+from services.lexical_index import LexicalIndex
+from services.quantized_store import SUPPORTED_DTYPES, QuantizedVectorStore
+from services.snapshot import SnapshotError, export_snapshot, import_snapshot
+from services.vector_store import VectorStore
+
+INSERT_BATCH = 2000
+FOLDERS = 4
+
+
+def open_store(data_dir: str, args):
+    reducer = EmbeddingReducer(mode=args.reduction, dim=args.reduced_dim if args.reduction != "none" else None)
+    if args.backend == "chroma":
+        return VectorStore(persist_directory=os.path.join(data_dir, "chromadb"), reducer=reducer)
+    return QuantizedVectorStore(
+        persist_directory=os.path.join(data_dir, f"quantized-{args.backend}"), dtype=args.backend, reducer=reducer
+    )
+
+
+def fill(store, chunks: int, dim: int, seed: int = 0) -> None:
+    rng = np.random.default_rng(seed)
+    words = random.Random(seed)
+    for start in range(0, chunks, INSERT_BATCH):
+        count = min(INSERT_BATCH, chunks - start)
+        vectors = rng.normal(size=(count, dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        ids = [f"chunk-{start + i}" for i in range(count)]
+        documents = [" ".join(words.choices(FILLER_WORDS, k=120)) for _ in range(count)]
+        metadatas = [
+            {
+                "file_path": f"/bench/folder-{(start + i) % FOLDERS}/file-{(start + i) // 10}.md",
+                "folder_path": f"/bench/folder-{(start + i) % FOLDERS}",
+                "chunk_index": (start + i) % 10,
+            }
+            for i in range(count)
+        ]
+        store.add_documents(ids, vectors.tolist(), documents, metadatas)
+
+
+def drain(events, trace_memory: bool = False) -> Dict:
+    """Run a snapshot generator to the end, timing it and optionally tracking peak Python memory"""
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    last = {}
+    for last in events:
+        pass
+    result = {**last, "seconds": round(time.perf_counter() - start, 2)}
+    if trace_memory:
+        result["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+        tracemalloc.stop()
+    return result
+
+
+def top_k_overlap(source, restored, dim: int, queries: int, top_k: int = 10) -> float:
+    """Mean fraction of top_k ids the two stores agree on"""
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(queries, dim)).astype(np.float32).tolist()
+    expected = source.query_batch(vectors, top_k=top_k)
+    actual = restored.query_batch(vectors, top_k=top_k)
+    overlap = sum(
+        len({doc["id"] for doc in a} & {doc["id"] for doc in b}) / top_k
+        for a, b in zip(expected, actual)
+    )
+    return round(overlap / queries, 3)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=768, help="Embedding size before reduction")
+    parser.add_argument("--backend", choices=("chroma",) + SUPPORTED_DTYPES, default="chroma")
+    parser.add_argument("--reduction", choices=REDUCTION_MODES, default="none")
+    parser.add_argument("--reduced-dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--trace-memory", action="store_true", help="Report peak Python memory; slows both directions down")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+    
+    work_dir = tempfile.mkdtemp(prefix="mnemora-snapshot-")
+    snapshot_path = os.path.join(work_dir, "index.mnemora")
+    try:
+        source = open_store(os.path.join(work_dir, "source"), args)
+        build_start = time.perf_counter()
+        fill(source, args.chunks, args.dim)
+        print(json.dumps({"chunks": args.chunks, "fill_seconds": round(time.perf_counter() - build_start, 1)}))
+        
+        exported = drain(export_snapshot(source, snapshot_path), args.trace_memory)
+        exported["mb"] = round(os.path.getsize(snapshot_path) / 2**20, 1)
+        exported["docs_per_sec"] = round(exported["documents"] / exported["seconds"])
+        print(json.dumps({"export": exported}))
+        
+        target_dir = os.path.join(work_dir, "target")
+        target = open_store(target_dir, args)
+        lexical_index = LexicalIndex(persist_path=os.path.join(target_dir, "lexical_index.json"))
+        # No Ollama client at all: a restore that tried to embed would fail
+        indexer = DocumentIndexer(target, None, lexical_index=lexical_index)
+        imported = drain(import_snapshot(indexer, snapshot_path), args.trace_memory)
+        imported["docs_per_sec"] = round(imported["documents"] / imported["seconds"])
+        imported["lexical_documents"] = len(lexical_index)
+        print(json.dumps({"import": imported}))
+        
+        check = {
+            "count_matches": target.get_document_count() == source.get_document_count(),
+            "folders_match": sorted(target.get_folders()) == sorted(source.get_folders()),
+            # Chroma's HNSW graph depends on insertion order, so its overlap stays below 1 even for identical vectors
+            "top10_overlap": top_k_overlap(source, target, args.dim, args.queries),
+        }
+        
+        # Corrupt one byte in the middle of the file; the restore must stop before touching the index
+        with open(snapshot_path, "r+b") as f:
+            f.seek(os.path.getsize(snapshot_path) // 2)
+            byte = f.read(1)
+            f.seek(-1, os.SEEK_CUR)
+            f.write(bytes([byte[0] ^ 0xFF]))
+        empty_dir = os.path.join(work_dir, "corrupt")
+        empty = open_store(empty_dir, args)
+        try:
+            drain(import_snapshot(DocumentIndexer(empty, None), snapshot_path))
+            check["corruption_detected"] = False
+        except SnapshotError as e:
+            check["corruption_detected"] = True
+            check["corruption_error"] = str(e)
+        check["corrupt_restore_wrote"] = empty.get_document_count()
+        print(json.dumps({"check": check}))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "export": exported, "import": imported, "check": check}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
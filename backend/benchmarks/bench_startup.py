@@ -0,0 +1,187 @@
+"""
+Startup benchmark - import time and time to first healthy response
+
+Fills a data directory with a persisted index of --chunks random chunks, then
+starts the backend on it several times and reports how long after launch
+/health first answered, when it first reported "healthy", and when the first
+lexical /search returned. Also times `import main` in a fresh interpreter and
+lists the slowest imports:
+
+    cd backend && python -m benchmarks.bench_startup --chunks 50000 --runs 3
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import httpx
+import numpy as np
+
+from benchmarks.load_test import BACKEND_DIR, free_port
+from benchmarks.synthetic_corpus import FILLER_WORDS
+
+INSERT_BATCH = 5000
+POLL_SECONDS = 0.005
+
+
+def populate(data_dir: str, chunks: int, dim: int, seed: int = 0) -> None:
+    """Write a Chroma collection and lexical index the way indexing a folder would"""
+    from services.lexical_index import LexicalIndex
+    from services.vector_store import VectorStore
+    
+    rng = np.random.default_rng(seed)
+    words = random.Random(seed)
+    store = VectorStore(persist_directory=os.path.join(data_dir, 'chromadb'))
+    lexical_index = LexicalIndex(persist_path=os.path.join(data_dir, 'lexical_index.json'))
+    
+    for start in range(0, chunks, INSERT_BATCH):
+        count = min(INSERT_BATCH, chunks - start)
+        vectors = rng.normal(size=(count, dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        ids = [f"chunk-{start + i}" for i in range(count)]
+        documents = [" ".join(words.choices(FILLER_WORDS, k=120)) for _ in range(count)]
+        metadatas = [
+            {"file_path": f"/bench/file-{(start + i) // 10}.md", "folder_path": "/bench", "chunk_index": (start + i) % 10}
+            for i in range(count)
+        ]
+        store.add_documents(ids, vectors.tolist(), documents, metadatas)
+        lexical_index.add_documents(ids, documents, metadatas)
+    lexical_index.save()
+
+
+def import_time() -> Dict:
+    """Wall time of `import main` in a new interpreter, and its slowest top-level imports"""
+    code = "import sys, time; start = time.perf_counter(); import main; print(time.perf_counter() - start, 'chromadb' in sys.modules)"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    )
+    seconds, chromadb_loaded = result.stdout.split()
+    
+    # Lines look like "import time:  self | cumulative | <indent>name"; two spaces of indent per level
+    slowest = []
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| ( *)(\S+)", line)
+        if match and len(match.group(2)) <= 4:
+            slowest.append((int(match.group(1)), match.group(3)))
+    slowest.sort(reverse=True)
+    
+    return {
+        "import_main_ms": round(float(seconds) * 1000, 1),
+        "chromadb_imported": chromadb_loaded == "True",
+        "slowest_imports_ms": {name: round(us / 1000, 1) for us, name in slowest[:8]},
+    }
+
+
+async def time_startup(data_dir: str, args) -> Dict:
+    """Launch a backend and time its first responses"""
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    env = {
+        **os.environ,
+        "MNEMORA_DATA_DIR": data_dir,
+        # Nothing listens here, so the Ollama check in /health fails fast
+        "OLLAMA_BASE_URL": f"http://127.0.0.1:{free_port()}",
+    }
+    
+    start = time.perf_counter()
+    backend = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    
+    def elapsed() -> float:
+        return round((time.perf_counter() - start) * 1000, 1)
+    
+    result: Dict[str, Optional[float]] = {"first_response_ms": None, "healthy_ms": None, "first_search_ms": None}
+    try:
+        async with httpx.AsyncClient(timeout=args.timeout) as client:
+            async def search() -> None:
+                # Sent as soon as the server listens, so it waits on whatever is still loading
+                while time.perf_counter() - start < args.timeout:
+                    try:
+                        response = await client.post(f"{url}/search", json={"query": "index query cache", "search_mode": "lexical"})
+                        if response.status_code == 200:
+                            result["first_search_ms"] = elapsed()
+                            return
+                    except httpx.TransportError:
+                        pass
+                    await asyncio.sleep(POLL_SECONDS)
+            
+            search_task = None
+            while time.perf_counter() - start < args.timeout:
+                try:
+                    response = await client.get(f"{url}/health")
+                except httpx.TransportError:
+                    await asyncio.sleep(POLL_SECONDS)
+                    continue
+                if result["first_response_ms"] is None and response.status_code == 200:
+                    result["first_response_ms"] = elapsed()
+                    result["first_status"] = response.json()["status"]
+                    search_task = asyncio.create_task(search())
+                if response.status_code == 200 and response.json()["status"] == "healthy":
+                    result["healthy_ms"] = elapsed()
+                    break
+                await asyncio.sleep(POLL_SECONDS)
+            
+            if search_task is not None:
+                await search_task
+    finally:
+        backend.terminate()
+        backend.wait(timeout=30)
+    return result
+
+
+def summarize(runs: List[Dict], key: str) -> Optional[float]:
+    values = [run[key] for run in runs if run.get(key) is not None]
+    return round(float(np.median(values)), 1) if values else None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=20000, help="Chunks in the persisted index")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--data-dir", help="Reuse this populated data directory instead of building one")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+    
+    results = {"imports": import_time()}
+    print(json.dumps(results["imports"]))
+    
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="mnemora-startup-data-")
+    try:
+        if not args.data_dir:
+            build_start = time.perf_counter()
+            populate(data_dir, args.chunks, args.dim)
+            print(json.dumps({"chunks": args.chunks, "populate_seconds": round(time.perf_counter() - build_start, 1)}))
+        
+        runs = []
+        for _ in range(args.runs):
+            run = asyncio.run(time_startup(data_dir, args))
+            runs.append(run)
+            print(json.dumps(run))
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    
+    results["runs"] = runs
+    results["median"] = {key: summarize(runs, key) for key in ("first_response_ms", "healthy_ms", "first_search_ms")}
+    print(json.dumps(results["median"]))
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
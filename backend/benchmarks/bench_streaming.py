@@ -0,0 +1,195 @@
+"""
+Streaming benchmark - per-token CPU cost of turning Ollama lines into SSE frames
+
+Feeds synthetic Ollama chat lines at a fixed token rate into many concurrent
+streams and sends them through Starlette's StreamingResponse and the metrics
+and tracing middlewares, then writes each frame chunk-encoded to a pipe
+drained by another process, as uvicorn writes to a socket. Three modes:
+
+    baseline   json.loads per line and one json.dumps SSE frame per token (the old path)
+    fast       services.streaming's codec, still one frame per token
+    coalesced  the fast codec with tokens joined into one frame per window
+
+Reports process CPU per token, the part of it above the cost of just
+receiving the lines, frames and bytes per token, and how long tokens waited
+between arriving and being sent:
+
+    cd backend && python -m benchmarks.bench_streaming --streams 50 --tokens 400 --tokens-per-sec 80
+"""
+import argparse
+import asyncio
+import json
+import re
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+from starlette.responses import StreamingResponse
+
+from services.metrics import MetricsMiddleware
+from services.streaming import DEFAULT_COALESCE_MS, coalesce, loads, orjson, sse_event
+from services.tracing import Tracer, TracingMiddleware
+
+MODES = ("baseline", "fast", "coalesced")
+
+TOKEN_PATTERN = re.compile(r"w(\d+)-(\d+) ")
+
+
+def ollama_lines(stream: int, tokens: int) -> List[str]:
+    """NDJSON lines as /api/chat streams them, one token each"""
+    lines = []
+    for i in range(tokens):
+        lines.append(json.dumps({
+            "model": "llama3.2:3b",
+            "created_at": "2024-01-01T00:00:00.000000Z",
+            "message": {"role": "assistant", "content": f"w{stream}-{i} "},
+            "done": False,
+        }))
+    return lines
+
+
+async def produce(lines: List[str], rate: float, produced: Dict):
+    """Yield lines at the token rate, recording when each arrived"""
+    loop = asyncio.get_running_loop()
+    for line in lines:
+        await asyncio.sleep(1 / rate)
+        produced[line] = loop.time()
+        yield line
+
+
+async def parse(lines, decode):
+    """The chat_stream loop: decode each line and keep non-empty content"""
+    async for line in lines:
+        data = decode(line)
+        content = data["message"]["content"]
+        if content:
+            yield content
+
+
+async def source_cpu_per_token(args) -> float:
+    """CPU spent only receiving lines at the token rate, the floor every mode pays"""
+    async def drain(lines):
+        async for _ in produce(lines, args.tokens_per_sec, {}):
+            pass
+    
+    all_lines = [ollama_lines(stream, args.tokens) for stream in range(args.streams)]
+    start = time.process_time()
+    await asyncio.gather(*(drain(lines) for lines in all_lines))
+    return (time.process_time() - start) / (args.streams * args.tokens) * 1e6
+
+
+async def run_stream(mode: str, lines: List[str], args, produced: Dict, sent: List, pipe) -> None:
+    loop = asyncio.get_running_loop()
+    if mode == "baseline":
+        tokens = parse(produce(lines, args.tokens_per_sec, produced), json.loads)
+        encode = lambda event: f"data: {json.dumps(event)}\n\n"
+    else:
+        tokens = parse(produce(lines, args.tokens_per_sec, produced), loads)
+        encode = sse_event
+        if mode == "coalesced":
+            tokens = coalesce(tokens, args.window_ms)
+    
+    async def body():
+        async for token in tokens:
+            yield encode({"type": "token", "content": token})
+    
+    disconnected = asyncio.Event()
+    
+    async def receive():
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+    
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body"):
+            chunk = message["body"]
+            pipe.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            sent.append((loop.time(), chunk))
+    
+    scope = {"type": "http", "asgi": {"version": "3.0", "spec_version": "2.3"}, "method": "POST", "path": "/query", "headers": []}
+    app = TracingMiddleware(MetricsMiddleware(StreamingResponse(body(), media_type="text/event-stream")), tracer=Tracer())
+    await app(scope, receive, send)
+    disconnected.set()
+
+
+async def run_mode(mode: str, args, floor_us: float) -> Dict:
+    all_lines = [ollama_lines(stream, args.tokens) for stream in range(args.streams)]
+    produced: Dict[str, float] = {}
+    sent: List = []
+    
+    # Another process reads the frames, so only the writing side counts as CPU here
+    reader = await asyncio.create_subprocess_exec(
+        sys.executable, "-c", "import shutil, sys; shutil.copyfileobj(sys.stdin.buffer, open('/dev/null', 'wb'))",
+        stdin=subprocess.PIPE
+    )
+    pipe = reader.stdin
+    
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    try:
+        await asyncio.gather(*(run_stream(mode, lines, args, produced, sent, pipe) for lines in all_lines))
+        cpu = time.process_time() - cpu_start
+        wall = time.perf_counter() - wall_start
+    finally:
+        pipe.close()
+        await reader.wait()
+    
+    # Match every delivered token back to the line it arrived in
+    arrived = {}
+    for line, at in produced.items():
+        content = json.loads(line)["message"]["content"]
+        arrived[content] = at
+    delays = []
+    for at, body in sent:
+        for frame in body.decode().split("\n\n"):
+            if frame.startswith("data: "):
+                content = json.loads(frame[6:])["content"]
+                for stream, index in TOKEN_PATTERN.findall(content):
+                    delays.append((at - arrived[f"w{stream}-{index} "]) * 1000)
+    
+    total = args.streams * args.tokens
+    if len(delays) != total:
+        raise SystemExit(f"{mode}: delivered {len(delays)} of {total} tokens")
+    
+    return {
+        "mode": mode,
+        "codec": "json" if mode == "baseline" else ("orjson" if orjson is not None else "json"),
+        "streams": args.streams,
+        "tokens": total,
+        "cpu_us_per_token": round(cpu / total * 1e6, 2),
+        "overhead_us_per_token": round(cpu / total * 1e6 - floor_us, 2),
+        "frames_per_token": round(len(sent) / total, 3),
+        "bytes_per_token": round(sum(len(body) for _, body in sent) / total, 1),
+        "delay_p50_ms": round(float(np.percentile(delays, 50)), 2),
+        "delay_p99_ms": round(float(np.percentile(delays, 99)), 2),
+        "wall_seconds": round(wall, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--streams", type=int, default=50)
+    parser.add_argument("--tokens", type=int, default=400, help="Tokens per stream")
+    parser.add_argument("--tokens-per-sec", type=float, default=80, help="Token rate of each stream")
+    parser.add_argument("--window-ms", type=float, default=DEFAULT_COALESCE_MS)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+    
+    floor_us = asyncio.run(source_cpu_per_token(args))
+    print(json.dumps({"source_cpu_us_per_token": round(floor_us, 2)}))
+    
+    results = []
+    for mode in args.modes:
+        result = asyncio.run(run_mode(mode, args, floor_us))
+        results.append(result)
+        print(json.dumps(result))
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
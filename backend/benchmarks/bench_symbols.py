@@ -0,0 +1,155 @@
+"""
+Symbol index benchmark - parse, build, reload and lookup times for a synthetic codebase
+
+Generates --files Python modules of classes and functions named from the
+benchmark vocabulary, parses them with CodeParser, assigns their symbols to
+chunks the way the indexer does and feeds the chunk metadata to SymbolIndex.
+Reports parse throughput, build, save and load times, and lookup latency
+for exact, prefix and fuzzy matches and for the definitions retrieval asks for:
+
+    cd backend && python -m benchmarks.bench_symbols --files 5000
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from benchmarks.synthetic_corpus import FILLER_WORDS
+from parsers.code_parser import CodeParser
+from services.indexer import DocumentIndexer
+from services.symbol_index import SymbolIndex, format_symbols
+
+INSERT_BATCH = 2000
+
+
+def module_source(rng: random.Random, classes: int, functions: int, methods: int) -> str:
+    """A Python module with a few classes of methods and some top-level functions"""
+    def name(parts: int) -> str:
+        return "_".join(rng.choices(FILLER_WORDS, k=parts))
+    
+    lines = ["import os", ""]
+    for _ in range(classes):
+        lines += ["", f"class {name(2).title().replace('_', '')}:", '    """Generated class"""', ""]
+        for _ in range(methods):
+            lines += [f"    def {name(2)}(self, value):", f"        return value + {rng.randrange(100)}", ""]
+    for _ in range(functions):
+        lines += ["", f"def {name(3)}(items):", "    total = 0", "    for item in items:", "        total += item", "    return total", ""]
+    return "\n".join(lines)
+
+
+def time_calls(call: Callable, arguments: List) -> Dict:
+    latencies = []
+    for argument in arguments:
+        start = time.perf_counter()
+        call(argument)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=5000)
+    parser.add_argument("--classes", type=int, default=2, help="Classes per file")
+    parser.add_argument("--methods", type=int, default=8, help="Methods per class")
+    parser.add_argument("--functions", type=int, default=6, help="Top-level functions per file")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+    
+    rng = random.Random(0)
+    code_parser = CodeParser()
+    # Only the chunking and symbol assignment of the indexer are used
+    indexer = DocumentIndexer(None, None)
+    
+    work_dir = tempfile.mkdtemp(prefix="mnemora-symbols-")
+    try:
+        source_dir = os.path.join(work_dir, "src")
+        os.makedirs(source_dir)
+        paths = []
+        for i in range(args.files):
+            path = os.path.join(source_dir, f"module_{i}.py")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(module_source(rng, args.classes, args.functions, args.methods))
+            paths.append(path)
+        
+        ids, metadatas = [], []
+        parse_seconds = 0.0
+        source_bytes = 0
+        symbol_count = 0
+        for path in paths:
+            start = time.perf_counter()
+            content, symbols = code_parser.parse_code(path)
+            parse_seconds += time.perf_counter() - start
+            source_bytes += os.path.getsize(path)
+            symbol_count += len(symbols)
+            
+            chunks_text = indexer._chunk_text(content)
+            by_chunk = indexer._assign_symbols(content, chunks_text, symbols)
+            for i in range(len(chunks_text)):
+                ids.append(f"{path}:{i}")
+                metadata = {"file_path": path, "folder_path": source_dir, "file_type": "py", "chunk_index": i}
+                if i in by_chunk:
+                    metadata["symbols"] = format_symbols(by_chunk[i])
+                metadatas.append(metadata)
+        
+        path = os.path.join(work_dir, "symbol_index.json")
+        index = SymbolIndex(persist_path=path)
+        start = time.perf_counter()
+        for offset in range(0, len(ids), INSERT_BATCH):
+            end = offset + INSERT_BATCH
+            index.add_documents(ids[offset:end], [], metadatas[offset:end], save=False)
+        build_seconds = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        index.save()
+        save_seconds = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        index = SymbolIndex(persist_path=path)
+        load_seconds = time.perf_counter() - start
+        
+        results = {
+            "files": args.files,
+            "chunks": len(ids),
+            "symbols": symbol_count,
+            "parse_mb_per_second": round(source_bytes / 1024 / 1024 / parse_seconds, 1),
+            "build_seconds": round(build_seconds, 2),
+            "save_seconds": round(save_seconds, 2),
+            "load_seconds": round(load_seconds, 2),
+            "file_mb": round(os.path.getsize(path) / 1024 / 1024, 1),
+        }
+        print(json.dumps(results))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    
+    names = [entry[0] for entries in index._symbols.values() for entry in entries]
+    picks = [rng.choice(names) for _ in range(args.calls)]
+    # The first lookup after a change sorts the names once
+    index.lookup("a", match="prefix")
+    
+    timings = {
+        "exact": time_calls(lambda name: index.lookup(name, match="exact"), picks),
+        "prefix_4_chars": time_calls(lambda name: index.lookup(name[:4], match="prefix"), picks),
+        "fuzzy": time_calls(lambda name: index.lookup(name[::3], match="fuzzy"), picks),
+        "definitions": time_calls(lambda name: index.definitions([name]), picks),
+    }
+    for name, timing in timings.items():
+        print(json.dumps({"call": name, **timing}))
+    results["calls"] = timings
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
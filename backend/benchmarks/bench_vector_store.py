@@ -0,0 +1,162 @@
+"""
+Vector store benchmark - Chroma vs the quantized in-memory engine
+
+Measures insert throughput, reopen time, query latency, recall@k against
+exact float32 search, and peak RSS. Each backend runs in its own process so
+RSS numbers do not bleed into each other.
+
+    cd backend && python -m benchmarks.bench_vector_store --chunks 100000
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+BACKENDS = ("chroma", "float16", "int8")
+INSERT_BATCH = 5000
+
+
+def make_corpus(n_chunks: int, dim: int, n_queries: int, seed: int = 0):
+    """Clustered unit vectors that roughly mimic text embeddings"""
+    rng = np.random.default_rng(seed)
+    n_clusters = max(1, n_chunks // 200)
+    centers = rng.normal(size=(n_clusters, dim)).astype(np.float32)
+    assignments = rng.integers(0, n_clusters, size=n_chunks)
+    vectors = centers[assignments] + 0.6 * rng.normal(size=(n_chunks, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    
+    picks = rng.integers(0, n_chunks, size=n_queries)
+    queries = vectors[picks] + 0.3 * rng.normal(size=(n_queries, dim)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return vectors, queries
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> List[set]:
+    truth = []
+    for start in range(0, len(queries), 64):
+        scores = queries[start:start + 64] @ vectors.T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        truth.extend({f"chunk-{i}" for i in row} for row in top)
+    return truth
+
+
+def open_store(backend: str, directory: str, reducer=None):
+    if backend == "chroma":
+        from services.vector_store import VectorStore
+        return VectorStore(persist_directory=directory, reducer=reducer)
+    from services.quantized_store import QuantizedVectorStore
+    return QuantizedVectorStore(persist_directory=directory, dtype=backend, reducer=reducer)
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def run_backend(backend: str, args: argparse.Namespace, result_queue) -> None:
+    vectors, queries = make_corpus(args.chunks, args.dim, args.queries, seed=args.seed)
+    truth = exact_top_k(vectors, queries, args.top_k)
+    baseline_rss = peak_rss_mb()
+    
+    directory = tempfile.mkdtemp(prefix=f"mnemora-bench-{backend}-")
+    try:
+        store = open_store(backend, directory)
+        
+        start = time.perf_counter()
+        for offset in range(0, args.chunks, INSERT_BATCH):
+            batch = vectors[offset:offset + INSERT_BATCH]
+            ids = [f"chunk-{i}" for i in range(offset, offset + len(batch))]
+            store.add_documents(
+                ids,
+                batch.tolist(),
+                [f"document {i}" for i in range(offset, offset + len(batch))],
+                [{"folder_path": f"/bench/{i % 10}", "chunk_index": i} for i in range(offset, offset + len(batch))]
+            )
+        insert_seconds = time.perf_counter() - start
+        del store
+        
+        start = time.perf_counter()
+        store = open_store(backend, directory)
+        reopen_seconds = time.perf_counter() - start
+        
+        latencies = []
+        hits = 0
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            results = store.query(query.tolist(), top_k=args.top_k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += len(expected & {r["id"] for r in results})
+        
+        # Batched queries share one pass over the matrix where the backend supports it
+        batch_qps = None
+        if hasattr(store, "query_batch"):
+            start = time.perf_counter()
+            for offset in range(0, len(queries), args.batch_size):
+                store.query_batch(queries[offset:offset + args.batch_size].tolist(), top_k=args.top_k)
+            batch_qps = round(len(queries) / (time.perf_counter() - start), 1)
+        
+        disk_bytes = sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, names in os.walk(directory) for name in names
+        )
+        
+        result_queue.put({
+            "backend": backend,
+            "chunks": args.chunks,
+            "dim": args.dim,
+            "insert_per_sec": round(args.chunks / insert_seconds, 1),
+            "reopen_ms": round(reopen_seconds * 1000, 1),
+            "query_p50_ms": round(float(np.percentile(latencies, 50)), 3),
+            "query_p99_ms": round(float(np.percentile(latencies, 99)), 3),
+            "batch_qps": batch_qps,
+            f"recall@{args.top_k}": round(hits / (len(queries) * args.top_k), 4),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "rss_over_corpus_mb": round(peak_rss_mb() - baseline_rss, 1),
+            "disk_mb": round(disk_bytes / (1024 * 1024), 1),
+        })
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+    
+    context = multiprocessing.get_context("spawn")
+    results: List[Dict] = []
+    for backend in args.backends:
+        queue = context.Queue()
+        process = context.Process(target=run_backend, args=(backend, args, queue))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            print(f"{backend}: failed with exit code {process.exitcode}", file=sys.stderr)
+            continue
+        result = queue.get()
+        results.append(result)
+        print(json.dumps(result))
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Worker scaling benchmark - query throughput against the number of API workers
+
+Indexes a synthetic corpus, then drives /search or /query at a fixed
+concurrency against:
+
+    embedded   one worker with the stores opened in-process (the default setup)
+    N workers  uvicorn --workers N, all sharing one services.vector_service process
+
+Ollama is the fake server, tuned fast enough that the backend is the
+bottleneck. Throughput can only scale up to the number of CPU cores, which is
+reported alongside the results:
+
+    cd backend && python -m benchmarks.bench_workers --workers 1 2 4 --endpoint search
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.load_test import BACKEND_DIR, free_port, index_folder, summarize
+from benchmarks.synthetic_corpus import generate_corpus
+
+ENDPOINTS = ("search", "query")
+
+
+@contextmanager
+def spawned(command: List[str], env: Dict[str, str], log):
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        yield process
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+async def wait_until_healthy(url: str, timeout: float = 120.0) -> None:
+    """Wait until /health reports the stores loaded; with several workers any one may answer"""
+    deadline = time.monotonic() + timeout
+    healthy = 0
+    async with httpx.AsyncClient(timeout=10) as client:
+        while time.monotonic() < deadline:
+            try:
+                response = await client.get(f"{url}/health")
+                healthy = healthy + 1 if response.json()["status"] == "healthy" else 0
+                if healthy >= 10:
+                    return
+            except (httpx.HTTPError, ValueError):
+                healthy = 0
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} did not become healthy within {timeout:.0f}s")
+
+
+async def drive(url: str, questions: List[str], args) -> Dict:
+    """Send requests from --concurrency clients for --duration seconds"""
+    latencies: List[float] = []
+    errors = 0
+    
+    async def client_loop(client: httpx.AsyncClient, deadline: float) -> None:
+        nonlocal errors
+        rng = random.Random()
+        while time.monotonic() < deadline:
+            query = rng.choice(questions)
+            start = time.perf_counter()
+            try:
+                if args.endpoint == "search":
+                    response = await client.post(f"{url}/search", json={"query": query, "search_mode": "hybrid"})
+                    ok = response.status_code == 200
+                else:
+                    ok = True
+                    body = {"query": query, "use_cache": False}
+                    async with client.stream("POST", f"{url}/query", json=body) as response:
+                        ok = response.status_code == 200
+                        async for line in response.aiter_lines():
+                            if line.startswith("data: ") and json.loads(line[6:])["type"] == "error":
+                                ok = False
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append((time.perf_counter() - start) * 1000)
+            else:
+                errors += 1
+    
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=60, limits=limits) as client:
+        start = time.perf_counter()
+        deadline = time.monotonic() + args.duration
+        await asyncio.gather(*(client_loop(client, deadline) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+    
+    return {
+        "requests_per_sec": round(len(latencies) / elapsed, 1),
+        "completed": len(latencies),
+        "errors": errors,
+        **summarize(latencies),
+    }
+
+
+def run_backend(label: str, workers: int, env: Dict[str, str], args, log, folder: Optional[str], questions: List[str]) -> Dict:
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    command = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"]
+    if workers > 1:
+        command += ["--workers", str(workers)]
+    
+    with spawned(command, {**env, "MNEMORA_WORKERS": str(workers)}, log):
+        asyncio.run(wait_until_healthy(url))
+        if folder is not None:
+            async def index() -> Optional[str]:
+                async with httpx.AsyncClient(timeout=600) as client:
+                    return await index_folder(client, url, folder)
+            error = asyncio.run(index())
+            if error:
+                raise SystemExit(f"Indexing failed: {error}")
+        result = asyncio.run(drive(url, questions, args))
+    
+    result = {"setup": label, "workers": workers, **result}
+    print(json.dumps(result))
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--endpoint", choices=ENDPOINTS, default="search")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load per setup")
+    parser.add_argument("--chunks", type=int, default=500, help="Chunks in the synthetic corpus")
+    parser.add_argument("--embed-latency-ms", type=float, default=2.0)
+    parser.add_argument("--chat-ttft-ms", type=float, default=20.0)
+    parser.add_argument("--tokens-per-sec", type=float, default=500.0)
+    parser.add_argument("--skip-embedded", action="store_true", help="Only run the vector service setups")
+    parser.add_argument("--backend-log", help="Write backend and service logs to this path")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+    
+    work_dir = tempfile.mkdtemp(prefix="mnemora-workers-")
+    folder = os.path.join(work_dir, "corpus")
+    os.makedirs(folder)
+    generate_corpus(folder, args.chunks)
+    questions = [f"what is the {word} of the service" for word in ("port", "owner", "timeout", "region", "release codename")]
+    
+    ollama_port = free_port()
+    env = {
+        **os.environ,
+        "OLLAMA_BASE_URL": f"http://127.0.0.1:{ollama_port}",
+        "MNEMORA_DATA_DIR": os.path.join(work_dir, "data"),
+        # Admission control would otherwise cap concurrency before the workers do
+        "MNEMORA_MAX_ACTIVE_QUERIES": str(args.concurrency * max(args.workers)),
+        "MNEMORA_MAX_QUEUED_QUERIES": str(args.concurrency * max(args.workers)),
+    }
+    log = open(args.backend_log, "w", encoding="utf-8") if args.backend_log else subprocess.DEVNULL
+    fake = [
+        sys.executable, "-m", "benchmarks.fake_ollama_server", "--port", str(ollama_port),
+        "--embed-latency-ms", str(args.embed_latency_ms), "--chat-ttft-ms", str(args.chat_ttft_ms),
+        "--tokens-per-sec", str(args.tokens_per_sec), "--parallel", str(args.concurrency * max(args.workers)),
+    ]
+    
+    results = []
+    try:
+        with spawned(fake, env, log):
+            indexed = False
+            if not args.skip_embedded:
+                results.append(run_backend("embedded", 1, env, args, log, folder, questions))
+                indexed = True
+            
+            # The embedded backend has exited, so the service can open the same data directory
+            socket_path = os.path.join(work_dir, "vector.sock")
+            service_env = {**env, "MNEMORA_VECTOR_SERVICE": f"unix:{socket_path}"}
+            with spawned([sys.executable, "-m", "services.vector_service", "--socket", socket_path], env, log):
+                for workers in args.workers:
+                    results.append(run_backend(
+                        "vector_service", workers, service_env, args, log, None if indexed else folder, questions
+                    ))
+                    indexed = True
+    finally:
+        if args.backend_log:
+            log.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    
+    summary = {"cpu_count": os.cpu_count(), "endpoint": args.endpoint, "concurrency": args.concurrency, "results": results}
+    print(json.dumps({"cpu_count": summary["cpu_count"], "endpoint": args.endpoint}))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Disconnect check - upstream Ollama work stops soon after a client hangs up
+
+Starts the fake Ollama server and a backend, then for each scenario opens a
+stream, hangs up part way and times how long the fake server keeps serving
+work for it: chat streams for /query and /query/batch, embedding requests for
+/index. A queued /query must leave the admission queue, and a cancelled
+re-index must leave the folder's earlier documents in place. Exits non-zero
+when any scenario takes longer than --bound-ms:
+
+    cd backend && python -m benchmarks.check_disconnect --bound-ms 500
+"""
+import argparse
+import asyncio
+import json
+import re
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, Optional
+
+import httpx
+
+from benchmarks.load_test import spawned_stack, wait_until_up
+from benchmarks.synthetic_corpus import generate_corpus
+
+POLL_SECONDS = 0.005
+
+# Embedding requests must stay at zero for this long to count as stopped
+QUIET_SECONDS = 0.3
+
+
+async def ollama_stats(client: httpx.AsyncClient, ollama_url: str) -> Dict:
+    return (await client.get(f"{ollama_url}/stats")).json()
+
+
+async def metric(client: httpx.AsyncClient, backend_url: str, name: str) -> float:
+    """Sum of a metric over its label values"""
+    text = (await client.get(f"{backend_url}/metrics")).text
+    return sum(float(value) for value in re.findall(rf"^{name}(?:{{[^}}]*}})? (\S+)$", text, re.MULTILINE))
+
+
+async def wait_for(condition, timeout: float) -> Optional[float]:
+    """Milliseconds until condition() holds, or None on timeout"""
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if await condition():
+            return round((time.perf_counter() - start) * 1000, 1)
+        await asyncio.sleep(POLL_SECONDS)
+    return None
+
+
+async def hang_up_after(backend_url: str, path: str, body: Dict, event_type: str, count: int = 1) -> None:
+    """Read a stream until count events of event_type arrived, then close the connection"""
+    async with httpx.AsyncClient(timeout=60) as client:
+        async with client.stream("POST", f"{backend_url}{path}", json=body) as response:
+            seen = 0
+            async for line in response.aiter_lines():
+                if line.startswith("data: ") and json.loads(line[6:]).get("type") == event_type:
+                    seen += 1
+                    if seen == count:
+                        return
+
+
+async def chat_scenario(client, backend_url: str, ollama_url: str, path: str, body: Dict, args) -> Dict:
+    await hang_up_after(backend_url, path, body, "token", count=3)
+    
+    async def chats_closed():
+        return (await ollama_stats(client, ollama_url))["chats_active"] == 0
+    
+    return {"close_ms": await wait_for(chats_closed, args.timeout)}
+
+
+async def queued_scenario(client, backend_url: str, ollama_url: str, args) -> Dict:
+    # The backend runs with one slot, so a second query waits behind the first
+    holder = asyncio.create_task(hang_up_after(backend_url, "/query", {"query": "hold the slot", "use_cache": False}, "done"))
+    
+    async def slot_taken():
+        return (await client.get(f"{backend_url}/admission")).json()["active"] == 1
+    
+    await wait_for(slot_taken, args.timeout)
+    await hang_up_after(backend_url, "/query", {"query": "wait in line", "use_cache": False}, "queued")
+    
+    async def left_queue():
+        return (await client.get(f"{backend_url}/admission")).json()["queued"] == 0
+    
+    result = {"close_ms": await wait_for(left_queue, args.timeout)}
+    holder.cancel()
+    
+    async def slot_freed():
+        return (await client.get(f"{backend_url}/admission")).json()["active"] == 0
+    
+    await wait_for(slot_freed, args.timeout)
+    return result
+
+
+async def index_scenario(client, backend_url: str, ollama_url: str, folder: str, args) -> Dict:
+    async with client.stream("POST", f"{backend_url}/index", json={"folder_path": folder}) as response:
+        async for _ in response.aiter_lines():
+            pass
+    documents = await metric(client, backend_url, "mnemora_vector_store_documents")
+    
+    # Re-index and hang up once embedding requests are flowing
+    async def embedding():
+        return (await ollama_stats(client, ollama_url))["embeds_active"] > 0
+    
+    hang_up = asyncio.create_task(hang_up_after(backend_url, "/index", {"folder_path": folder}, "never"))
+    if await wait_for(embedding, args.timeout) is None:
+        hang_up.cancel()
+        return {"close_ms": None, "error": "embedding never started"}
+    hang_up.cancel()
+    
+    start = time.perf_counter()
+    quiet_since = None
+    last_count = None
+    close_ms = None
+    while time.perf_counter() - start < args.timeout:
+        stats = await ollama_stats(client, ollama_url)
+        now = time.perf_counter()
+        if stats["embeds_active"] == 0 and stats["embeddings"] == last_count:
+            quiet_since = quiet_since or now
+            if now - quiet_since >= QUIET_SECONDS:
+                close_ms = round((quiet_since - start) * 1000, 1)
+                break
+        else:
+            quiet_since = None
+        last_count = stats["embeddings"]
+        await asyncio.sleep(POLL_SECONDS)
+    
+    return {
+        "close_ms": close_ms,
+        "documents_before": documents,
+        "documents_after": await metric(client, backend_url, "mnemora_vector_store_documents"),
+    }
+
+
+async def run(args, backend_url: str, ollama_url: str, folder: str) -> Dict:
+    await wait_until_up(f"{backend_url}/health")
+    results = {}
+    # Indexing sends no events while it embeds, so reads may wait a while
+    async with httpx.AsyncClient(timeout=300) as client:
+        results["index"] = await index_scenario(client, backend_url, ollama_url, folder, args)
+        results["query"] = await chat_scenario(client, backend_url, ollama_url, "/query", {"query": "what is indexed", "use_cache": False}, args)
+        results["query_coalesced"] = await chat_scenario(
+            client, backend_url, ollama_url, "/query", {"query": "what is indexed", "use_cache": False, "coalesce_ms": 50}, args
+        )
+        results["query_batch"] = await chat_scenario(
+            client, backend_url, ollama_url, "/query/batch", {"queries": ["one", "two", "three"], "format": "sse", "use_cache": False}, args
+        )
+        results["query_queued"] = await queued_scenario(client, backend_url, ollama_url, args)
+        
+        results["metrics"] = {
+            "client_disconnects": await metric(client, backend_url, "mnemora_http_client_disconnects_total"),
+            "ollama_cancelled": await metric(client, backend_url, "mnemora_ollama_cancelled_total"),
+            "ollama_in_flight": await metric(client, backend_url, "mnemora_ollama_requests_in_flight"),
+            "ollama_errors": await metric(client, backend_url, "mnemora_ollama_errors_total"),
+        }
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--bound-ms", type=float, default=500.0, help="Longest upstream work may outlive its client")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--index-chunks", type=int, default=300)
+    # Fake Ollama behaviour: slow enough that every stream is still running when the client leaves
+    parser.add_argument("--embed-latency-ms", type=float, default=20.0)
+    parser.add_argument("--chat-ttft-ms", type=float, default=100.0)
+    parser.add_argument("--tokens-per-sec", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--cold-start-ms", type=float, default=0.0)
+    parser.add_argument("--ollama-parallel", type=int, default=4)
+    parser.add_argument("--backend-log", help="Write the backend's log to this path")
+    args = parser.parse_args()
+    
+    folder = tempfile.mkdtemp(prefix="mnemora-disconnect-corpus-")
+    try:
+        generate_corpus(folder, args.index_chunks)
+        with spawned_stack(args, backend_env={"MNEMORA_MAX_ACTIVE_QUERIES": "1"}) as (backend_url, ollama_url):
+            results = asyncio.run(run(args, backend_url, ollama_url, folder))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    
+    failures = [
+        name for name, result in results.items()
+        if name != "metrics" and (result["close_ms"] is None or result["close_ms"] > args.bound_ms)
+    ]
+    index = results["index"]
+    if index.get("documents_after") != index.get("documents_before"):
+        failures.append("index_kept_documents")
+    if results["metrics"]["ollama_in_flight"]:
+        failures.append("ollama_in_flight")
+    
+    results["failures"] = failures
+    print(json.dumps(results, indent=2))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
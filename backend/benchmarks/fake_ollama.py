@@ -0,0 +1,104 @@
+"""
+Deterministic in-process stand-in for the Ollama embedding and chat APIs
+
+Embeddings are signed feature-hashed bags of words, so texts that share rare
+words (entity names, identifiers) land close together and retrieval quality
+is measurable without a model. Chat answers are derived from the prompt and
+streamed with configurable time to first token and token rate.
+"""
+import asyncio
+import hashlib
+import re
+import zlib
+from typing import AsyncGenerator, Dict, List, Optional
+
+import numpy as np
+
+from services.ollama_client import OllamaClient
+
+EMBEDDING_DIM = 768
+WORD_PATTERN = re.compile(r'[a-z0-9_]+')
+
+FAKE_MODELS = ("llama3.2:3b", "llama3.2:1b", "nomic-embed-text")
+
+
+def fake_embedding(text: str, dim: int = EMBEDDING_DIM) -> List[float]:
+    """Unit vector from hashed word counts; identical text gives identical vectors"""
+    words = WORD_PATTERN.findall(text.lower())
+    if not words:
+        words = ["<empty>"]
+    
+    hashes = np.fromiter((zlib.crc32(word.encode()) for word in words), dtype=np.uint32, count=len(words))
+    signs = np.where(hashes & 0x80000000, -1.0, 1.0)
+    vector = np.bincount(hashes % dim, weights=signs, minlength=dim)
+    
+    # Dampen repeated words like TF weighting does
+    vector = np.sign(vector) * np.log1p(np.abs(vector))
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+def fake_answer(prompt: str, n_tokens: int = 40) -> List[str]:
+    """Deterministic answer tokens seeded by the prompt"""
+    seed = int.from_bytes(hashlib.blake2b(prompt.encode(), digest_size=8).digest(), "big")
+    rng = np.random.default_rng(seed)
+    words = WORD_PATTERN.findall(prompt.lower()) or ["answer"]
+    picks = rng.integers(0, len(words), size=n_tokens)
+    return [f"{words[i]} " for i in picks]
+
+
+class FakeOllamaClient(OllamaClient):
+    """OllamaClient that answers locally with simulated model latency"""
+    
+    def __init__(
+        self,
+        dim: int = EMBEDDING_DIM,
+        embed_latency_ms: float = 0.0,
+        chat_ttft_ms: float = 0.0,
+        tokens_per_sec: float = 0.0,
+        answer_tokens: int = 40
+    ):
+        super().__init__()
+        self.dim = dim
+        self.embed_latency_ms = embed_latency_ms
+        self.chat_ttft_ms = chat_ttft_ms
+        self.tokens_per_sec = tokens_per_sec
+        self.answer_tokens = answer_tokens
+    
+    async def check_health(self) -> bool:
+        return True
+    
+    async def list_models(self) -> List[dict]:
+        return [{"name": name} for name in FAKE_MODELS]
+    
+    async def warm_model(self, model: str, keep_alive: str = "10m") -> bool:
+        return True
+    
+    async def generate_embedding(self, text: str, model: Optional[str] = None) -> List[float]:
+        if self.embed_latency_ms:
+            await asyncio.sleep(self.embed_latency_ms / 1000)
+        return fake_embedding(text, self.dim)
+    
+    async def embed_many(self, texts: List[str], model: Optional[str] = None) -> List[List[float]]:
+        if self.embed_latency_ms:
+            await asyncio.sleep(self.embed_latency_ms / 1000)
+        return [fake_embedding(text, self.dim) for text in texts]
+    
+    async def chat_stream(
+        self,
+        prompt: str,
+        model: str = "llama3.2:3b",
+        system_prompt: Optional[str] = None,
+        context: Optional[str] = None,
+        messages: Optional[List[Dict]] = None,
+        options: Optional[Dict] = None
+    ) -> AsyncGenerator[str, None]:
+        if messages:
+            prompt = messages[-1]["content"]
+        
+        if self.chat_ttft_ms:
+            await asyncio.sleep(self.chat_ttft_ms / 1000)
+        for i, token in enumerate(fake_answer(prompt, self.answer_tokens)):
+            if i and self.tokens_per_sec:
+                await asyncio.sleep(1 / self.tokens_per_sec)
+            yield token
@@ -0,0 +1,237 @@
+"""
+Fake Ollama HTTP server for load and latency testing without models
+
+Serves the endpoints OllamaClient uses (/api/tags, /api/embeddings,
+/api/embed, /api/chat, /api/generate, /api/pull) with the deterministic
+embeddings and answers from fake_ollama. Latency, token rate, error rate,
+model cold starts and Ollama's parallel request limit are configurable.
+
+    cd backend && python -m benchmarks.fake_ollama_server --port 11435 --chat-ttft-ms 300 --tokens-per-sec 40
+    OLLAMA_BASE_URL=http://127.0.0.1:11435 python main.py
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from benchmarks.fake_ollama import EMBEDDING_DIM, FAKE_MODELS, fake_answer, fake_embedding
+
+
+class FakeOllamaBehaviour:
+    """Simulated model timing and failures shared by all endpoints"""
+
+    def __init__(
+        self,
+        embed_latency_ms: float = 5.0,
+        chat_ttft_ms: float = 200.0,
+        tokens_per_sec: float = 50.0,
+        answer_tokens: int = 60,
+        error_rate: float = 0.0,
+        cold_start_ms: float = 0.0,
+        unload_after_s: float = 300.0,
+        parallel: int = 4,
+        jitter: float = 0.1,
+        dim: int = EMBEDDING_DIM,
+        seed: int = 0
+    ):
+        self.embed_latency_ms = embed_latency_ms
+        self.chat_ttft_ms = chat_ttft_ms
+        self.tokens_per_sec = tokens_per_sec
+        self.answer_tokens = answer_tokens
+        self.error_rate = error_rate
+        self.cold_start_ms = cold_start_ms
+        self.unload_after_s = unload_after_s
+        self.jitter = jitter
+        self.dim = dim
+        self.rng = random.Random(seed)
+
+        # Like OLLAMA_NUM_PARALLEL: further generations queue
+        self.slots = asyncio.Semaphore(parallel)
+        self._last_used: Dict[str, float] = {}
+        self._loading: Dict[str, asyncio.Task] = {}
+
+    async def delay(self, ms: float) -> None:
+        if ms > 0:
+            await asyncio.sleep(ms * (1 + self.rng.uniform(-self.jitter, self.jitter)) / 1000)
+
+    def maybe_fail(self) -> None:
+        if self.error_rate and self.rng.random() < self.error_rate:
+            raise HTTPException(status_code=500, detail="simulated failure")
+
+    async def ensure_loaded(self, model: str) -> None:
+        """Pay the cold-start delay once per model, again after it idles out"""
+        now = time.monotonic()
+        last = self._last_used.get(model)
+        if self.cold_start_ms and (last is None or now - last > self.unload_after_s):
+            if model not in self._loading:
+                self._loading[model] = asyncio.create_task(self.delay(self.cold_start_ms))
+            try:
+                await self._loading[model]
+            finally:
+                self._loading.pop(model, None)
+        self._last_used[model] = time.monotonic()
+
+
+def create_app(behaviour: FakeOllamaBehaviour) -> FastAPI:
+    app = FastAPI(title="Fake Ollama")
+    # Active and cancelled counts show whether clients hang up on abandoned requests
+    stats = {
+        "embeddings": 0, "embed_inputs": 0, "embeds_active": 0,
+        "chats": 0, "chats_active": 0, "chats_cancelled": 0, "errors": 0,
+    }
+
+    def maybe_fail() -> None:
+        # Counted here rather than in an HTTP middleware, which would hide client disconnects from streams
+        try:
+            behaviour.maybe_fail()
+        except HTTPException:
+            stats["errors"] += 1
+            raise
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": [{"name": name, "model": name, "size": 0} for name in FAKE_MODELS]}
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    @app.post("/api/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        maybe_fail()
+        await behaviour.ensure_loaded(body.get("model", "nomic-embed-text"))
+        stats["embeds_active"] += 1
+        try:
+            await behaviour.delay(behaviour.embed_latency_ms)
+        finally:
+            stats["embeds_active"] -= 1
+        stats["embeddings"] += 1
+        return {"embedding": fake_embedding(body.get("prompt", ""), behaviour.dim)}
+
+    @app.post("/api/embed")
+    async def embed(request: Request):
+        body = await request.json()
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        maybe_fail()
+        model = body.get("model", "nomic-embed-text")
+        await behaviour.ensure_loaded(model)
+        # Batches amortise the per-request overhead, roughly like the real server
+        stats["embeds_active"] += 1
+        try:
+            await behaviour.delay(behaviour.embed_latency_ms * (1 + 0.1 * len(inputs)))
+        finally:
+            stats["embeds_active"] -= 1
+        stats["embeddings"] += 1
+        stats["embed_inputs"] += len(inputs)
+        return {"model": model, "embeddings": [fake_embedding(text, behaviour.dim) for text in inputs]}
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        maybe_fail()
+        model = body.get("model", "llama3.2:3b")
+        await behaviour.ensure_loaded(model)
+        # An empty prompt only loads the model, as OllamaClient.warm_model uses it
+        text = "".join(fake_answer(body["prompt"], behaviour.answer_tokens)) if body.get("prompt") else ""
+        return {"model": model, "response": text, "done": True}
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        maybe_fail()
+        model = body.get("model", "llama3.2:3b")
+        messages: List[Dict] = body.get("messages", [])
+        prompt = messages[-1]["content"] if messages else ""
+        stream = body.get("stream", True)
+        stats["chats"] += 1
+
+        async def tokens():
+            stats["chats_active"] += 1
+            try:
+                async with behaviour.slots:
+                    await behaviour.ensure_loaded(model)
+                    await behaviour.delay(behaviour.chat_ttft_ms)
+                    for i, token in enumerate(fake_answer(prompt, behaviour.answer_tokens)):
+                        if i and behaviour.tokens_per_sec:
+                            await behaviour.delay(1000 / behaviour.tokens_per_sec)
+                        yield token
+            except (asyncio.CancelledError, GeneratorExit):
+                # The client closed the connection mid-answer
+                stats["chats_cancelled"] += 1
+                raise
+            finally:
+                stats["chats_active"] -= 1
+
+        if not stream:
+            content = "".join([token async for token in tokens()])
+            return {"model": model, "message": {"role": "assistant", "content": content}, "done": True}
+
+        async def lines():
+            async for token in tokens():
+                yield json.dumps({"model": model, "message": {"role": "assistant", "content": token}, "done": False}) + "\n"
+            yield json.dumps({"model": model, "message": {"role": "assistant", "content": ""}, "done": True}) + "\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    @app.post("/api/pull")
+    async def pull(request: Request):
+        body = await request.json()
+        name = body.get("name") or body.get("model", "")
+
+        async def progress():
+            total = 100_000_000
+            yield json.dumps({"status": "pulling manifest"}) + "\n"
+            for completed in range(0, total + 1, total // 10):
+                await behaviour.delay(20)
+                yield json.dumps({"status": f"pulling {name}", "total": total, "completed": completed}) + "\n"
+            yield json.dumps({"status": "success"}) + "\n"
+
+        return StreamingResponse(progress(), media_type="application/x-ndjson")
+
+    return app
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--embed-latency-ms", type=float, default=5.0)
+    parser.add_argument("--chat-ttft-ms", type=float, default=200.0)
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0)
+    parser.add_argument("--answer-tokens", type=int, default=60)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500")
+    parser.add_argument("--cold-start-ms", type=float, default=0.0, help="Load delay for a model's first request")
+    parser.add_argument("--unload-after-s", type=float, default=300.0, help="Idle time after which a model cold-starts again")
+    parser.add_argument("--parallel", type=int, default=4, help="Concurrent generations, like OLLAMA_NUM_PARALLEL")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Relative random variation of every delay")
+    parser.add_argument("--dim", type=int, default=EMBEDDING_DIM)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    behaviour = FakeOllamaBehaviour(
+        embed_latency_ms=args.embed_latency_ms,
+        chat_ttft_ms=args.chat_ttft_ms,
+        tokens_per_sec=args.tokens_per_sec,
+        answer_tokens=args.answer_tokens,
+        error_rate=args.error_rate,
+        cold_start_ms=args.cold_start_ms,
+        unload_after_s=args.unload_after_s,
+        parallel=args.parallel,
+        jitter=args.jitter,
+        dim=args.dim,
+        seed=args.seed
+    )
+    uvicorn.run(create_app(behaviour), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+Load test - concurrent /index and /query traffic against a running backend
+
+With --spawn it starts the fake Ollama server and a backend (on a temporary
+data directory) itself, so it runs on machines without models. Query workers
+ask the planted-fact questions of a synthetic corpus and time the SSE stream;
+index workers keep re-indexing their own folder at the same time.
+
+    cd backend && python -m benchmarks.load_test --spawn --duration 30 --query-workers 16 --index-workers 1
+    cd backend && python -m benchmarks.load_test --backend-url http://127.0.0.1:8000 --corpus-chunks 5000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import httpx
+import numpy as np
+
+from benchmarks.synthetic_corpus import generate_corpus
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def summarize(latencies: List[float]) -> Dict:
+    if not latencies:
+        return {}
+    return {
+        "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 1),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 1),
+        "max_ms": round(max(latencies), 1),
+    }
+
+
+async def wait_until_up(url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+@contextmanager
+def spawned_stack(args: argparse.Namespace, backend_env: Optional[Dict[str, str]] = None):
+    """Run the fake Ollama server and a backend in subprocesses"""
+    ollama_port, backend_port = free_port(), free_port()
+    data_dir = tempfile.mkdtemp(prefix="mnemora-load-data-")
+    env = {
+        **os.environ,
+        **(backend_env or {}),
+        "OLLAMA_BASE_URL": f"http://127.0.0.1:{ollama_port}",
+        "MNEMORA_DATA_DIR": data_dir,
+    }
+    
+    fake = subprocess.Popen(
+        [
+            sys.executable, "-m", "benchmarks.fake_ollama_server", "--port", str(ollama_port),
+            "--chat-ttft-ms", str(args.chat_ttft_ms), "--tokens-per-sec", str(args.tokens_per_sec),
+            "--embed-latency-ms", str(args.embed_latency_ms), "--error-rate", str(args.error_rate),
+            "--cold-start-ms", str(args.cold_start_ms), "--parallel", str(args.ollama_parallel),
+        ],
+        cwd=BACKEND_DIR, env=env
+    )
+    # The backend logs every Ollama request; keep that out of the report
+    log = open(args.backend_log, "w", encoding="utf-8") if args.backend_log else subprocess.DEVNULL
+    backend = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(backend_port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    try:
+        yield f"http://127.0.0.1:{backend_port}", f"http://127.0.0.1:{ollama_port}"
+    finally:
+        for process in (backend, fake):
+            process.terminate()
+        for process in (backend, fake):
+            process.wait(timeout=30)
+        if args.backend_log:
+            log.close()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+async def index_folder(client: httpx.AsyncClient, backend_url: str, folder: str) -> Optional[str]:
+    """Index a folder, returning an error message if it failed"""
+    async with client.stream("POST", f"{backend_url}/index", json={"folder_path": folder}) as response:
+        if response.status_code != 200:
+            return f"HTTP {response.status_code}"
+        async for line in response.aiter_lines():
+            if line.startswith("data: "):
+                event = json.loads(line[6:])
+                if event.get("type") == "error":
+                    return event.get("message", "error")
+    return None
+
+
+async def query_worker(client, backend_url: str, questions: List[str], deadline: float, args, record: Dict) -> None:
+    rng = random.Random()
+    while time.monotonic() < deadline:
+        body = {"query": rng.choice(questions), "model": args.model, "use_cache": args.answer_cache}
+        start = time.perf_counter()
+        ttft = None
+        failed = False
+        try:
+            async with client.stream("POST", f"{backend_url}/query", json=body) as response:
+                if response.status_code != 200:
+                    failed = True
+                else:
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data: "):
+                            continue
+                        event = json.loads(line[6:])
+                        # OllamaClient reports model failures as an "Error: ..." token
+                        if event["type"] == "error" or (event["type"] == "token" and event["content"].startswith("Error:")):
+                            failed = True
+                        elif event["type"] == "token" and ttft is None:
+                            ttft = (time.perf_counter() - start) * 1000
+        except httpx.HTTPError:
+            failed = True
+        
+        if failed:
+            record["errors"] += 1
+            continue
+        record["latencies"].append((time.perf_counter() - start) * 1000)
+        if ttft is not None:
+            record["ttfts"].append(ttft)
+
+
+async def index_worker(client, backend_url: str, folder: str, deadline: float, record: Dict) -> None:
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            error = await index_folder(client, backend_url, folder)
+        except httpx.HTTPError as e:
+            error = str(e)
+        if error:
+            record["errors"] += 1
+        else:
+            record["latencies"].append((time.perf_counter() - start) * 1000)
+
+
+async def run_load(args: argparse.Namespace, backend_url: str, ollama_url: Optional[str]) -> Dict:
+    await wait_until_up(f"{backend_url}/health")
+    
+    corpus_root = tempfile.mkdtemp(prefix="mnemora-load-corpus-")
+    try:
+        # A shared corpus for queries, plus one folder per index worker
+        query_dir = os.path.join(corpus_root, "query")
+        manifest = generate_corpus(query_dir, args.corpus_chunks, seed=args.seed)
+        questions = [fact["question"] for fact in manifest["facts"]]
+        index_dirs = []
+        for i in range(args.index_workers):
+            index_dirs.append(os.path.join(corpus_root, f"index-{i}"))
+            generate_corpus(index_dirs[-1], args.index_chunks, seed=args.seed + i + 1)
+        
+        timeout = httpx.Timeout(300.0, connect=10.0)
+        limits = httpx.Limits(max_connections=args.query_workers + args.index_workers + 4)
+        async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+            start = time.perf_counter()
+            error = await index_folder(client, backend_url, query_dir)
+            if error:
+                raise RuntimeError(f"Initial indexing failed: {error}")
+            initial_index_seconds = time.perf_counter() - start
+            
+            queries = {"latencies": [], "ttfts": [], "errors": 0}
+            indexes = {"latencies": [], "errors": 0}
+            deadline = time.monotonic() + args.duration
+            started = time.perf_counter()
+            await asyncio.gather(
+                *[query_worker(client, backend_url, questions, deadline, args, queries) for _ in range(args.query_workers)],
+                *[index_worker(client, backend_url, folder, deadline, indexes) for folder in index_dirs]
+            )
+            elapsed = time.perf_counter() - started
+            
+            fake_stats = None
+            if ollama_url:
+                response = await client.get(f"{ollama_url}/stats")
+                fake_stats = response.json() if response.status_code == 200 else None
+    finally:
+        shutil.rmtree(corpus_root, ignore_errors=True)
+    
+    return {
+        "duration_seconds": round(elapsed, 1),
+        "corpus_chunks": args.corpus_chunks,
+        "initial_index_seconds": round(initial_index_seconds, 2),
+        "query": {
+            "workers": args.query_workers,
+            "completed": len(queries["latencies"]),
+            "errors": queries["errors"],
+            "throughput_rps": round(len(queries["latencies"]) / elapsed, 2),
+            "latency": summarize(queries["latencies"]),
+            "ttft": summarize(queries["ttfts"]),
+        },
+        "index": {
+            "workers": args.index_workers,
+            "completed": len(indexes["latencies"]),
+            "errors": indexes["errors"],
+            "throughput_rps": round(len(indexes["latencies"]) / elapsed, 3),
+            "latency": summarize(indexes["latencies"]),
+        },
+        "fake_ollama": fake_stats,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backend-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--spawn", action="store_true", help="Start the fake Ollama server and a backend")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--query-workers", type=int, default=8)
+    parser.add_argument("--index-workers", type=int, default=1)
+    parser.add_argument("--corpus-chunks", type=int, default=2000)
+    parser.add_argument("--index-chunks", type=int, default=500, help="Size of each index worker's folder")
+    parser.add_argument("--model", default="llama3.2:3b")
+    parser.add_argument("--answer-cache", action="store_true", help="Let repeated questions hit the answer cache")
+    parser.add_argument("--seed", type=int, default=0)
+    # Fake Ollama behaviour, used with --spawn
+    parser.add_argument("--embed-latency-ms", type=float, default=5.0)
+    parser.add_argument("--chat-ttft-ms", type=float, default=200.0)
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--cold-start-ms", type=float, default=0.0)
+    parser.add_argument("--ollama-parallel", type=int, default=4)
+    parser.add_argument("--backend-log", help="With --spawn, write the backend's log to this path")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+    
+    if args.spawn:
+        with spawned_stack(args) as (backend_url, ollama_url):
+            result = asyncio.run(run_load(args, backend_url, ollama_url))
+    else:
+        result = asyncio.run(run_load(args, args.backend_url, None))
+    
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Synthetic corpus generator - Markdown, code and PDF files with planted facts
+
+Every file carries at least one fact about a uniquely named entity
+("The port of service kavolu-12 is 8411."), and the manifest records which
+file holds it, so retrieval can be scored against known answer locations.
+Filler text follows a Zipf-like word distribution so BM25 and the hashed
+embeddings see realistic term statistics.
+"""
+import json
+import os
+import random
+import shutil
+from typing import Dict, List, Optional
+
+# The indexer cuts 1000-character chunks with 200 characters of overlap
+CHARS_PER_CHUNK = 800
+
+SYLLABLES = ["ka", "vo", "lu", "ze", "ri", "po", "mi", "ta", "ne", "qu", "sa", "do", "fe", "gi", "ho", "ju"]
+
+FILLER_WORDS = (
+    "the of and to in is for on with as by that this from at be are it an or was not have "
+    "service request response data system file config value error user client server process "
+    "update change build deploy release version test check run start stop load save read write "
+    "index query cache queue thread memory disk network timeout retry limit policy owner team "
+    "review design document note meeting plan task issue ticket alert metric log event record"
+).split()
+
+ATTRIBUTES = [
+    ("port", lambda rng: str(rng.randint(1024, 65535))),
+    ("owner", lambda rng: f"team-{rng.choice(SYLLABLES)}{rng.choice(SYLLABLES)}"),
+    ("timeout", lambda rng: f"{rng.randint(1, 600)} seconds"),
+    ("region", lambda rng: rng.choice(["eu-west-1", "us-east-2", "ap-south-1", "sa-east-1"])),
+    ("release codename", lambda rng: "".join(rng.choice(SYLLABLES) for _ in range(3))),
+]
+
+FILE_KINDS = ("markdown", "code", "pdf")
+DEFAULT_MIX = {"markdown": 0.6, "code": 0.35, "pdf": 0.05}
+
+
+def entity_name(index: int) -> str:
+    """Unique, pronounceable entity name for an integer"""
+    parts = []
+    n = index
+    for _ in range(3):
+        parts.append(SYLLABLES[n % len(SYLLABLES)])
+        n //= len(SYLLABLES)
+    return f"{''.join(parts)}-{index}"
+
+
+class CorpusWriter:
+    """Writes files until the estimated chunk count is reached"""
+    
+    def __init__(self, directory: str, seed: int = 0, mix: Optional[Dict[str, float]] = None):
+        self.directory = directory
+        self.rng = random.Random(seed)
+        self.mix = mix or DEFAULT_MIX
+        # Zipf-like weights: the first filler words are far more common
+        self.weights = [1.0 / (rank + 1) for rank in range(len(FILLER_WORDS))]
+        self.facts: List[Dict] = []
+        self.files = 0
+        self.chars = 0
+    
+    def generate(self, target_chunks: int, max_chunks_per_file: int = 40) -> List[Dict]:
+        os.makedirs(self.directory, exist_ok=True)
+        kinds = list(self.mix)
+        weights = [self.mix[kind] for kind in kinds]
+        
+        while self.chars / CHARS_PER_CHUNK < target_chunks:
+            remaining = target_chunks - self.chars / CHARS_PER_CHUNK
+            chunks = max(1, min(self.rng.randint(1, max_chunks_per_file), int(remaining) + 1))
+            kind = self.rng.choices(kinds, weights)[0]
+            getattr(self, f"_write_{kind}")(chunks)
+            self.files += 1
+        
+        return self.facts
+    
+    def _filler(self, n_words: int) -> str:
+        words = self.rng.choices(FILLER_WORDS, self.weights, k=n_words)
+        return " ".join(words).capitalize() + "."
+    
+    def _new_fact(self, file_path: str) -> Dict:
+        entity = entity_name(len(self.facts))
+        attribute, make_value = self.rng.choice(ATTRIBUTES)
+        value = make_value(self.rng)
+        fact = {
+            "id": len(self.facts),
+            "entity": entity,
+            "attribute": attribute,
+            "value": value,
+            "sentence": f"The {attribute} of service {entity} is {value}.",
+            "question": f"What is the {attribute} of service {entity}?",
+            "file_path": file_path,
+        }
+        self.facts.append(fact)
+        return fact
+    
+    def _paragraphs(self, chunks: int, fact: Dict) -> List[str]:
+        # About two paragraphs per chunk; the fact lands in a random one
+        n = max(1, chunks * 2)
+        paragraphs = [self._filler(self.rng.randint(50, 80)) for _ in range(n)]
+        position = self.rng.randrange(n)
+        paragraphs[position] = f"{paragraphs[position]} {fact['sentence']}"
+        return paragraphs
+    
+    def _path(self, extension: str) -> str:
+        subdir = os.path.join(self.directory, f"d{self.files // 500:04d}")
+        os.makedirs(subdir, exist_ok=True)
+        return os.path.join(subdir, f"f{self.files:07d}{extension}")
+    
+    def _write_markdown(self, chunks: int) -> None:
+        path = self._path(".md")
+        fact = self._new_fact(path)
+        lines = ["---", f"title: Notes {self.files}", "tags: [bench]", "---", f"# Notes on {fact['entity']}", ""]
+        for i, paragraph in enumerate(self._paragraphs(chunks, fact)):
+            if i % 4 == 0:
+                lines += [f"## Section {i // 4 + 1}", ""]
+            lines += [paragraph, ""]
+        self._write(path, "\n".join(lines))
+    
+    def _write_code(self, chunks: int) -> None:
+        path = self._path(".py")
+        fact = self._new_fact(path)
+        name = fact["entity"].replace("-", "_")
+        lines = [f'"""Helpers for service {fact["entity"]}"""', "import logging", "", "logger = logging.getLogger(__name__)", ""]
+        for i, paragraph in enumerate(self._paragraphs(chunks, fact)):
+            lines += [
+                "",
+                f"def {name}_step_{i}(value):",
+                f'    """{paragraph}"""',
+                f"    logger.debug(\"step {i} %s\", value)",
+                f"    return value + {i}",
+            ]
+        self._write(path, "\n".join(lines) + "\n")
+    
+    def _write_pdf(self, chunks: int) -> None:
+        import fitz
+        
+        path = self._path(".pdf")
+        fact = self._new_fact(path)
+        doc = fitz.open()
+        paragraphs = self._paragraphs(chunks, fact)
+        # Roughly 2500 characters fit on a page at this font size
+        page_text = []
+        for paragraph in paragraphs + [None]:
+            if paragraph is None or sum(len(p) for p in page_text) > 2500:
+                page = doc.new_page()
+                page.insert_textbox(fitz.Rect(40, 40, 555, 800), "\n\n".join(page_text), fontsize=8)
+                page_text = []
+            if paragraph is not None:
+                page_text.append(paragraph)
+        doc.save(path)
+        doc.close()
+        self.chars += sum(len(p) + 2 for p in paragraphs)
+    
+    def _write(self, path: str, text: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        self.chars += len(text)
+
+
+def generate_corpus(
+    directory: str,
+    target_chunks: int,
+    seed: int = 0,
+    mix: Optional[Dict[str, float]] = None
+) -> Dict:
+    """Generate a corpus, or reuse one already generated with the same parameters"""
+    # Hidden, so the indexer skips it
+    manifest_path = os.path.join(directory, ".manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if (manifest["target_chunks"], manifest["seed"], manifest["mix"]) == (target_chunks, seed, mix or DEFAULT_MIX):
+            return manifest
+        # Different parameters: start over so stale files don't leak in
+        shutil.rmtree(directory)
+    
+    writer = CorpusWriter(directory, seed=seed, mix=mix)
+    facts = writer.generate(target_chunks)
+    manifest = {
+        "target_chunks": target_chunks,
+        "seed": seed,
+        "mix": writer.mix,
+        "files": writer.files,
+        "chars": writer.chars,
+        "facts": facts,
+    }
+    with open(f"{manifest_path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+    return manifest
@@ -3,8 +3,11 @@ Mnemora Backend - FastAPI server for document indexing and RAG queries
 """
 import asyncio
 import logging
+import math
 import os
+import subprocess
 import sys
+import tempfile
 from contextlib import asynccontextmanager
 
 import uvicorn
@@ -12,8 +15,34 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from api.routes import router
+from services.admission import (
+    AdmissionController,
+    DEFAULT_MAX_ACTIVE,
+    DEFAULT_MAX_QUEUED,
+    DEFAULT_MAX_QUEUED_PER_CLIENT,
+    DEFAULT_QUEUE_TIMEOUT_SECONDS,
+)
+from services.answer_cache import AnswerCache, DEFAULT_SIMILARITY_THRESHOLD
+from services.chat_sessions import ChatSessionStore
+from services.embedding_reduction import EmbeddingReducer
+from services.lexical_index import LexicalIndex
+from services.link_graph import LinkGraph
+from services.metadata_index import MetadataIndex
+from services import metrics
+from services.model_warmer import ModelWarmer
+from services.quantized_store import QuantizedVectorStore, SUPPORTED_DTYPES
+from services.symbol_index import SymbolIndex
+from services.tracing import DEFAULT_CAPACITY, Tracer, TracingMiddleware
+from services.vector_service import (
+    LexicalIndexClient,
+    LinkGraphClient,
+    MetadataIndexClient,
+    SymbolIndexClient,
+    VectorStoreClient,
+)
 from services.vector_store import VectorStore
-from services.ollama_client import OllamaClient
+from services.warmup import Warmup
+from services.ollama_client import OLLAMA_BASE_URL, OllamaClient
 
 # Setup logging
 logging.basicConfig(
@@ -22,34 +51,215 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Where Ollama runs; point at benchmarks/fake_ollama_server.py for load tests
+OLLAMA_URL = os.environ.get("OLLAMA_BASE_URL", OLLAMA_BASE_URL)
+
+# Index and cache files live here
+DATA_DIR = os.environ.get("MNEMORA_DATA_DIR", os.path.join(os.path.dirname(__file__), 'data'))
+
+# Vector store backend: "chroma", or "float16" / "int8" for the quantized in-memory engine
+VECTOR_BACKEND = os.environ.get("MNEMORA_VECTOR_BACKEND", "chroma")
+
+# Index-time embedding reduction: "none", "matryoshka" or "pca", applied to new indexes only
+EMBED_REDUCTION = os.environ.get("MNEMORA_EMBED_REDUCTION", "none")
+EMBED_DIM = int(os.environ.get("MNEMORA_EMBED_DIM", "256"))
+
+# Query-embedding similarity needed to replay a cached answer
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("MNEMORA_ANSWER_CACHE_THRESHOLD", DEFAULT_SIMILARITY_THRESHOLD))
+
+# Trace every request instead of only those sent with X-Mnemora-Trace: 1
+TRACE_ALL = os.environ.get("MNEMORA_TRACING", "0").lower() in ("1", "true", "yes")
+TRACE_CAPACITY = int(os.environ.get("MNEMORA_TRACE_BUFFER", DEFAULT_CAPACITY))
+
+# Queries generating at once, and how many more may wait for a slot before getting a 429
+MAX_ACTIVE_QUERIES = int(os.environ.get("MNEMORA_MAX_ACTIVE_QUERIES", DEFAULT_MAX_ACTIVE))
+MAX_QUEUED_QUERIES = int(os.environ.get("MNEMORA_MAX_QUEUED_QUERIES", DEFAULT_MAX_QUEUED))
+MAX_QUEUED_PER_CLIENT = int(os.environ.get("MNEMORA_MAX_QUEUED_PER_CLIENT", DEFAULT_MAX_QUEUED_PER_CLIENT))
+QUEUE_TIMEOUT = float(os.environ.get("MNEMORA_QUEUE_TIMEOUT", DEFAULT_QUEUE_TIMEOUT_SECONDS))
+
+# API worker processes; more than one needs the stores in a vector service
+WORKERS = max(1, int(os.environ.get("MNEMORA_WORKERS", "1")))
+
+# Address of a running vector service, "unix:/path/to.sock" or "http://127.0.0.1:port".
+# Unset with one worker: the stores open in-process. Unset with several: main starts one.
+VECTOR_SERVICE = os.environ.get("MNEMORA_VECTOR_SERVICE", "")
+
 # Global instances
 vector_store: VectorStore = None
+lexical_index: LexicalIndex = None
+metadata_index: MetadataIndex = None
+link_graph: LinkGraph = None
+symbol_index: SymbolIndex = None
 ollama_client: OllamaClient = None
+chat_sessions: ChatSessionStore = None
+answer_cache: AnswerCache = None
+model_warmer: ModelWarmer = None
+tracer = Tracer(capacity=TRACE_CAPACITY, trace_all=TRACE_ALL)
+
+
+def create_vector_store(data_dir: str):
+    """Open the configured vector store backend"""
+    reducer = EmbeddingReducer(mode=EMBED_REDUCTION, dim=EMBED_DIM)
+    
+    if VECTOR_BACKEND in SUPPORTED_DTYPES:
+        return QuantizedVectorStore(
+            persist_directory=os.path.join(data_dir, f'quantized-{VECTOR_BACKEND}'),
+            dtype=VECTOR_BACKEND,
+            reducer=reducer
+        )
+    if VECTOR_BACKEND != "chroma":
+        raise ValueError(f"Unknown MNEMORA_VECTOR_BACKEND: {VECTOR_BACKEND}")
+    return VectorStore(persist_directory=os.path.join(data_dir, 'chromadb'), reducer=reducer)
+
+
+def backfill_index(index, vector_store) -> None:
+    """Build a search index for collections indexed before it existed"""
+    if vector_store.get_document_count() == 0:
+        return
+    logger.info(f"Building {type(index).__name__} from existing documents...")
+    for batch in vector_store.iter_documents():
+        index.add_documents(
+            [doc["id"] for doc in batch],
+            [doc["content"] for doc in batch],
+            [doc["metadata"] for doc in batch],
+            save=False
+        )
+    index.save()
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Manage application lifecycle - startup and shutdown"""
-    global vector_store, ollama_client
+    global ollama_client, chat_sessions, model_warmer
     
     logger.info("Starting Mnemora backend...")
     
     # Initialize services
-    data_dir = os.path.join(os.path.dirname(__file__), 'data')
+    data_dir = DATA_DIR
     os.makedirs(data_dir, exist_ok=True)
     
-    vector_store = VectorStore(persist_directory=os.path.join(data_dir, 'chromadb'))
-    ollama_client = OllamaClient()
+    ollama_client = OllamaClient(base_url=OLLAMA_URL)
+    # On disk, so a session's turns can reach any worker
+    chat_sessions = ChatSessionStore(persist_path=os.path.join(data_dir, 'chat_sessions.sqlite3'))
+    model_warmer = ModelWarmer(ollama_client)
+    metrics.CHAT_SESSIONS.set_function(chat_sessions.count)
     
-    # Store in app state
-    app.state.vector_store = vector_store
+    # Cheap services are ready before the first request
     app.state.ollama_client = ollama_client
+    app.state.chat_sessions = chat_sessions
+    app.state.model_warmer = model_warmer
+    app.state.tracer = tracer
+    # Ollama's parallelism is shared, so each worker admits its share of the limits
+    app.state.admission = AdmissionController(
+        max_active=math.ceil(MAX_ACTIVE_QUERIES / WORKERS),
+        max_queued=math.ceil(MAX_QUEUED_QUERIES / WORKERS),
+        max_queued_per_client=MAX_QUEUED_PER_CLIENT,
+        queue_timeout=QUEUE_TIMEOUT
+    )
     
-    logger.info("Mnemora backend ready!")
+    # Stores load from disk in the background so /health answers at once; routes wait on what they use
+    warmup = Warmup(app.state)
+    app.state.warmup = warmup
+    
+    async def load_vector_store():
+        global vector_store
+        if VECTOR_SERVICE:
+            vector_store = VectorStoreClient(VECTOR_SERVICE)
+            await asyncio.to_thread(vector_store.wait_until_ready)
+            return vector_store
+        vector_store = await asyncio.to_thread(create_vector_store, data_dir)
+        return vector_store
+    
+    async def load_lexical_index():
+        global lexical_index
+        if VECTOR_SERVICE:
+            # The service backfills its own index
+            lexical_index = LexicalIndexClient(VECTOR_SERVICE)
+            await asyncio.to_thread(lexical_index.wait_until_ready)
+            return lexical_index
+        lexical_index = await asyncio.to_thread(
+            LexicalIndex, persist_path=os.path.join(data_dir, 'lexical_index.json')
+        )
+        if len(lexical_index) == 0:
+            store = await warmup.get("vector_store")
+            await asyncio.to_thread(backfill_index, lexical_index, store)
+        return lexical_index
+    
+    async def load_metadata_index():
+        global metadata_index
+        if VECTOR_SERVICE:
+            metadata_index = MetadataIndexClient(VECTOR_SERVICE)
+            await asyncio.to_thread(metadata_index.wait_until_ready)
+            return metadata_index
+        metadata_index = await asyncio.to_thread(
+            MetadataIndex, persist_path=os.path.join(data_dir, 'metadata_index.json')
+        )
+        if len(metadata_index) == 0:
+            store = await warmup.get("vector_store")
+            await asyncio.to_thread(backfill_index, metadata_index, store)
+        return metadata_index
+    
+    async def load_link_graph():
+        global link_graph
+        if VECTOR_SERVICE:
+            link_graph = LinkGraphClient(VECTOR_SERVICE)
+            await asyncio.to_thread(link_graph.wait_until_ready)
+            return link_graph
+        link_graph = await asyncio.to_thread(
+            LinkGraph, persist_path=os.path.join(data_dir, 'link_graph.json')
+        )
+        if len(link_graph) == 0:
+            store = await warmup.get("vector_store")
+            await asyncio.to_thread(backfill_index, link_graph, store)
+        return link_graph
+    
+    async def load_symbol_index():
+        global symbol_index
+        if VECTOR_SERVICE:
+            symbol_index = SymbolIndexClient(VECTOR_SERVICE)
+            await asyncio.to_thread(symbol_index.wait_until_ready)
+            return symbol_index
+        symbol_index = await asyncio.to_thread(
+            SymbolIndex, persist_path=os.path.join(data_dir, 'symbol_index.json')
+        )
+        if len(symbol_index) == 0:
+            store = await warmup.get("vector_store")
+            await asyncio.to_thread(backfill_index, symbol_index, store)
+        return symbol_index
+    
+    async def load_answer_cache():
+        global answer_cache
+        answer_cache = await asyncio.to_thread(
+            AnswerCache,
+            persist_path=os.path.join(data_dir, 'answer_cache.json'),
+            threshold=ANSWER_CACHE_THRESHOLD
+        )
+        return answer_cache
+    
+    # Sizes are read when /metrics is scraped
+    warmup.start("vector_store", load_vector_store,
+                 on_ready=lambda store: metrics.VECTOR_DOCUMENTS.set_function(store.get_document_count))
+    warmup.start("lexical_index", load_lexical_index,
+                 on_ready=lambda index: metrics.LEXICAL_DOCUMENTS.set_function(lambda: len(index)))
+    warmup.start("metadata_index", load_metadata_index)
+    warmup.start("link_graph", load_link_graph)
+    warmup.start("symbol_index", load_symbol_index)
+    warmup.start("answer_cache", load_answer_cache,
+                 on_ready=lambda cache: metrics.ANSWER_CACHE_ENTRIES.set_function(lambda: len(cache)))
+    
+    # Keep recently used chat models loaded between queries
+    keepalive_task = asyncio.create_task(model_warmer.run_keepalive())
+    
+    logger.info("Mnemora backend ready! Loading stores in the background...")
     
     yield
     
     logger.info("Shutting down Mnemora backend...")
+    keepalive_task.cancel()
+    await warmup.stop()
+    # Answers from the last moments are still waiting on the debounced save
+    if answer_cache is not None:
+        await asyncio.to_thread(answer_cache.save)
 
 
 # Create FastAPI app
@@ -69,15 +279,48 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request counts and latencies for /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Opt-in per-request span trees and profiles, served under /traces
+app.add_middleware(TracingMiddleware, tracer=tracer)
+
 # Include routes
 app.include_router(router)
 
 
-if __name__ == "__main__":
-    uvicorn.run(
-        "main:app",
-        host="127.0.0.1",
-        port=8000,
-        reload=False,
-        log_level="info"
+def start_vector_service() -> subprocess.Popen:
+    """Run the stores in their own process for the workers to share, and point the workers at it"""
+    global VECTOR_SERVICE
+    if sys.platform == "win32":
+        # No Unix sockets for uvicorn on Windows; use a fixed localhost port instead
+        port = int(os.environ.get("MNEMORA_VECTOR_SERVICE_PORT", "8001"))
+        args, VECTOR_SERVICE = ["--port", str(port)], f"http://127.0.0.1:{port}"
+    else:
+        socket_path = os.path.join(tempfile.gettempdir(), f"mnemora-vector-{os.getpid()}.sock")
+        args, VECTOR_SERVICE = ["--socket", socket_path], f"unix:{socket_path}"
+    
+    # Workers are new processes and read the address from the environment
+    os.environ["MNEMORA_VECTOR_SERVICE"] = VECTOR_SERVICE
+    logger.info(f"Starting vector service at {VECTOR_SERVICE} for {WORKERS} workers")
+    return subprocess.Popen(
+        [sys.executable, "-m", "services.vector_service", *args],
+        cwd=os.path.dirname(os.path.abspath(__file__))
     )
+
+
+if __name__ == "__main__":
+    service = start_vector_service() if WORKERS > 1 and not VECTOR_SERVICE else None
+    try:
+        uvicorn.run(
+            "main:app",
+            host="127.0.0.1",
+            port=8000,
+            reload=False,
+            log_level="info",
+            workers=WORKERS
+        )
+    finally:
+        if service is not None:
+            service.terminate()
+            service.wait()
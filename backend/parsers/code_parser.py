@@ -4,7 +4,7 @@ Code Parser - processes source code files
 import logging
 import os
 import re
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -44,6 +44,86 @@ EXT_TO_LANG = {
     '.kt': 'java',
 }
 
+# Extension to the language reported for symbols
+LANGUAGES = {
+    '.py': 'python',
+    '.js': 'javascript',
+    '.jsx': 'javascript',
+    '.ts': 'typescript',
+    '.tsx': 'typescript',
+    '.java': 'java',
+    '.c': 'c',
+    '.h': 'c',
+    '.cpp': 'cpp',
+    '.go': 'go',
+    '.rs': 'rust',
+    '.swift': 'swift',
+    '.kt': 'kotlin',
+}
+
+# Definition patterns, matched once against each line. Every alternative captures
+# the name in a group named after the kind of symbol, as the last group it opens.
+_JS_SYMBOLS = re.compile(
+    r'[ \t]*(?:export[ \t]+(?:default[ \t]+)?)?(?:declare[ \t]+)?(?:abstract[ \t]+)?(?:'
+    r'class[ \t]+(?P<class>\w+)'
+    r'|interface[ \t]+(?P<interface>\w+)'
+    r'|enum[ \t]+(?P<enum>\w+)'
+    r'|type[ \t]+(?P<type>\w+)[ \t]*(?:<[^=\n]*>)?[ \t]*='
+    r'|(?:async[ \t]+)?function[ \t]*\*?[ \t]*(?P<function>\w+)'
+    r'|(?:const|let|var)[ \t]+(?P<variable>\w+)[ \t]*(?::[^=\n]+)?=[ \t]*(?:async[ \t]*)?(?:function\b|\([^)\n]*\)?[^=\n]*=>|\w+[ \t]*=>)'
+    r'|(?:(?:public|private|protected|static|async|readonly|override|get|set)[ \t]+)*(?P<method>\w+)[ \t]*(?:<[^>\n]*>)?'
+    r'\([^;\n]*\)[ \t]*(?::[^{\n]+)?\{[ \t]*$'
+    r')'
+)
+_C_LIKE_SYMBOLS = re.compile(
+    r'[ \t]*(?:@\w+[ \t]+)*(?:(?:public|private|protected|internal|fileprivate|open|static|final|abstract|sealed|data|'
+    r'override|virtual|inline|extern|synchronized|native|const|unsafe|async|suspend|mutating)[ \t]+)*(?:'
+    r'(?:class|interface|struct|enum|record|object|protocol|extension|typedef[ \t]+struct)[ \t]+(?P<class>\w+)'
+    r'|(?:fun|func)[ \t]+(?:<[^>\n]*>[ \t]*)?(?:\w+\.)?(?P<function>\w+)'
+    r'|(?!(?:return|new|else|throw|await|case|delete|goto)\b)[\w<>\[\],.:*&]+[ \t*&]+(?:\w+::)?(?P<method>\w+)[ \t]*\([^;\n]*$'
+    r')'
+)
+SYMBOL_PATTERNS = {
+    'python': re.compile(r'[ \t]*(?:async[ \t]+)?(?:class[ \t]+(?P<class>\w+)|def[ \t]+(?P<function>\w+))'),
+    'javascript': _JS_SYMBOLS,
+    'typescript': _JS_SYMBOLS,
+    'go': re.compile(
+        r'(?:func[ \t]+\([^)]*\)[ \t]*(?P<method>\w+)'
+        r'|func[ \t]+(?P<function>\w+)'
+        r'|type[ \t]+(?P<type>\w+))'
+    ),
+    'rust': re.compile(
+        r'[ \t]*(?:pub(?:\([^)]*\))?[ \t]+)?(?:(?:const|async|unsafe|extern(?:[ \t]+"\w+")?)[ \t]+)*(?:'
+        r'fn[ \t]+(?P<function>\w+)'
+        r'|struct[ \t]+(?P<struct>\w+)'
+        r'|enum[ \t]+(?P<enum>\w+)'
+        r'|trait[ \t]+(?P<trait>\w+)'
+        r'|mod[ \t]+(?P<module>\w+)'
+        r'|type[ \t]+(?P<type>\w+)'
+        r'|impl(?:<[^>\n]*>)?[ \t]+(?:[\w:<>, ]+[ \t]+for[ \t]+)?(?P<impl>\w+))'
+    ),
+    'java': _C_LIKE_SYMBOLS,
+    'c': _C_LIKE_SYMBOLS,
+    'cpp': _C_LIKE_SYMBOLS,
+    'swift': _C_LIKE_SYMBOLS,
+    'kotlin': _C_LIKE_SYMBOLS,
+}
+
+# Words the loose method patterns would otherwise take for names
+NOT_SYMBOLS = {
+    'if', 'for', 'while', 'switch', 'catch', 'return', 'else', 'new', 'delete', 'sizeof', 'function',
+    'throw', 'await', 'typeof', 'super', 'this', 'do', 'try', 'with', 'elif', 'match', 'case',
+}
+
+# Kinds whose members are reported as methods
+CONTAINER_KINDS = {'class', 'interface', 'struct', 'trait', 'impl', 'object', 'enum'}
+
+# Structures named in the text appended to a code file, which is embedded with it
+MAX_LISTED_STRUCTURES = 20
+
+# A signature still continuing on the next line, so its body has not opened yet
+_CONTINUED = ('(', ',', '=', '>', '{', '\\')
+
 
 class CodeParser:
     """Parse source code files with syntax awareness"""
@@ -53,69 +133,131 @@ class CodeParser:
     
     def parse(self, file_path: str) -> str:
         """Parse a code file and return formatted content"""
+        return self.parse_code(file_path)[0]
+    
+    def parse_code(self, file_path: str, content: Optional[str] = None) -> Tuple[str, List[Dict]]:
+        """Parse a code file, or its already-read content, and return formatted content and the symbols it defines
+        
+        Each symbol has its name, kind, enclosing symbol, 1-based start and end
+        lines in the file, and the offset of its first line in the returned content.
+        """
         try:
             ext = os.path.splitext(file_path)[1].lower()
             
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
+            if content is None:
+                with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+                    content = f.read()
             
             # Get language
             lang = EXT_TO_LANG.get(ext, 'unknown')
             
             # Add file context
             file_name = os.path.basename(file_path)
-            formatted = f"[File: {file_name}]\n[Language: {lang}]\n\n{content}"
+            header = f"[File: {file_name}]\n[Language: {lang}]\n\n"
+            formatted = f"{header}{content}"
             
             # Extract important structures if possible
+            symbols = []
             try:
-                structures = self._extract_structures(content, lang, ext)
-                if structures:
-                    formatted = f"{formatted}\n\n[Structures: {structures}]"
+                symbols = self.extract_symbols(content, LANGUAGES.get(ext), offset=len(header))
+                if symbols:
+                    formatted = f"{formatted}\n\n[Structures: {self._list_structures(symbols)}]"
             except Exception as struct_error:
                 logger.warning(f"Could not extract structures from {file_path}: {struct_error}")
             
-            return formatted.strip()
+            return formatted.strip(), symbols
             
         except Exception as e:
             logger.error(f"Error parsing code file {file_path}: {e}", exc_info=True)
-            return ""
+            return "", []
     
-    def _extract_structures(self, content: str, lang: str, ext: str) -> str:
-        """Extract class and function definitions"""
-        structures = []
+    def extract_symbols(self, content: str, language: Optional[str], offset: int = 0) -> List[Dict]:
+        """Find class, function and other definitions and their line ranges in one pass over the lines
         
-        if lang == 'python':
-            # Find class definitions
-            classes = re.findall(r'^class\s+(\w+)', content, re.MULTILINE)
-            structures.extend([f"class {c}" for c in classes])
-            
-            # Find function definitions  
-            functions = re.findall(r'^def\s+(\w+)', content, re.MULTILINE)
-            structures.extend([f"def {f}" for f in functions])
-            
-        elif lang == 'javascript':
-            # Find class definitions
-            classes = re.findall(r'class\s+(\w+)', content)
-            structures.extend([f"class {c}" for c in classes])
-            
-            # Find function definitions
-            functions = re.findall(r'function\s+(\w+)', content)
-            structures.extend([f"function {f}" for f in functions])
+        Python bodies end where the indentation returns to the definition's; the
+        others end at the brace closing the one their definition opens. Braces and
+        quotes inside strings or comments are not told apart, so ranges are approximate.
+        """
+        pattern = SYMBOL_PATTERNS.get(language)
+        if pattern is None:
+            return []
+        indented = language == 'python'
+        
+        symbols: List[Dict] = []
+        # Symbols whose body is still open, innermost last, with the indent or brace depth they started at
+        open_symbols: List[Tuple[Dict, int]] = []
+        depth = 0
+        in_string = False
+        last_code_line = 0
+        position = offset
+        
+        for number, line in enumerate(content.splitlines(keepends=True), 1):
+            line_start = position
+            position += len(line)
+            stripped = line.strip()
             
-            # Find arrow functions assigned to const/let
-            arrow_funcs = re.findall(r'(?:const|let)\s+(\w+)\s*=\s*(?:async\s*)?\(', content)
-            structures.extend([f"const {f}" for f in arrow_funcs])
+            if indented:
+                # Lines inside a triple-quoted string neither open nor close anything
+                was_in_string = in_string
+                if (line.count('"""') + line.count("'''")) % 2:
+                    in_string = not in_string
+                if was_in_string or not stripped or stripped[0] in '#)]}':
+                    continue
+                level = len(line) - len(line.lstrip())
+                while open_symbols and open_symbols[-1][1] >= level:
+                    open_symbols.pop()[0]["end_line"] = last_code_line
+                last_code_line = number
             
-        elif lang == 'java':
-            # Find class definitions
-            classes = re.findall(r'class\s+(\w+)', content)
-            structures.extend([f"class {c}" for c in classes])
+            match = pattern.match(line)
+            name = match.group(match.lastgroup) if match and match.lastgroup else None
+            kind = match.lastgroup if name and name not in NOT_SYMBOLS else None
+            if kind is not None:
+                parent = open_symbols[-1][0] if open_symbols else None
+                in_container = parent is not None and parent["kind"] in CONTAINER_KINDS
+                if kind in ('function', 'variable') and in_container:
+                    kind = 'method'
+                elif kind == 'variable':
+                    kind = 'function'
+                elif kind == 'method' and not in_container and language != 'go':
+                    # The loose pattern is trusted in a class body, and for C-style functions at the top level
+                    kind = 'function' if parent is None and language not in ('javascript', 'typescript') else None
+            if kind is not None:
+                symbol = {
+                    "name": name,
+                    "kind": kind,
+                    "container": parent["name"] if parent is not None else None,
+                    "start_line": number,
+                    "end_line": number,
+                    "offset": line_start,
+                }
+                symbols.append(symbol)
+                open_symbols.append((symbol, level if indented else depth))
+                if kind == 'impl':
+                    # An impl block only groups methods; it defines nothing of its own
+                    symbols.pop()
             
-            # Find method definitions (simplified)
-            methods = re.findall(r'(?:public|private|protected)?\s*(?:static)?\s*\w+\s+(\w+)\s*\(', content)
-            structures.extend([f"method {m}" for m in methods if m not in ['if', 'for', 'while', 'switch']])
+            if not indented:
+                depth += line.count('{') - line.count('}')
+                while open_symbols:
+                    symbol, start_depth = open_symbols[-1]
+                    if depth > start_depth:
+                        symbol["opened"] = True
+                        break
+                    # Closed by its brace, or a one-line definition that never opened one
+                    if symbol.pop("opened", False) or not stripped.endswith(_CONTINUED):
+                        open_symbols.pop()
+                        symbol["end_line"] = number
+                    else:
+                        break
         
-        return ', '.join(structures[:20]) if structures else ""
+        for symbol, _ in open_symbols:
+            symbol.pop("opened", None)
+            symbol["end_line"] = last_code_line if indented else number
+        return symbols
+    
+    def _list_structures(self, symbols: List[Dict]) -> str:
+        """The first definitions of a file as "kind name" pairs"""
+        return ', '.join(f"{symbol['kind']} {symbol['name']}" for symbol in symbols[:MAX_LISTED_STRUCTURES])
     
     def parse_with_line_numbers(self, file_path: str) -> str:
         """Parse code file with line numbers for reference"""
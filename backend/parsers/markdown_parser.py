@@ -4,7 +4,7 @@ Markdown Parser with Obsidian-aware features
 import logging
 import os
 import re
-from typing import Optional
+from typing import List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -20,18 +20,34 @@ class MarkdownParser:
     
     def parse(self, file_path: str) -> str:
         """Parse a Markdown file and return clean text content"""
+        return self.parse_note(file_path)[0]
+    
+    def parse_note(self, file_path: str, content: Optional[str] = None) -> Tuple[str, List[str], List[str]]:
+        """Parse a Markdown file, or its already-read content, into clean text, its tags and its link targets"""
         try:
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
+            if content is None:
+                with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+                    content = f.read()
+            
+            tags = []
+            body = content
+            frontmatter_match = self.frontmatter_pattern.match(content)
+            if frontmatter_match:
+                tags.extend(self.extract_frontmatter_tags(frontmatter_match.group(1)))
+                body = content[frontmatter_match.end():]
+            tags.extend(self.extract_tags(body))
+            
+            # Links are read before _convert_wikilinks flattens them to plain text
+            links = list(dict.fromkeys(link.strip() for link in self.extract_wikilinks(body)))
             
             # Process the content
             content = self._process_content(content)
             
-            return content.strip()
+            return content.strip(), list(dict.fromkeys(tags)), links
             
         except Exception as e:
             logger.error(f"Error parsing markdown {file_path}: {e}", exc_info=True)
-            return ""
+            return "", [], []
     
     def _process_content(self, content: str) -> str:
         """Process Markdown content with Obsidian-aware features"""
@@ -86,6 +102,25 @@ class MarkdownParser:
         
         return ', '.join(parts)
     
+    def extract_frontmatter_tags(self, frontmatter: str) -> List[str]:
+        """Extract tags from a frontmatter tags: key, inline (a, b or [a, b]) or as a YAML list"""
+        lines = frontmatter.split('\n')
+        for i, line in enumerate(lines):
+            key, sep, value = line.partition(':')
+            if not sep or key.strip().lower() not in ('tags', 'tag'):
+                continue
+            
+            if value.strip():
+                items = re.split(r'[,\s]+', re.sub(r'[\[\]]', '', value))
+            else:
+                items = []
+                for item in lines[i + 1:]:
+                    if not item.strip().startswith('-'):
+                        break
+                    items.append(item.strip()[1:])
+            return [tag for tag in (item.strip().strip('"\'').lstrip('#') for item in items) if tag]
+        return []
+    
     def extract_tags(self, content: str) -> list:
         """Extract all #tags from content"""
         return self.tag_pattern.findall(content)
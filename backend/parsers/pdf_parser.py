@@ -25,10 +25,10 @@ class PDFParser:
                 raise
         return self._fitz
     
-    def parse(self, file_path: str) -> str:
-        """Parse a PDF file and return text content"""
+    def parse(self, file_path: str, data: Optional[bytes] = None) -> str:
+        """Parse a PDF file, or its already-read bytes, and return text content"""
         try:
-            doc = self.fitz.open(file_path)
+            doc = self.fitz.open(stream=data, filetype="pdf") if data is not None else self.fitz.open(file_path)
             text_parts = []
             
             for page_num, page in enumerate(doc, 1):
@@ -0,0 +1,221 @@
+"""
+Admission Controller - bound concurrent generations and queue the rest fairly
+"""
+import asyncio
+import logging
+import math
+import time
+import weakref
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Deque, Dict, Optional
+
+from services.metrics import ADMISSION_ACTIVE, ADMISSION_QUEUED, ADMISSION_REJECTED, ADMISSION_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Chat streams Ollama runs at once; matches its default OLLAMA_NUM_PARALLEL
+DEFAULT_MAX_ACTIVE = 4
+DEFAULT_MAX_QUEUED = 32
+DEFAULT_MAX_QUEUED_PER_CLIENT = 8
+
+# Longest a request waits for a slot before giving up
+DEFAULT_QUEUE_TIMEOUT_SECONDS = 60.0
+
+# Waiting clients hear their position at least this often, keeping SSE connections alive
+QUEUE_HEARTBEAT_SECONDS = 10.0
+
+# Starting guess for how long a request holds its slot, refined as requests finish
+INITIAL_SERVICE_SECONDS = 5.0
+SERVICE_TIME_SMOOTHING = 0.2
+
+
+class AdmissionRejected(Exception):
+    """The wait queue is full; the caller should retry later"""
+    
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class QueueTimeout(Exception):
+    """A queued request waited longer than the queue timeout"""
+    
+    def __init__(self, retry_after: int):
+        super().__init__("Timed out waiting for a free generation slot")
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """One request's place in the queue, then its hold on admitted slots"""
+    
+    def __init__(self, controller: "AdmissionController", client_id: str, weight: int):
+        self.controller = controller
+        self.client_id = client_id
+        self.weight = weight
+        self.enqueued_at = time.monotonic()
+        self.admitted_at: Optional[float] = None
+        self.released = False
+        self._moved = asyncio.Event()
+    
+    @property
+    def admitted(self) -> bool:
+        return self.admitted_at is not None
+    
+    def position(self) -> int:
+        """Requests that will be admitted before this one; 0 once admitted"""
+        return 0 if self.admitted else self.controller.position(self)
+    
+    async def wait(self) -> AsyncIterator[int]:
+        """Yield the queue position whenever it changes until admitted"""
+        deadline = self.enqueued_at + self.controller.queue_timeout
+        last = None
+        while True:
+            # Cleared before looking, so an admission while the caller handles a yield still wakes the wait
+            self._moved.clear()
+            if self.admitted:
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.release()
+                ADMISSION_REJECTED.labels(reason="queue_timeout").inc()
+                raise QueueTimeout(self.controller.retry_after())
+            
+            position = self.position()
+            if position != last:
+                last = position
+                yield position
+            
+            try:
+                await asyncio.wait_for(self._moved.wait(), min(remaining, QUEUE_HEARTBEAT_SECONDS))
+            except asyncio.TimeoutError:
+                # Repeat the position as a heartbeat
+                last = None
+    
+    def release(self) -> None:
+        """Leave the queue or free the slots; safe to call more than once"""
+        if not self.released:
+            self.released = True
+            self.controller._release(self)
+    
+    def bind(self, owner) -> None:
+        """Release automatically once owner is garbage collected, e.g. a response body never iterated"""
+        weakref.finalize(owner, self.release)
+
+
+class AdmissionController:
+    """Admit up to max_active weighted requests; queue the rest per client and admit them round robin"""
+    
+    def __init__(
+        self,
+        max_active: int = DEFAULT_MAX_ACTIVE,
+        max_queued: int = DEFAULT_MAX_QUEUED,
+        max_queued_per_client: int = DEFAULT_MAX_QUEUED_PER_CLIENT,
+        queue_timeout: float = DEFAULT_QUEUE_TIMEOUT_SECONDS
+    ):
+        self.max_active = max(1, max_active)
+        self.max_queued = max_queued
+        self.max_queued_per_client = max_queued_per_client
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.service_seconds = INITIAL_SERVICE_SECONDS
+        # Client id -> its waiting tickets; dispatch rotates through clients
+        self._queues: "OrderedDict[str, Deque[Ticket]]" = OrderedDict()
+        self._queued = 0
+    
+    def enqueue(self, client_id: str, weight: int = 1) -> Ticket:
+        """Take a slot now or join the queue; raises AdmissionRejected when the queue is full"""
+        weight = min(max(1, weight), self.max_active)
+        ticket = Ticket(self, client_id, weight)
+        
+        if self._queued == 0 and self.active + weight <= self.max_active:
+            self._admit(ticket)
+            return ticket
+        
+        if self._queued >= self.max_queued:
+            self._reject("queue_full", "Too many queued requests")
+        client_queue = self._queues.get(client_id)
+        if client_queue is not None and len(client_queue) >= self.max_queued_per_client:
+            self._reject("client_queue_full", "Too many queued requests from this client")
+        
+        self._queues.setdefault(client_id, deque()).append(ticket)
+        self._queued += 1
+        ADMISSION_QUEUED.inc()
+        return ticket
+    
+    def position(self, ticket: Ticket) -> int:
+        """Place in the round-robin admission order, counting from 1"""
+        queues = [list(queue) for queue in self._queues.values()]
+        position = 0
+        for depth in range(max((len(queue) for queue in queues), default=0)):
+            for queue in queues:
+                if depth < len(queue):
+                    position += 1
+                    if queue[depth] is ticket:
+                        return position
+        return position
+    
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to free up for a new request"""
+        backlog = self._queued + self.active
+        return max(1, math.ceil(self.service_seconds * backlog / self.max_active))
+    
+    def stats(self) -> Dict:
+        return {
+            "active": self.active,
+            "max_active": self.max_active,
+            "queued": self._queued,
+            "max_queued": self.max_queued,
+            "clients_waiting": len(self._queues),
+            "service_seconds": round(self.service_seconds, 2),
+        }
+    
+    def _reject(self, reason: str, message: str) -> None:
+        ADMISSION_REJECTED.labels(reason=reason).inc()
+        logger.warning(f"Rejected request: {message} ({self._queued} queued, {self.active} active)")
+        raise AdmissionRejected(message, self.retry_after())
+    
+    def _admit(self, ticket: Ticket) -> None:
+        ticket.admitted_at = time.monotonic()
+        self.active += ticket.weight
+        ADMISSION_ACTIVE.set(self.active)
+        ADMISSION_WAIT_SECONDS.observe(ticket.admitted_at - ticket.enqueued_at)
+        ticket._moved.set()
+    
+    def _release(self, ticket: Ticket) -> None:
+        if ticket.admitted:
+            self.active -= ticket.weight
+            ADMISSION_ACTIVE.set(self.active)
+            held = time.monotonic() - ticket.admitted_at
+            self.service_seconds += SERVICE_TIME_SMOOTHING * (held - self.service_seconds)
+        else:
+            queue = self._queues.get(ticket.client_id)
+            if queue is not None and ticket in queue:
+                queue.remove(ticket)
+                self._queued -= 1
+                ADMISSION_QUEUED.dec()
+                if not queue:
+                    del self._queues[ticket.client_id]
+        self._dispatch()
+        
+        # Everyone still waiting may have moved up
+        for queue in self._queues.values():
+            for waiting in queue:
+                waiting._moved.set()
+    
+    def _dispatch(self) -> None:
+        """Admit waiting tickets round robin while they fit"""
+        while self._queues:
+            client_id, queue = next(iter(self._queues.items()))
+            # The next client's head must fit, so heavy requests are not starved by light ones
+            if self.active + queue[0].weight > self.max_active:
+                break
+            
+            ticket = queue.popleft()
+            self._queued -= 1
+            ADMISSION_QUEUED.dec()
+            del self._queues[client_id]
+            if queue:
+                # Back of the rotation
+                self._queues[client_id] = queue
+            self._admit(ticket)
@@ -0,0 +1,301 @@
+"""
+Answer Cache - replay answers to repeated questions over unchanged sources
+
+Entries persist as JSON next to an .npz of their query embeddings. Saves are
+debounced onto a timer thread, so a new answer never waits for the write.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Set
+
+import numpy as np
+
+from services.metrics import ANSWER_CACHE_LOOKUPS
+from services.storage import atomic_write_json, load_json
+
+logger = logging.getLogger(__name__)
+
+# Cosine similarity between query embeddings above which two questions share an
+# answer. Rephrasings like "how do I deploy X" / "how to deploy X" land above it
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+
+MAX_ENTRIES = 256
+
+# Words per replayed SSE token event
+REPLAY_WORDS_PER_EVENT = 4
+
+REPLAY_PIECE_PATTERN = re.compile(r'\s*\S+\s*')
+
+CACHE_VERSION = 2
+
+# Changes within this many seconds of each other are written together
+SAVE_DELAY_SECONDS = 2.0
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase and collapse whitespace and trailing punctuation for exact matching"""
+    return ' '.join(query.lower().split()).rstrip('?!. ')
+
+
+def source_fingerprint(sources: List[Dict]) -> str:
+    """Hash of the retrieved chunk ids and their text, independent of order"""
+    parts = sorted(
+        ','.join(source.get("chunk_ids", [])) + ':' + hashlib.sha1(source["content"].encode()).hexdigest()
+        for source in sources
+    )
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+
+def replay_tokens(answer: str, words_per_event: int = REPLAY_WORDS_PER_EVENT) -> Iterator[str]:
+    """Split a cached answer into token-stream pieces that join back to the exact text"""
+    pieces = REPLAY_PIECE_PATTERN.findall(answer)
+    for i in range(0, len(pieces), words_per_event):
+        yield ''.join(pieces[i:i + words_per_event])
+
+
+class AnswerCache:
+    """Answers keyed on model, retrieved chunks and query-embedding similarity"""
+    
+    def __init__(
+        self,
+        persist_path: Optional[str] = None,
+        threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+        max_entries: int = MAX_ENTRIES
+    ):
+        self.persist_path = persist_path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._lock = threading.RLock()
+        # Serializes writers, so the timer and an explicit flush never interleave files
+        self._save_lock = threading.Lock()
+        self._save_timer: Optional[threading.Timer] = None
+        
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        # (model, source fingerprint) -> entry keys; chunk id -> entry keys
+        self._buckets: Dict[tuple, Set[str]] = {}
+        self._by_chunk: Dict[str, Set[str]] = {}
+        
+        self.hits = 0
+        self.misses = 0
+        
+        if persist_path:
+            self._load()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def lookup(
+        self,
+        model: str,
+        query: str,
+        query_embedding: Optional[List[float]],
+        sources: List[Dict]
+    ) -> Optional[Dict]:
+        """Find a cached answer for this question over exactly these sources"""
+        if not sources:
+            return None
+        
+        with self._lock:
+            bucket = self._buckets.get((model, source_fingerprint(sources)), ())
+            normalized = normalize_query(query)
+            vector = _unit(query_embedding)
+            
+            best_key, best_similarity = None, self.threshold
+            for key in bucket:
+                entry = self._entries[key]
+                if entry["normalized_query"] == normalized:
+                    best_key, best_similarity = key, 1.0
+                    break
+                
+                # Lexical-only queries have no embedding and only match exactly
+                if vector is None or entry["embedding"] is None or len(entry["embedding"]) != len(vector):
+                    continue
+                similarity = float(np.dot(vector, entry["embedding"]))
+                if similarity >= best_similarity:
+                    best_key, best_similarity = key, similarity
+            
+            if best_key is None:
+                self.misses += 1
+                ANSWER_CACHE_LOOKUPS.labels(result="miss").inc()
+                return None
+            
+            self.hits += 1
+            ANSWER_CACHE_LOOKUPS.labels(result="hit").inc()
+            self._entries.move_to_end(best_key)
+            entry = self._entries[best_key]
+            entry["hits"] += 1
+            logger.info(f"Answer cache hit ({best_similarity:.3f}) for: {query[:60]}")
+            return {"answer": entry["answer"], "similarity": round(best_similarity, 4), "query": entry["query"]}
+    
+    def put(
+        self,
+        model: str,
+        query: str,
+        query_embedding: Optional[List[float]],
+        sources: List[Dict],
+        answer: str
+    ) -> None:
+        """Remember a complete answer"""
+        if not sources or not answer.strip():
+            return
+        
+        fingerprint = source_fingerprint(sources)
+        key = hashlib.sha1(f"{model}\0{fingerprint}\0{normalize_query(query)}".encode()).hexdigest()
+        vector = _unit(query_embedding)
+        
+        with self._lock:
+            self._remove(key)
+            self._insert(key, {
+                "model": model,
+                "fingerprint": fingerprint,
+                "query": query,
+                "normalized_query": normalize_query(query),
+                "embedding": vector,
+                "chunk_ids": sorted({chunk_id for source in sources for chunk_id in source.get("chunk_ids", [])}),
+                "file_paths": sorted({source["file_path"] for source in sources}),
+                "answer": answer,
+                "created_at": time.time(),
+                "hits": 0,
+            })
+            
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+            
+            self._schedule_save()
+    
+    def invalidate_chunks(self, chunk_ids: List[str]) -> int:
+        """Drop every answer that cited one of these chunks"""
+        with self._lock:
+            keys = set()
+            for chunk_id in chunk_ids:
+                keys |= self._by_chunk.get(chunk_id, set())
+            return self._invalidate(keys)
+    
+    def invalidate_folder(self, folder_path: str) -> int:
+        """Drop every answer that cited a file under this folder"""
+        prefix = os.path.join(folder_path, '')
+        with self._lock:
+            keys = {
+                key for key, entry in self._entries.items()
+                if any(path.startswith(prefix) for path in entry["file_paths"])
+            }
+            return self._invalidate(keys)
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+            self._by_chunk.clear()
+            self._schedule_save()
+    
+    def stats(self) -> Dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+    
+    def save(self) -> None:
+        """Write the cache now, cancelling a pending debounced save"""
+        if not self.persist_path:
+            return
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+            entries = [
+                {**{field: value for field, value in entry.items() if field != "embedding"}, "key": key}
+                for key, entry in self._entries.items()
+            ]
+            # Grouped by width, since answers may come from different embedding models
+            by_dim: Dict[int, List] = {}
+            for key, entry in self._entries.items():
+                if entry["embedding"] is not None:
+                    by_dim.setdefault(len(entry["embedding"]), []).append((key, entry["embedding"]))
+        
+        arrays = {}
+        for dim, pairs in by_dim.items():
+            arrays[f"keys_{dim}"] = np.asarray([key for key, _ in pairs])
+            arrays[f"vectors_{dim}"] = np.stack([vector for _, vector in pairs])
+        with self._save_lock:
+            try:
+                # Embeddings first: entries whose vector is missing still match exact questions
+                tmp_path = f"{self._embeddings_path}.{os.getpid()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    np.savez(f, **arrays)
+                os.replace(tmp_path, self._embeddings_path)
+                atomic_write_json(self.persist_path, {"version": CACHE_VERSION, "entries": entries})
+            except Exception as e:
+                logger.error(f"Failed to save answer cache: {e}")
+    
+    @property
+    def _embeddings_path(self) -> str:
+        return f"{os.path.splitext(self.persist_path)[0]}.npz"
+    
+    def _schedule_save(self) -> None:
+        if not self.persist_path:
+            return
+        with self._lock:
+            if self._save_timer is None:
+                self._save_timer = threading.Timer(SAVE_DELAY_SECONDS, self.save)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+    
+    def _load(self) -> None:
+        data = load_json(self.persist_path)
+        if not data or data.get("version") != CACHE_VERSION:
+            return
+        
+        vectors = {}
+        if os.path.exists(self._embeddings_path):
+            try:
+                with np.load(self._embeddings_path, allow_pickle=False) as saved:
+                    for name in saved.files:
+                        if name.startswith("keys_"):
+                            matrix = saved[f"vectors_{name[len('keys_'):]}"].astype(np.float32)
+                            vectors.update(zip(saved[name].tolist(), matrix))
+            except Exception as e:
+                logger.error(f"Failed to load answer cache embeddings: {e}")
+        
+        for entry in data.get("entries", []):
+            key = entry.pop("key")
+            entry["embedding"] = vectors.get(key)
+            self._insert(key, entry)
+        logger.info(f"Loaded {len(self._entries)} cached answers")
+    
+    def _invalidate(self, keys: Set[str]) -> int:
+        for key in keys:
+            self._remove(key)
+        if keys:
+            logger.info(f"Invalidated {len(keys)} cached answers")
+            self._schedule_save()
+        return len(keys)
+    
+    def _insert(self, key: str, entry: Dict) -> None:
+        self._entries[key] = entry
+        self._buckets.setdefault((entry["model"], entry["fingerprint"]), set()).add(key)
+        for chunk_id in entry["chunk_ids"]:
+            self._by_chunk.setdefault(chunk_id, set()).add(key)
+    
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        
+        bucket = (entry["model"], entry["fingerprint"])
+        self._buckets[bucket].discard(key)
+        if not self._buckets[bucket]:
+            del self._buckets[bucket]
+        
+        for chunk_id in entry["chunk_ids"]:
+            self._by_chunk[chunk_id].discard(key)
+            if not self._by_chunk[chunk_id]:
+                del self._by_chunk[chunk_id]
+
+
+def _unit(embedding: Optional[List[float]]) -> Optional[np.ndarray]:
+    if not embedding:
+        return None
+    vector = np.asarray(embedding, dtype=np.float32)
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
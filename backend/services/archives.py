@@ -0,0 +1,144 @@
+"""
+Archives - read supported files straight out of .zip and .tar bundles, without extracting them
+
+Members are decompressed one at a time into memory and handed to the parsers
+under a virtual path, "<archive>!/<member>", which is what the index stores as
+their file path. Zip files are read through their central directory and tar
+files as a stream, so neither needs seeking back or space on disk.
+"""
+import hashlib
+import logging
+import os
+import tarfile
+import zipfile
+import zlib
+from datetime import datetime
+from typing import Iterator, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+# Between an archive's path and a member's name in virtual paths
+ARCHIVE_SEPARATOR = "!/"
+
+# Members larger than this uncompressed are skipped
+MAX_MEMBER_BYTES = 20 * 1024 * 1024
+# Reading stops after this many members, or this many uncompressed bytes, per archive
+MAX_MEMBERS = 10_000
+MAX_ARCHIVE_BYTES = 1024 * 1024 * 1024
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class ArchiveError(Exception):
+    """An archive is unreadable or corrupt"""
+
+
+class ArchiveMember(NamedTuple):
+    """A supported file read from an archive"""
+    path: str
+    data: bytes
+    modified: float
+    
+    @property
+    def text(self) -> str:
+        return self.data.decode('utf-8', errors='ignore')
+
+
+def is_archive(path: str) -> bool:
+    return path.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def member_path(archive_path: str, name: str) -> str:
+    """Virtual path of an archive member"""
+    return f"{archive_path}{ARCHIVE_SEPARATOR}{name}"
+
+
+def split_member_path(path: str) -> Tuple[str, Optional[str]]:
+    """The archive and member name of a virtual path, or the path and None for a plain file"""
+    archive_path, separator, name = path.partition(ARCHIVE_SEPARATOR)
+    return (archive_path, name) if separator else (path, None)
+
+
+def file_sha256(path: str) -> str:
+    """Checksum of a file, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _member_name(name: str, extensions) -> Optional[str]:
+    """The member's normalized name if it is a supported, visible file, else None"""
+    name = name.replace("\\", "/").lstrip("/")
+    parts = [part for part in name.split("/") if part not in ("", ".")]
+    if not parts or any(part.startswith(".") or part == ".." for part in parts):
+        return None
+    if os.path.splitext(parts[-1])[1].lower() not in extensions:
+        return None
+    return "/".join(parts)
+
+
+def _zip_modified(info: zipfile.ZipInfo) -> float:
+    try:
+        return datetime(*info.date_time).timestamp()
+    except ValueError:
+        # Some writers leave the DOS date zeroed
+        return 0.0
+
+
+def _read_capped(f) -> Optional[bytes]:
+    """Read a member, or None if it turns out larger than its header said and over the limit"""
+    data = f.read(MAX_MEMBER_BYTES + 1)
+    return data if len(data) <= MAX_MEMBER_BYTES else None
+
+
+def iter_members(archive_path: str, extensions) -> Iterator[ArchiveMember]:
+    """Yield the archive's files with one of extensions, skipping oversized ones, within the archive limits"""
+    members = 0
+    total_bytes = 0
+    
+    def admit(name: str, size: int) -> bool:
+        nonlocal members, total_bytes
+        if size > MAX_MEMBER_BYTES:
+            logger.warning(f"Skipping {member_path(archive_path, name)}: {size} bytes exceeds {MAX_MEMBER_BYTES}")
+            return False
+        members += 1
+        total_bytes += size
+        return True
+    
+    def within_limits() -> bool:
+        if members < MAX_MEMBERS and total_bytes < MAX_ARCHIVE_BYTES:
+            return True
+        logger.warning(f"Stopping at {members} members ({total_bytes} bytes) of {archive_path}: archive limit reached")
+        return False
+    
+    try:
+        if archive_path.lower().endswith('.zip'):
+            with zipfile.ZipFile(archive_path) as archive:
+                for info in archive.infolist():
+                    name = None if info.is_dir() else _member_name(info.filename, extensions)
+                    if name is None or not admit(name, info.file_size):
+                        continue
+                    with archive.open(info) as f:
+                        data = _read_capped(f)
+                    if data is not None:
+                        yield ArchiveMember(member_path(archive_path, name), data, _zip_modified(info))
+                    if not within_limits():
+                        return
+        else:
+            # "r|*" reads the tar as a stream, with any compression, never seeking back
+            with tarfile.open(archive_path, mode="r|*") as archive:
+                for info in archive:
+                    name = _member_name(info.name, extensions) if info.isfile() else None
+                    if name is None or not admit(name, info.size):
+                        continue
+                    data = _read_capped(archive.extractfile(info))
+                    if data is not None:
+                        yield ArchiveMember(member_path(archive_path, name), data, float(info.mtime))
+                    if not within_limits():
+                        return
+    except (OSError, EOFError, zipfile.BadZipFile, tarfile.TarError, zlib.error) as e:
+        raise ArchiveError(f"Cannot read archive {archive_path}: {e}")
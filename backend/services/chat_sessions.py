@@ -0,0 +1,272 @@
+"""
+Chat Sessions - server-side conversations laid out for Ollama's prompt cache
+
+With a persist path, sessions live in SQLite so every API worker sees them: a
+turn may land on another worker than the one that created the session.
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from services.context_packer import SOURCE_SEPARATOR, estimate_tokens, format_source_block
+
+logger = logging.getLogger(__name__)
+
+# Idle sessions are dropped after this long; Ollama unloads the model (and its cache) sooner anyway
+SESSION_TTL_SECONDS = 30 * 60
+MAX_SESSIONS = 100
+
+# Context window requested for session chats. Ollama's default is small and it
+# silently drops the start of longer prompts, which would lose the cached prefix
+SESSION_NUM_CTX = 8192
+
+# When history outgrows this, the oldest turns are dropped in one go so the
+# prefix cache misses once per compaction instead of on every turn
+MAX_HISTORY_TOKENS = 6000
+HISTORY_TRIM_RATIO = 0.5
+
+CONTEXT_PREAMBLE = "Use the following context to answer the user's question:\n\n"
+MORE_CONTEXT_PREAMBLE = "Additional context for the next question:\n\n"
+
+
+def source_key(source: Dict) -> tuple:
+    """Identify a packed source by the chunk range it covers"""
+    return (
+        source.get("file_path"),
+        source.get("chunk_index", 0),
+        source.get("chunk_end", source.get("chunk_index", 0)),
+    )
+
+
+class ChatSession:
+    """One conversation whose message list is only ever appended to"""
+    
+    def __init__(self, session_id: str, model: str, system_prompt: str):
+        self.id = session_id
+        self.model = model
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        
+        # The system prompt is the first message and never changes, so every
+        # turn shares at least that prefix with the previous one
+        self.messages: List[Dict] = [{"role": "system", "content": system_prompt}]
+        self.message_tokens: List[int] = [estimate_tokens(system_prompt)]
+        
+        # Sources already in the conversation, numbered across the whole session
+        self.source_numbers: Dict[tuple, int] = {}
+        self.next_source_number = 1
+        self.turns = 0
+        
+        # One turn at a time, so concurrent requests can't interleave messages
+        self.lock = asyncio.Lock()
+    
+    @property
+    def tokens(self) -> int:
+        return sum(self.message_tokens)
+    
+    def add_context(self, sources: List[Dict]) -> List[Dict]:
+        """Append a context message for sources not yet in the conversation, returning them"""
+        new_sources = [source for source in sources if source_key(source) not in self.source_numbers]
+        if not new_sources:
+            return []
+        
+        blocks = []
+        for source in new_sources:
+            self.source_numbers[source_key(source)] = self.next_source_number
+            blocks.append(format_source_block(self.next_source_number, source))
+            self.next_source_number += 1
+        
+        preamble = CONTEXT_PREAMBLE if self.turns == 0 else MORE_CONTEXT_PREAMBLE
+        self._append("system", preamble + SOURCE_SEPARATOR.join(blocks))
+        return new_sources
+    
+    def add_user_message(self, content: str) -> None:
+        self._append("user", content)
+    
+    def add_assistant_message(self, content: str) -> None:
+        self._append("assistant", content)
+        self.turns += 1
+        self._compact()
+    
+    def to_dict(self) -> Dict:
+        """Everything needed to carry on the conversation, for storage"""
+        return {
+            "model": self.model,
+            "created_at": self.created_at,
+            "last_used": self.last_used,
+            "messages": self.messages,
+            "message_tokens": self.message_tokens,
+            "source_numbers": [[*key, number] for key, number in self.source_numbers.items()],
+            "next_source_number": self.next_source_number,
+            "turns": self.turns,
+        }
+    
+    @classmethod
+    def from_dict(cls, session_id: str, data: Dict) -> "ChatSession":
+        session = cls(session_id, data["model"], data["messages"][0]["content"])
+        session.created_at = data["created_at"]
+        session.last_used = data["last_used"]
+        session.messages = data["messages"]
+        session.message_tokens = data["message_tokens"]
+        session.source_numbers = {tuple(entry[:3]): entry[3] for entry in data["source_numbers"]}
+        session.next_source_number = data["next_source_number"]
+        session.turns = data["turns"]
+        return session
+    
+    def summary(self) -> Dict:
+        return {
+            "session_id": self.id,
+            "model": self.model,
+            "turns": self.turns,
+            "messages": len(self.messages),
+            "tokens": self.tokens,
+            "sources": len(self.source_numbers),
+            "created_at": self.created_at,
+            "last_used": self.last_used,
+        }
+    
+    def _append(self, role: str, content: str) -> None:
+        self.messages.append({"role": role, "content": content})
+        self.message_tokens.append(estimate_tokens(content))
+        self.last_used = time.time()
+    
+    def _compact(self) -> None:
+        """Drop the oldest messages after the system prompt once history is too long"""
+        if self.tokens <= MAX_HISTORY_TOKENS:
+            return
+        
+        target = MAX_HISTORY_TOKENS * HISTORY_TRIM_RATIO
+        cut = 1
+        remaining = self.tokens
+        while cut < len(self.messages) - 1 and remaining > target:
+            remaining -= self.message_tokens[cut]
+            cut += 1
+        
+        # Keep whole turns: start right after an answer, never between a question and its context
+        while cut < len(self.messages) - 1 and self.messages[cut - 1]["role"] != "assistant":
+            remaining -= self.message_tokens[cut]
+            cut += 1
+        
+        dropped = cut - 1
+        del self.messages[1:cut]
+        del self.message_tokens[1:cut]
+        
+        # Dropped sources can be sent again if a later question needs them
+        kept = "".join(message["content"] for message in self.messages if message["role"] == "system")
+        self.source_numbers = {
+            key: number for key, number in self.source_numbers.items()
+            if f"[Source {number}:" in kept
+        }
+        logger.info(f"Compacted session {self.id}: dropped {dropped} messages, {remaining} tokens left")
+
+
+class ChatSessionStore:
+    """Sessions with idle expiry and an LRU cap, in memory or shared through SQLite"""
+    
+    def __init__(
+        self,
+        ttl_seconds: float = SESSION_TTL_SECONDS,
+        max_sessions: int = MAX_SESSIONS,
+        persist_path: Optional[str] = None
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        # Sessions this process has used; with a database, a cached copy is
+        # replaced once another worker has saved a newer turn
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        
+        self.db = None
+        self._db_lock = threading.Lock()
+        if persist_path:
+            self.db = sqlite3.connect(persist_path, check_same_thread=False, timeout=10)
+            # Readers in one worker never wait on a writer in another
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, last_used REAL NOT NULL, data TEXT NOT NULL)"
+            )
+            self.db.commit()
+    
+    def create(self, model: str, system_prompt: str) -> ChatSession:
+        self._expire()
+        session = ChatSession(uuid.uuid4().hex, model, system_prompt)
+        self._sessions[session.id] = session
+        self.save(session)
+        
+        while len(self._sessions) > self.max_sessions:
+            evicted, _ = self._sessions.popitem(last=False)
+            logger.info(f"Evicted chat session {evicted}")
+        if self.db is not None:
+            with self._db_lock:
+                evicted = self.db.execute(
+                    "DELETE FROM sessions WHERE id NOT IN (SELECT id FROM sessions ORDER BY last_used DESC LIMIT ?)",
+                    (self.max_sessions,)
+                ).rowcount
+                self.db.commit()
+            if evicted:
+                logger.info(f"Evicted {evicted} chat sessions")
+        return session
+    
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        self._expire()
+        session = self._sessions.get(session_id)
+        if self.db is not None:
+            with self._db_lock:
+                row = self.db.execute("SELECT last_used, data FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            if row is None:
+                self._sessions.pop(session_id, None)
+                return None
+            if session is None or session.last_used < row[0]:
+                session = ChatSession.from_dict(session_id, json.loads(row[1]))
+                self._sessions[session_id] = session
+        if session is not None:
+            self._sessions.move_to_end(session_id)
+        return session
+    
+    def save(self, session: ChatSession) -> None:
+        """Persist a session after a turn, so the next one can run on any worker"""
+        if self.db is None:
+            return
+        with self._db_lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO sessions (id, last_used, data) VALUES (?, ?, ?)",
+                (session.id, session.last_used, json.dumps(session.to_dict()))
+            )
+            self.db.commit()
+    
+    def delete(self, session_id: str) -> bool:
+        deleted = self._sessions.pop(session_id, None) is not None
+        if self.db is not None:
+            with self._db_lock:
+                deleted = self.db.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount > 0
+                self.db.commit()
+        return deleted
+    
+    def list(self) -> List[ChatSession]:
+        self._expire()
+        if self.db is None:
+            return list(self._sessions.values())
+        with self._db_lock:
+            rows = self.db.execute("SELECT id FROM sessions ORDER BY last_used").fetchall()
+        return [session for session in (self.get(session_id) for (session_id,) in rows) if session is not None]
+    
+    def count(self) -> int:
+        self._expire()
+        if self.db is None:
+            return len(self._sessions)
+        with self._db_lock:
+            return self.db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+    
+    def _expire(self) -> None:
+        cutoff = time.time() - self.ttl_seconds
+        for session_id in [sid for sid, s in self._sessions.items() if s.last_used < cutoff]:
+            del self._sessions[session_id]
+        if self.db is not None:
+            with self._db_lock:
+                self.db.execute("DELETE FROM sessions WHERE last_used < ?", (cutoff,))
+                self.db.commit()
@@ -0,0 +1,106 @@
+"""
+Context Packer - fit retrieved sources into a per-model token budget
+"""
+import logging
+import math
+import re
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Word pieces, digit runs and single punctuation marks, roughly how BPE tokenizers split text
+TOKEN_PIECE_PATTERN = re.compile(r'[A-Za-z]+|[0-9]+|[^\sA-Za-z0-9]')
+
+# Long words split into several BPE tokens, about one per four characters
+CHARS_PER_TOKEN = 4
+
+# Tokens available for retrieved context, by model name or family. Ollama's
+# default context window is small, so these leave room for the system prompt,
+# the question and the answer.
+CONTEXT_BUDGETS = {
+    "llama3.2:1b": 1500,
+    "llama3.2": 2500,
+    "llama3.1": 2500,
+    "mistral": 2500,
+    "phi3": 2000,
+}
+DEFAULT_CONTEXT_BUDGET = 2000
+
+# A source is only cut down to fill the budget if nothing else fits
+MIN_TRUNCATED_TOKENS = 64
+
+SOURCE_SEPARATOR = "\n\n---\n\n"
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count without loading a model tokenizer"""
+    count = 0
+    for match in TOKEN_PIECE_PATTERN.finditer(text):
+        count += math.ceil(len(match.group(0)) / CHARS_PER_TOKEN)
+    return count
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text at the last piece boundary that stays within max_tokens"""
+    count = 0
+    end = 0
+    for match in TOKEN_PIECE_PATTERN.finditer(text):
+        count += math.ceil(len(match.group(0)) / CHARS_PER_TOKEN)
+        if count > max_tokens:
+            break
+        end = match.end()
+    return text[:end]
+
+
+def context_budget_for(model: str) -> int:
+    """Context token budget for a model, matching exact name first, then family"""
+    if model in CONTEXT_BUDGETS:
+        return CONTEXT_BUDGETS[model]
+    family = model.split(":")[0]
+    return CONTEXT_BUDGETS.get(family, DEFAULT_CONTEXT_BUDGET)
+
+
+def format_source_block(index: int, source: Dict) -> str:
+    """Render one source as it appears in the prompt"""
+    return f"[Source {index}: {source['file_name']}]\n{source['content']}"
+
+
+def pack_context(sources: List[Dict], budget: int) -> Tuple[List[Dict], int]:
+    """Greedily keep the highest-scoring sources whose full text fits the budget"""
+    ranked = sorted(range(len(sources)), key=lambda i: sources[i].get("score", 0), reverse=True)
+    separator_tokens = estimate_tokens(SOURCE_SEPARATOR)
+    
+    packed: Dict[int, Dict] = {}
+    used = 0
+    for i in ranked:
+        source = sources[i]
+        block_tokens = estimate_tokens(format_source_block(len(packed) + 1, source))
+        cost = block_tokens + (separator_tokens if packed else 0)
+        if used + cost <= budget:
+            packed[i] = {**source, "tokens": block_tokens}
+            used += cost
+    
+    # Never send an empty context just because the best source is long
+    if not packed and ranked:
+        source = sources[ranked[0]]
+        header_tokens = estimate_tokens(format_source_block(1, {**source, "content": ""}))
+        room = budget - header_tokens
+        if room >= MIN_TRUNCATED_TOKENS:
+            content = truncate_to_tokens(source["content"], room)
+            block_tokens = estimate_tokens(format_source_block(1, {**source, "content": content}))
+            packed[ranked[0]] = {**source, "content": content, "tokens": block_tokens, "truncated": True}
+            used = block_tokens
+    
+    logger.debug(f"Packed {len(packed)}/{len(sources)} sources into {used}/{budget} tokens")
+    
+    # Present packed sources in their original retrieval order
+    return [packed[i] for i in sorted(packed)], used
+
+
+def build_context(sources: List[Dict]) -> Optional[str]:
+    """Join packed sources into the context block sent to the model"""
+    if not sources:
+        return None
+    return SOURCE_SEPARATOR.join(
+        format_source_block(i, source) for i, source in enumerate(sources, 1)
+    )
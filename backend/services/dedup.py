@@ -0,0 +1,124 @@
+"""
+Chunk Deduplication - exact and near-duplicate detection with SimHash
+"""
+import hashlib
+import logging
+import re
+from typing import Dict, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+WORD_PATTERN = re.compile(r'\w+')
+
+# Per-file header lines added by CodeParser; copies of a file differ only here
+FILE_HEADER_PATTERN = re.compile(r'^\[(?:File|Language): [^\]\n]*\]\s*$', re.MULTILINE)
+
+SHINGLE_SIZE = 3
+SIMHASH_BITS = 64
+
+# Chunks within this many differing bits are near-duplicates; a one-word edit
+# to a 1000-character chunk typically moves 2-5 bits, unrelated text 20+
+HAMMING_THRESHOLD = 6
+
+# Four 16-bit bands, probed exactly and with each single bit flipped: any pair
+# within 7 bits has a band differing in at most one bit, so LSH never misses it
+LSH_BANDS = 4
+
+# Short chunks have too few shingles for a meaningful fingerprint
+MIN_SHINGLES_FOR_NEAR_DUP = 8
+
+
+def normalize_text(text: str) -> str:
+    """Drop file headers, lowercase and collapse whitespace so copies compare equal"""
+    return ' '.join(FILE_HEADER_PATTERN.sub('', text).lower().split())
+
+
+def simhash(text: str) -> int:
+    """64-bit SimHash over word shingles"""
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) >= SHINGLE_SIZE:
+        shingles = [' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+    else:
+        shingles = words
+    if not shingles:
+        return 0
+    
+    hashes = np.frombuffer(
+        b''.join(hashlib.blake2b(s.encode(), digest_size=8).digest() for s in shingles),
+        dtype=np.uint8
+    ).reshape(len(shingles), 8)
+    
+    # Each bit votes +1/-1 per shingle; the sign of the tally is the fingerprint bit
+    bits = np.unpackbits(hashes, axis=1).astype(np.int32)
+    tally = (2 * bits - 1).sum(axis=0)
+    
+    return int(np.packbits(tally > 0).view('>u8')[0])
+
+
+class ChunkDeduplicator:
+    """Group chunks that are exact or near-duplicates of an earlier chunk"""
+    
+    def __init__(self, hamming_threshold: int = HAMMING_THRESHOLD):
+        self.hamming_threshold = hamming_threshold
+    
+    def find_canonical(self, texts: List[str]) -> List[int]:
+        """Map each text to the index of the first text it duplicates (itself if unique)"""
+        canonical = list(range(len(texts)))
+        exact: Dict[str, int] = {}
+        fingerprints: Dict[int, int] = {}
+        band_buckets: List[Dict[int, List[int]]] = [{} for _ in range(LSH_BANDS)]
+        band_bits = SIMHASH_BITS // LSH_BANDS
+        band_mask = (1 << band_bits) - 1
+        
+        for i, text in enumerate(texts):
+            normalized = normalize_text(text)
+            
+            # Exact duplicates are the common case: license headers, copied files
+            digest = hashlib.sha1(normalized.encode()).hexdigest()
+            if digest in exact:
+                canonical[i] = exact[digest]
+                continue
+            exact[digest] = i
+            
+            if len(normalized.split()) < MIN_SHINGLES_FOR_NEAR_DUP + SHINGLE_SIZE - 1:
+                continue
+            
+            fingerprint = simhash(normalized)
+            bands = [(fingerprint >> (b * band_bits)) & band_mask for b in range(LSH_BANDS)]
+            
+            match = self._find_near(fingerprint, bands, band_buckets, fingerprints)
+            if match is not None:
+                canonical[i] = match
+                continue
+            
+            fingerprints[i] = fingerprint
+            for b, band in enumerate(bands):
+                band_buckets[b].setdefault(band, []).append(i)
+        
+        duplicates = sum(1 for i, c in enumerate(canonical) if c != i)
+        if duplicates:
+            logger.info(f"Found {duplicates} duplicate chunks out of {len(texts)}")
+        
+        return canonical
+    
+    def _find_near(
+        self,
+        fingerprint: int,
+        bands: List[int],
+        band_buckets: List[Dict[int, List[int]]],
+        fingerprints: Dict[int, int]
+    ):
+        band_bits = SIMHASH_BITS // LSH_BANDS
+        seen = set()
+        for b, band in enumerate(bands):
+            probes = [band] + [band ^ (1 << bit) for bit in range(band_bits)]
+            for probe in probes:
+                for candidate in band_buckets[b].get(probe, ()):
+                    if candidate in seen:
+                        continue
+                    seen.add(candidate)
+                    if bin(fingerprint ^ fingerprints[candidate]).count('1') <= self.hamming_threshold:
+                        return candidate
+        return None
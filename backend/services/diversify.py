@@ -0,0 +1,98 @@
+"""
+Result Diversification - maximal marginal relevance and adjacent-chunk merging
+"""
+import logging
+from typing import Dict, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Overlap sizes looked for between neighbouring chunks (indexer uses 200 characters);
+# shorter matches are more likely coincidence than shared text
+MAX_OVERLAP_SEARCH = 400
+MIN_OVERLAP = 20
+
+
+def mmr_select(embeddings: np.ndarray, relevance: np.ndarray, k: int, diversity: float) -> List[int]:
+    """Pick k indices balancing relevance against similarity to what is already picked"""
+    n = len(relevance)
+    if n == 0 or k <= 0:
+        return []
+    if diversity <= 0 or n <= 1:
+        return [int(i) for i in np.argsort(-relevance)[:k]]
+    
+    vectors = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    weight = 1.0 - diversity
+    
+    selected = [int(np.argmax(relevance))]
+    # Highest similarity of each candidate to any selected one, updated incrementally
+    max_similarity = vectors @ vectors[selected[0]]
+    available = np.ones(n, dtype=bool)
+    available[selected[0]] = False
+    
+    while len(selected) < min(k, n):
+        marginal = weight * relevance - diversity * max_similarity
+        marginal[~available] = -np.inf
+        best = int(np.argmax(marginal))
+        
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_similarity, vectors @ vectors[best], out=max_similarity)
+    
+    return selected
+
+
+def merge_adjacent(results: List[Dict]) -> List[Dict]:
+    """Merge hits on consecutive chunks of the same file into one de-overlapped passage"""
+    by_file: Dict[str, List[int]] = {}
+    for position, result in enumerate(results):
+        file_path = result["metadata"].get("file_path")
+        by_file.setdefault(file_path, []).append(position)
+    
+    # Each run of consecutive chunks collapses into its best-ranked member's slot
+    merged_at: Dict[int, Dict] = {}
+    for file_path, positions in by_file.items():
+        if file_path is None or len(positions) == 1:
+            for position in positions:
+                merged_at[position] = results[position]
+            continue
+        
+        positions.sort(key=lambda p: results[p]["metadata"].get("chunk_index", 0))
+        run = [positions[0]]
+        for position in positions[1:]:
+            previous = results[run[-1]]["metadata"].get("chunk_index", 0)
+            if results[position]["metadata"].get("chunk_index", 0) == previous + 1:
+                run.append(position)
+            else:
+                merged_at[min(run)] = _merge_run([results[p] for p in run])
+                run = [position]
+        merged_at[min(run)] = _merge_run([results[p] for p in run])
+    
+    return [merged_at[position] for position in sorted(merged_at)]
+
+
+def _merge_run(run: List[Dict]) -> Dict:
+    if len(run) == 1:
+        return run[0]
+    
+    content = run[0]["content"]
+    for result in run[1:]:
+        content += result["content"][_overlap(content, result["content"]):]
+    
+    first = run[0]
+    return {
+        **first,
+        "content": content,
+        "merged_ids": [result["id"] for result in run],
+        "score": max(result.get("score", 0) for result in run),
+        "metadata": {**first["metadata"], "chunk_end": run[-1]["metadata"].get("chunk_index", 0)},
+    }
+
+
+def _overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of left that is a prefix of right"""
+    for size in range(min(len(left), len(right), MAX_OVERLAP_SEARCH), MIN_OVERLAP - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
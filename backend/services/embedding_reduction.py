@@ -0,0 +1,199 @@
+"""
+Embedding Reduction - index-time dimensionality reduction for stored vectors
+"""
+import logging
+import os
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+REDUCTION_MODES = ("none", "matryoshka", "pca")
+
+# Keys recorded in collection metadata
+METADATA_MODE_KEY = "mnemora:reduction"
+METADATA_DIM_KEY = "mnemora:dim"
+
+# PCA needs a few samples per output dimension to give a stable projection
+PCA_SAMPLES_PER_DIM = 2
+
+# Embeddings sampled for the fit; the covariance of a few tens of thousands is as good as all of them
+PCA_MAX_FIT_SAMPLES = 50_000
+
+
+class EmbeddingReducer:
+    """Project embeddings to fewer dimensions before storing or searching them"""
+    
+    def __init__(self, mode: str = "none", dim: Optional[int] = None, state_path: Optional[str] = None):
+        if mode not in REDUCTION_MODES:
+            raise ValueError(f"Unknown reduction mode: {mode}. Expected one of {', '.join(REDUCTION_MODES)}")
+        if mode != "none" and not dim:
+            raise ValueError(f"Reduction mode {mode} needs a target dimension")
+        
+        self.mode = mode
+        self.dim = dim if mode != "none" else None
+        self.state_path = state_path
+        
+        # PCA projection, fitted once the store holds enough documents; until then vectors stay full width
+        self._mean: Optional[np.ndarray] = None
+        self._components: Optional[np.ndarray] = None
+        
+        if mode == "pca" and state_path and os.path.exists(state_path):
+            state = np.load(state_path)
+            self._mean = state["mean"]
+            self._components = state["components"]
+    
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "none"
+    
+    @property
+    def fitted(self) -> bool:
+        return self.mode != "pca" or self._components is not None
+    
+    @property
+    def min_samples(self) -> int:
+        """Embeddings needed for a stable PCA fit"""
+        return (self.dim or 0) * PCA_SAMPLES_PER_DIM
+    
+    def status(self) -> Dict:
+        """Whether stored vectors are reduced yet, for status endpoints"""
+        return {"mode": self.mode, "dim": self.dim, "fitted": self.fitted, "min_samples": self.min_samples}
+    
+    def to_metadata(self) -> Dict:
+        """Describe this reduction for the store's metadata"""
+        return {METADATA_MODE_KEY: self.mode, METADATA_DIM_KEY: self.dim or 0}
+    
+    @classmethod
+    def from_metadata(cls, metadata: Dict, state_path: Optional[str] = None) -> "EmbeddingReducer":
+        mode = metadata.get(METADATA_MODE_KEY, "none")
+        return cls(mode=mode, dim=metadata.get(METADATA_DIM_KEY) or None, state_path=state_path)
+    
+    def project_documents(self, embeddings: List[List[float]]) -> List[List[float]]:
+        """Project document embeddings; full width while the PCA projection is not fitted"""
+        if not self.enabled or len(embeddings) == 0 or not self.fitted:
+            return embeddings
+        return self._project(np.asarray(embeddings, dtype=np.float32)).tolist()
+    
+    def project_query(self, embedding: List[float]) -> List[float]:
+        """Project a query embedding the same way as the stored documents"""
+        if not self.enabled or not embedding:
+            return embedding
+        return self.project_queries([embedding])[0]
+    
+    def project_queries(self, embeddings: List[List[float]]) -> List[List[float]]:
+        if not self.enabled or len(embeddings) == 0 or not self.fitted:
+            # Unfitted, the store holds full-width vectors, so queries stay full width too
+            return embeddings
+        return self._project(np.asarray(embeddings, dtype=np.float32)).tolist()
+    
+    def get_state(self) -> Optional[Dict[str, np.ndarray]]:
+        """The fitted PCA projection, or None when there is nothing to carry over"""
+        if self.mode != "pca" or self._components is None:
+            return None
+        return {"mean": self._mean, "components": self._components}
+    
+    def set_state(self, mean, components) -> None:
+        """Install a PCA projection fitted elsewhere, e.g. the one a snapshot was built with"""
+        self._mean = np.asarray(mean, dtype=np.float32)
+        self._components = np.asarray(components, dtype=np.float32)
+        if self.state_path:
+            np.savez(self.state_path, mean=self._mean, components=self._components)
+    
+    def matches(self, metadata: Dict, state: Optional[Dict] = None) -> bool:
+        """Whether vectors projected by the described reduction are comparable with this one's"""
+        if (metadata.get(METADATA_MODE_KEY, "none"), metadata.get(METADATA_DIM_KEY) or None) != (self.mode, self.dim):
+            return False
+        ours = self.get_state()
+        if ours is None or state is None:
+            return ours is None and state is None
+        return all(np.allclose(ours[key], np.asarray(state[key], dtype=np.float32), atol=1e-5) for key in ours)
+    
+    def reset(self) -> None:
+        """Forget the fitted projection so the next corpus refits it"""
+        self._mean = None
+        self._components = None
+        if self.state_path and os.path.exists(self.state_path):
+            os.remove(self.state_path)
+    
+    def _project(self, vectors: np.ndarray) -> np.ndarray:
+        if self.mode == "matryoshka":
+            # Matryoshka-trained models front-load information, so a prefix is a usable embedding
+            return _normalize(vectors[:, :self.dim])
+        
+        return _normalize((_normalize(vectors) - self._mean) @ self._components.T)
+    
+    def fit(self, batches: Iterable[np.ndarray], total: int, seed: int = 0) -> bool:
+        """Fit the PCA projection on pages of the total stored full-width embeddings; False while there are too few
+        
+        A random sample of at most PCA_MAX_FIT_SAMPLES rows feeds a covariance accumulated page by
+        page, so memory stays at one page plus a full_dim x full_dim matrix however large the store.
+        """
+        if total < self.min_samples:
+            return False
+        
+        rng = np.random.default_rng(seed)
+        fraction = min(1.0, PCA_MAX_FIT_SAMPLES / total)
+        count = 0
+        total_sum = scatter = None
+        for batch in batches:
+            vectors = np.asarray(batch, dtype=np.float64)
+            if fraction < 1.0:
+                vectors = vectors[rng.random(len(vectors)) < fraction]
+            if total_sum is None:
+                if vectors.shape[1] < self.dim:
+                    raise ValueError(f"Cannot reduce {vectors.shape[1]}-d embeddings to {self.dim} dimensions")
+                total_sum = np.zeros(vectors.shape[1])
+                scatter = np.zeros((vectors.shape[1], vectors.shape[1]))
+            # Stores may hold normalized vectors, so fit and project on unit length alike
+            vectors = _normalize(vectors)
+            total_sum += vectors.sum(axis=0)
+            scatter += vectors.T @ vectors
+            count += len(vectors)
+        if count < self.min_samples:
+            return False
+        
+        mean = total_sum / count
+        covariance = scatter / count - np.outer(mean, mean)
+        # Eigenvectors of the covariance are the principal directions, in ascending order of variance
+        _, eigenvectors = np.linalg.eigh(covariance)
+        self._mean = mean.astype(np.float32)
+        self._components = np.ascontiguousarray(eigenvectors[:, ::-1][:, :self.dim].T).astype(np.float32)
+        logger.info(f"Fitted PCA projection {len(mean)} -> {self.dim} on {count} of {total} embeddings")
+        
+        if self.state_path:
+            np.savez(self.state_path, mean=self._mean, components=self._components)
+        return True
+
+
+def resolve_reducer(
+    recorded: Optional[Dict],
+    requested: Optional[EmbeddingReducer],
+    document_count: int,
+    state_path: Optional[str] = None
+) -> EmbeddingReducer:
+    """Pick the reduction for a store: whatever it was built with wins over the request"""
+    if recorded and METADATA_MODE_KEY in recorded:
+        reducer = EmbeddingReducer.from_metadata(recorded, state_path=state_path)
+        if requested and requested.enabled and (requested.mode, requested.dim) != (reducer.mode, reducer.dim):
+            logger.warning(
+                f"Index was built with reduction {reducer.mode}/{reducer.dim}; "
+                f"ignoring requested {requested.mode}/{requested.dim} until it is cleared"
+            )
+        return reducer
+    
+    if document_count > 0:
+        # Built before reduction existed, so it holds full-width vectors
+        if requested and requested.enabled:
+            logger.warning("Existing index holds full-dimension vectors; clear it to enable reduction")
+        return EmbeddingReducer(state_path=state_path)
+    
+    if requested is None:
+        return EmbeddingReducer(state_path=state_path)
+    return EmbeddingReducer(mode=requested.mode, dim=requested.dim, state_path=state_path)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
@@ -2,14 +2,31 @@
 Document Indexer - processes files and creates embeddings
 """
 import asyncio
+import bisect
 import hashlib
 import logging
 import os
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
+from services.answer_cache import AnswerCache
+from services.archives import ARCHIVE_SEPARATOR, ArchiveMember, file_sha256, is_archive, iter_members
+from services.dedup import ChunkDeduplicator
+from services.lexical_index import LexicalIndex
+from services.link_graph import LINK_SEPARATOR, LinkGraph
+from services.metadata_index import TAG_SEPARATOR, MetadataIndex
+from services.metrics import (
+    DEDUPLICATED_CHUNKS,
+    INDEX_FILE_ERRORS,
+    INDEX_STAGE_SECONDS,
+    INDEXED_CHUNKS,
+    INDEXED_FILES,
+)
 from services.ollama_client import OllamaClient
+from services.symbol_index import SymbolIndex, format_symbols
+from services.tracing import span
 from services.vector_store import VectorStore
 from parsers.markdown_parser import MarkdownParser
 from parsers.pdf_parser import PDFParser
@@ -36,12 +53,34 @@ MAX_CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
 
 
+@contextmanager
+def _stage(name: str):
+    """Time an indexing stage for /metrics and the request trace"""
+    with INDEX_STAGE_SECONDS.labels(stage=name).time(), span(name):
+        yield
+
+
 class DocumentIndexer:
     """Index documents from folders into the vector store"""
     
-    def __init__(self, vector_store: VectorStore, ollama_client: OllamaClient):
+    def __init__(
+        self,
+        vector_store: VectorStore,
+        ollama_client: OllamaClient,
+        lexical_index: Optional[LexicalIndex] = None,
+        answer_cache: Optional[AnswerCache] = None,
+        metadata_index: Optional[MetadataIndex] = None,
+        link_graph: Optional[LinkGraph] = None,
+        symbol_index: Optional[SymbolIndex] = None
+    ):
         self.vector_store = vector_store
         self.ollama = ollama_client
+        self.lexical_index = lexical_index
+        self.answer_cache = answer_cache
+        self.metadata_index = metadata_index
+        self.link_graph = link_graph
+        self.symbol_index = symbol_index
+        self.deduplicator = ChunkDeduplicator()
         
         # Initialize parsers
         self.markdown_parser = MarkdownParser()
@@ -60,51 +99,46 @@ class DocumentIndexer:
         if not files:
             return {"document_count": 0, "chunk_count": 0}
         
-        # Delete existing documents from this folder
-        self.vector_store.delete_by_folder(folder_path)
-        
         # Process each file
         all_chunks = []
+        kept = []
         for file_path in files:
             try:
-                chunks = await self._process_file(file_path, folder_path)
+                if is_archive(file_path):
+                    chunks, unchanged = await self._process_archive(file_path, folder_path)
+                    kept.extend(unchanged)
+                else:
+                    chunks = await self._process_file_traced(file_path, folder_path)
                 all_chunks.extend(chunks)
             except Exception as e:
                 logger.error(f"Failed to process {file_path}: {e}")
         
         logger.info(f"Created {len(all_chunks)} chunks from {len(files)} files")
         
-        if not all_chunks:
-            return {"document_count": len(files), "chunk_count": 0}
-        
-        # Generate embeddings in batches
-        texts = [chunk["text"] for chunk in all_chunks]
-        embeddings = await self.ollama.generate_embeddings_batch(texts)
-        
-        # Filter out failed embeddings
-        valid_chunks = []
-        valid_embeddings = []
-        for chunk, embedding in zip(all_chunks, embeddings):
-            if embedding:
-                valid_chunks.append(chunk)
-                valid_embeddings.append(embedding)
-        
-        if not valid_chunks:
-            logger.warning("No valid embeddings generated")
-            return {"document_count": len(files), "chunk_count": 0}
-        
-        # Add to vector store
-        ids = [chunk["id"] for chunk in valid_chunks]
-        documents = [chunk["text"] for chunk in valid_chunks]
-        metadatas = [chunk["metadata"] for chunk in valid_chunks]
+        valid_chunks, valid_embeddings = [], []
+        if all_chunks:
+            # Only one copy of each duplicate group needs an embedding
+            unique_chunks = self._deduplicate(all_chunks)
+            
+            # Generate embeddings in batches
+            embeddings = await self._embed_chunks(unique_chunks)
+            
+            # Share embeddings across duplicates, dropping failed ones
+            valid_chunks, valid_embeddings = self._attach_embeddings(all_chunks, unique_chunks, embeddings)
+            if not valid_chunks:
+                logger.warning("No valid embeddings generated")
         
-        self.vector_store.add_documents(ids, valid_embeddings, documents, metadatas)
+        # Replace the folder's documents, keeping those of unchanged archives
+        self._replace_folder(folder_path, kept)
+        if valid_chunks:
+            self._save_chunks(valid_chunks, valid_embeddings)
+        await self._save_indexes()
         
-        logger.info(f"Indexed {len(valid_chunks)} chunks from {len(files)} files")
+        logger.info(f"Indexed {len(valid_chunks)} chunks from {len(files)} files, kept {len(kept)} unchanged")
         
         return {
             "document_count": len(files),
-            "chunk_count": len(valid_chunks)
+            "chunk_count": len(valid_chunks) + len(kept)
         }
     
     async def index_folder_with_progress(self, folder_path: str):
@@ -125,19 +159,22 @@ class DocumentIndexer:
         if not files:
             return
         
-        # Delete existing documents from this folder
-        self.vector_store.delete_by_folder(folder_path)
-        
         # Process each file with progress
         all_chunks = []
+        kept = []
         skipped_files = []
         
         for idx, file_path in enumerate(files):
             file_name = os.path.basename(file_path)
             try:
-                chunks = await self._process_file(file_path, folder_path)
+                unchanged = []
+                if is_archive(file_path):
+                    chunks, unchanged = await self._process_archive(file_path, folder_path)
+                    kept.extend(unchanged)
+                else:
+                    chunks = await self._process_file_traced(file_path, folder_path)
                 
-                if not chunks:
+                if not chunks and not unchanged:
                     # File was parsed but produced no content (empty or unsupported)
                     skipped_files.append({
                         'file': file_name,
@@ -147,15 +184,18 @@ class DocumentIndexer:
                     logger.warning(f"Skipped {file_path}: No content extracted")
                 
                 all_chunks.extend(chunks)
-                yield {
+                event = {
                     'type': 'file_done',
                     'file': file_name,
                     'file_path': file_path,
-                    'chunks': len(chunks),
+                    'chunks': len(chunks) or len(unchanged),
                     'current': idx + 1,
                     'total': total_files,
                     'percent': round((idx + 1) / total_files * 100)
                 }
+                if unchanged:
+                    event['unchanged'] = True
+                yield event
             except Exception as e:
                 error_msg = str(e)
                 logger.error(f"Failed to process {file_path}: {error_msg}", exc_info=True)
@@ -169,63 +209,219 @@ class DocumentIndexer:
                 }
         
         if not all_chunks:
+            self._replace_folder(folder_path, kept)
+            await self._save_indexes()
             return
         
+        # Skip embedding duplicate chunks
+        unique_chunks = self._deduplicate(all_chunks)
+        yield {
+            'type': 'dedup',
+            'total_chunks': len(all_chunks),
+            'unique_chunks': len(unique_chunks),
+            'deduplicated': len(all_chunks) - len(unique_chunks)
+        }
+        
         # Generate embeddings
-        yield {'type': 'embedding', 'status': 'Generating embeddings...', 'total_chunks': len(all_chunks)}
+        yield {'type': 'embedding', 'status': 'Generating embeddings...', 'total_chunks': len(unique_chunks)}
         
-        texts = [chunk["text"] for chunk in all_chunks]
-        embeddings = await self.ollama.generate_embeddings_batch(texts)
+        embeddings = await self._embed_chunks(unique_chunks)
         
         # Filter valid
-        valid_chunks = []
-        valid_embeddings = []
-        for chunk, embedding in zip(all_chunks, embeddings):
-            if embedding:
-                valid_chunks.append(chunk)
-                valid_embeddings.append(embedding)
+        valid_chunks, valid_embeddings = self._attach_embeddings(all_chunks, unique_chunks, embeddings)
+        
+        # Replace the folder's documents only now, so an index cancelled by a client disconnect leaves them intact
+        self._replace_folder(folder_path, kept)
         
         if valid_chunks:
             yield {'type': 'embedding', 'status': 'Saving to database...', 'valid_chunks': len(valid_chunks)}
             
-            ids = [chunk["id"] for chunk in valid_chunks]
-            documents = [chunk["text"] for chunk in valid_chunks]
-            metadatas = [chunk["metadata"] for chunk in valid_chunks]
+            self._save_chunks(valid_chunks, valid_embeddings)
+        await self._save_indexes()
+        
+        logger.info(f"Indexed {len(valid_chunks)} chunks from {total_files} files, kept {len(kept)} unchanged")
+    
+    @property
+    def search_indexes(self) -> List:
+        """The indexes kept alongside the vector store that this indexer has"""
+        indexes = (self.lexical_index, self.metadata_index, self.link_graph, self.symbol_index)
+        return [index for index in indexes if index is not None]
+    
+    def remove_folder(self, folder_path: str, save: bool = True) -> int:
+        """Remove a folder from the vector store, the search indexes and cached answers"""
+        deleted = self.vector_store.delete_by_folder(folder_path)
+        for search_index in self.search_indexes:
+            search_index.delete_by_folder(folder_path, save=save)
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate_folder(folder_path)
+        return deleted
+    
+    def _replace_folder(self, folder_path: str, kept: List[Dict]) -> None:
+        """Remove a folder's documents, then put back the kept ones as they were stored; the caller saves the indexes"""
+        self.remove_folder(folder_path, save=False)
+        if not kept:
+            return
+        
+        ids = [document["id"] for document in kept]
+        documents = [document["content"] for document in kept]
+        metadatas = [document["metadata"] for document in kept]
+        # Stored vectors go back as they are, like a snapshot import
+        self.vector_store.restore_documents(ids, [document["embedding"] for document in kept], documents, metadatas)
+        for search_index in self.search_indexes:
+            search_index.add_documents(ids, documents, metadatas, save=False)
+    
+    async def _save_indexes(self) -> None:
+        """Write each search index once per folder, off the event loop; changes before it stay in memory"""
+        with _stage("save_indexes"):
+            for search_index in self.search_indexes:
+                await asyncio.to_thread(search_index.save)
+    
+    def _deduplicate(self, chunks: List[Dict]) -> List[Dict]:
+        """Tag each chunk with its duplicate group and return the ones that need embedding"""
+        with _stage("dedup"):
+            canonical = self.deduplicator.find_canonical([chunk["text"] for chunk in chunks])
             
-            self.vector_store.add_documents(ids, valid_embeddings, documents, metadatas)
+            unique_chunks = []
+            for i, chunk in enumerate(chunks):
+                chunk["metadata"]["dedup_group"] = chunks[canonical[i]]["id"]
+                if canonical[i] == i:
+                    unique_chunks.append(chunk)
+        
+        DEDUPLICATED_CHUNKS.inc(len(chunks) - len(unique_chunks))
+        return unique_chunks
+    
+    async def _embed_chunks(self, chunks: List[Dict]) -> List[List[float]]:
+        """Embed chunk texts in batches"""
+        with _stage("embed"):
+            return await self.ollama.generate_embeddings_batch([chunk["text"] for chunk in chunks])
+    
+    def _attach_embeddings(
+        self,
+        chunks: List[Dict],
+        unique_chunks: List[Dict],
+        embeddings: List[List[float]]
+    ) -> Tuple[List[Dict], List[List[float]]]:
+        """Give every chunk the embedding of its group, skipping groups that failed"""
+        by_group = {
+            chunk["id"]: embedding
+            for chunk, embedding in zip(unique_chunks, embeddings)
+            if embedding
+        }
+        
+        valid_chunks = []
+        valid_embeddings = []
+        for chunk in chunks:
+            embedding = by_group.get(chunk["metadata"]["dedup_group"])
+            if embedding:
+                valid_chunks.append(chunk)
+                valid_embeddings.append(embedding)
         
-        logger.info(f"Indexed {len(valid_chunks)} chunks from {total_files} files")
+        return valid_chunks, valid_embeddings
+    
+    def _save_chunks(self, chunks: List[Dict], embeddings: List[List[float]]) -> None:
+        """Write embedded chunks to the vector store and the search indexes"""
+        ids = [chunk["id"] for chunk in chunks]
+        documents = [chunk["text"] for chunk in chunks]
+        metadatas = [chunk["metadata"] for chunk in chunks]
+        
+        with _stage("vector_store"):
+            self.vector_store.add_documents(ids, embeddings, documents, metadatas)
+        
+        if self.lexical_index is not None:
+            with _stage("lexical_index"):
+                self.lexical_index.add_documents(ids, documents, metadatas, save=False)
+        for search_index in (self.metadata_index, self.link_graph, self.symbol_index):
+            if search_index is not None:
+                search_index.add_documents(ids, documents, metadatas, save=False)
+        INDEXED_CHUNKS.inc(len(ids))
+        
+        # Answers citing re-indexed chunks may no longer match their text
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate_chunks(ids)
     
     def _discover_files(self, folder_path: str) -> List[str]:
         """Discover all supported files in a folder"""
         files = []
         
-        for root, dirs, filenames in os.walk(folder_path):
-            # Skip hidden directories
-            dirs[:] = [d for d in dirs if not d.startswith('.')]
-            
-            for filename in filenames:
-                if filename.startswith('.'):
-                    continue
-                    
-                ext = os.path.splitext(filename)[1].lower()
-                if ext in SUPPORTED_EXTENSIONS:
-                    files.append(os.path.join(root, filename))
+        with _stage("discover"):
+            for root, dirs, filenames in os.walk(folder_path):
+                # Skip hidden directories
+                dirs[:] = [d for d in dirs if not d.startswith('.')]
+                
+                for filename in filenames:
+                    if filename.startswith('.'):
+                        continue
+                        
+                    ext = os.path.splitext(filename)[1].lower()
+                    if ext in SUPPORTED_EXTENSIONS or is_archive(filename):
+                        files.append(os.path.join(root, filename))
         
         return files
     
-    async def _process_file(self, file_path: str, folder_path: str) -> List[Dict]:
-        """Process a single file into chunks"""
+    async def _process_file_traced(
+        self,
+        file_path: str,
+        folder_path: str,
+        member: Optional[ArchiveMember] = None
+    ) -> List[Dict]:
+        """Process a file under its own span, so its parse and chunk stages nest below it"""
+        with span("file", path=file_path) as attrs:
+            chunks = await self._process_file(file_path, folder_path, member)
+            attrs["chunks"] = len(chunks)
+        return chunks
+    
+    async def _process_archive(self, archive_path: str, folder_path: str) -> Tuple[List[Dict], List[Dict]]:
+        """Process an archive's supported members into chunks, or return its stored chunks if it has not changed"""
+        with span("archive", path=archive_path) as attrs:
+            checksum = await asyncio.to_thread(file_sha256, archive_path)
+            unchanged = await asyncio.to_thread(self._unchanged_archive, archive_path, checksum)
+            if unchanged:
+                attrs["unchanged"] = len(unchanged)
+                return [], unchanged
+            
+            chunks = []
+            members = iter_members(archive_path, SUPPORTED_EXTENSIONS)
+            # Decompression runs off the event loop, one member at a time
+            while (member := await asyncio.to_thread(next, members, None)) is not None:
+                member_chunks = await self._process_file_traced(member.path, folder_path, member)
+                for chunk in member_chunks:
+                    chunk["metadata"]["archive_path"] = archive_path
+                    chunk["metadata"]["archive_sha256"] = checksum
+                chunks.extend(member_chunks)
+            attrs["chunks"] = len(chunks)
+        return chunks, []
+    
+    def _unchanged_archive(self, archive_path: str, checksum: str) -> List[Dict]:
+        """The stored chunks of an archive, with their vectors, if it was indexed with this checksum"""
+        if self.metadata_index is None:
+            return []
+        ids = self.metadata_index.ids_with_path_prefix(archive_path + ARCHIVE_SEPARATOR)
+        if not ids:
+            return []
+        documents = self.vector_store.get_documents(ids, include_embeddings=True)
+        if len(documents) < len(ids) or any(doc["metadata"].get("archive_sha256") != checksum for doc in documents):
+            return []
+        return documents
+    
+    async def _process_file(
+        self,
+        file_path: str,
+        folder_path: str,
+        member: Optional[ArchiveMember] = None
+    ) -> List[Dict]:
+        """Process a single file, or a member read from an archive, into chunks"""
         ext = os.path.splitext(file_path)[1].lower()
         
         try:
             # Get file content based on type
-            if ext == '.pdf':
-                content = self.pdf_parser.parse(file_path)
-            elif ext in {'.md', '.markdown'}:
-                content = self.markdown_parser.parse(file_path)
-            else:
-                content = self.code_parser.parse(file_path)
+            tags, links, symbols = [], [], []
+            with _stage("parse"):
+                if ext == '.pdf':
+                    content = self.pdf_parser.parse(file_path, member.data if member else None)
+                elif ext in {'.md', '.markdown'}:
+                    content, tags, links = self.markdown_parser.parse_note(file_path, member.text if member else None)
+                else:
+                    content, symbols = self.code_parser.parse_code(file_path, member.text if member else None)
             
             if not content.strip():
                 return []
@@ -241,9 +437,11 @@ class DocumentIndexer:
             
             # Chunk the content
             try:
-                chunks_text = self._chunk_text(content)
+                with _stage("chunk"):
+                    chunks_text = self._chunk_text(content)
             except MemoryError:
                 logger.error(f"MemoryError while chunking {file_path}, file too large")
+                INDEX_FILE_ERRORS.inc()
                 return []
             
             # Limit number of chunks per file
@@ -253,15 +451,19 @@ class DocumentIndexer:
                 chunks_text = chunks_text[:MAX_CHUNKS_PER_FILE]
             
             # Create chunk metadata
-            file_stat = os.stat(file_path)
+            modified = member.modified if member else os.stat(file_path).st_mtime
             base_metadata = {
                 "file_path": file_path,
                 "folder_path": folder_path,
                 "file_name": os.path.basename(file_path),
                 "file_type": ext[1:],  # Remove the dot
-                "modified_at": datetime.fromtimestamp(file_stat.st_mtime).isoformat(),
+                "modified_at": datetime.fromtimestamp(modified).isoformat(),
                 "indexed_at": datetime.now().isoformat(),
             }
+            if tags:
+                base_metadata["tags"] = TAG_SEPARATOR.join(tags)
+            
+            INDEXED_FILES.labels(file_type=ext[1:]).inc()
             
             # Create chunk objects
             chunks = []
@@ -276,16 +478,44 @@ class DocumentIndexer:
                         "total_chunks": len(chunks_text),
                     }
                 })
+            # The link graph reads a note's links from its first chunk only
+            if links:
+                chunks[0]["metadata"]["links"] = LINK_SEPARATOR.join(links)
+            for i, chunk_symbols in self._assign_symbols(content, chunks_text, symbols).items():
+                chunks[i]["metadata"]["symbols"] = format_symbols(chunk_symbols)
             
             return chunks
             
         except MemoryError as e:
             logger.error(f"MemoryError processing {file_path}: {e}", exc_info=True)
+            INDEX_FILE_ERRORS.inc()
             return []
         except Exception as e:
             logger.error(f"Error processing {file_path}: {e}", exc_info=True)
+            INDEX_FILE_ERRORS.inc()
             return []
     
+    def _assign_symbols(self, content: str, chunks_text: List[str], symbols: List[Dict]) -> Dict[int, List[Dict]]:
+        """Group symbols by the chunk their definition starts in"""
+        if not symbols:
+            return {}
+        
+        # Chunks are consecutive overlapping slices of content, so each is found just after the previous one
+        starts = []
+        position = 0
+        for chunk_text in chunks_text:
+            position = content.find(chunk_text, position)
+            starts.append(position)
+            position += 1
+        
+        by_chunk: Dict[int, List[Dict]] = {}
+        for symbol in symbols:
+            i = bisect.bisect_right(starts, symbol["offset"]) - 1
+            # Symbols past a truncated file's last chunk are dropped with it
+            if 0 <= i < len(chunks_text) and symbol["offset"] < starts[i] + len(chunks_text[i]):
+                by_chunk.setdefault(i, []).append(symbol)
+        return by_chunk
+    
     def _chunk_text(self, text: str) -> List[str]:
         """Split text into overlapping chunks"""
         if len(text) <= MAX_CHUNK_SIZE:
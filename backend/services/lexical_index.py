@@ -0,0 +1,220 @@
+"""
+Lexical Index - persisted BM25 inverted index for exact term matching
+"""
+import heapq
+import logging
+import math
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from services.storage import atomic_write_json, load_json
+
+logger = logging.getLogger(__name__)
+
+# Identifiers keep their inner separators (foo.bar, ERR_CONN_RESET, E-1234)
+TOKEN_PATTERN = re.compile(r'[A-Za-z0-9_]+(?:[.\-:][A-Za-z0-9_]+)*')
+SUBTOKEN_SPLIT = re.compile(r'[_.\-:]+')
+CAMEL_SPLIT = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+')
+
+MAX_TOKEN_LENGTH = 64
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Reciprocal rank fusion constant
+RRF_K = 60
+
+INDEX_VERSION = 1
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase terms, keeping whole identifiers and their parts"""
+    terms = []
+    for match in TOKEN_PATTERN.finditer(text):
+        token = match.group(0)
+        if len(token) > MAX_TOKEN_LENGTH:
+            continue
+        
+        terms.append(token.lower())
+        
+        # Also index the pieces of compound identifiers
+        parts = [p for p in SUBTOKEN_SPLIT.split(token) if p]
+        pieces = []
+        for part in parts:
+            pieces.extend(CAMEL_SPLIT.findall(part) or [part])
+        if len(pieces) > 1:
+            terms.extend(piece.lower() for piece in pieces)
+    
+    return terms
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """Fuse several ranked ID lists into one, best first"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class LexicalIndex:
+    """BM25 inverted index over chunk text, persisted as JSON"""
+    
+    def __init__(self, persist_path: str):
+        self.persist_path = persist_path
+        self._lock = threading.RLock()
+        
+        # term -> {doc_id: term frequency}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        # doc_id -> {term: term frequency}, kept for incremental deletes
+        self._doc_terms: Dict[str, Dict[str, int]] = {}
+        self._doc_lengths: Dict[str, int] = {}
+        self._doc_folders: Dict[str, str] = {}
+        self._total_length = 0
+        
+        self._load()
+        logger.info(f"LexicalIndex loaded with {len(self._doc_terms)} documents")
+    
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+    
+    def add_documents(self, ids: List[str], documents: List[str], metadatas: List[Dict], save: bool = True) -> None:
+        """Index documents, replacing any existing entries with the same IDs"""
+        if not ids:
+            return
+        
+        with self._lock:
+            for doc_id, document, metadata in zip(ids, documents, metadatas):
+                self._remove(doc_id)
+                term_counts = Counter(tokenize(document))
+                self._insert(doc_id, dict(term_counts), (metadata or {}).get("folder_path", ""))
+            if save:
+                self.save()
+        
+        logger.info(f"Added {len(ids)} documents to lexical index")
+    
+    def delete_ids(self, ids: List[str], save: bool = True) -> int:
+        """Remove documents by ID"""
+        with self._lock:
+            removed = sum(1 for doc_id in ids if self._remove(doc_id))
+            if removed and save:
+                self.save()
+        return removed
+    
+    def delete_by_folder(self, folder_path: str, save: bool = True) -> int:
+        """Remove all documents that belong to a folder"""
+        with self._lock:
+            ids = [doc_id for doc_id, folder in self._doc_folders.items() if folder == folder_path]
+        removed = self.delete_ids(ids, save=save)
+        if removed:
+            logger.info(f"Deleted {removed} documents from lexical index for {folder_path}")
+        return removed
+    
+    def search(self, query: str, top_k: int = 5, ids: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        """Return (doc_id, bm25 score) pairs for the best matching documents, only among ids when given"""
+        query_terms = set(tokenize(query))
+        if not query_terms or (ids is not None and not ids):
+            return []
+        
+        with self._lock:
+            doc_count = len(self._doc_terms)
+            if doc_count == 0:
+                return []
+            avg_length = self._total_length / doc_count
+            
+            # Statistics stay collection-wide, so a document scores the same with or without a filter
+            idfs = {}
+            for term in query_terms:
+                postings = self._postings.get(term)
+                if postings:
+                    df = len(postings)
+                    idfs[term] = (postings, math.log(1 + (doc_count - df + 0.5) / (df + 0.5)))
+            
+            scores: Dict[str, float] = {}
+            if ids is not None and len(ids) * len(idfs) < sum(len(postings) for postings, _ in idfs.values()):
+                # Fewer lookups than postings: look each candidate's terms up instead of walking the lists
+                for doc_id in ids:
+                    terms = self._doc_terms.get(doc_id)
+                    if terms is None:
+                        continue
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self._doc_lengths[doc_id] / avg_length)
+                    score = 0.0
+                    for term, (_, idf) in idfs.items():
+                        tf = terms.get(term)
+                        if tf:
+                            score += idf * tf * (BM25_K1 + 1) / (tf + norm)
+                    if score:
+                        scores[doc_id] = score
+            else:
+                allowed = set(ids) if ids is not None else None
+                for postings, idf in idfs.values():
+                    for doc_id, tf in postings.items():
+                        if allowed is not None and doc_id not in allowed:
+                            continue
+                        norm = BM25_K1 * (1 - BM25_B + BM25_B * self._doc_lengths[doc_id] / avg_length)
+                        scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+    
+    def clear(self) -> None:
+        """Remove everything from the index"""
+        with self._lock:
+            self._postings.clear()
+            self._doc_terms.clear()
+            self._doc_lengths.clear()
+            self._doc_folders.clear()
+            self._total_length = 0
+            self.save()
+    
+    def save(self) -> None:
+        """Persist the index to disk"""
+        with self._lock:
+            docs = {
+                doc_id: {"folder": self._doc_folders.get(doc_id, ""), "tf": terms}
+                for doc_id, terms in self._doc_terms.items()
+            }
+            try:
+                atomic_write_json(self.persist_path, {"version": INDEX_VERSION, "docs": docs})
+            except Exception as e:
+                logger.error(f"Failed to save lexical index: {e}")
+    
+    def _load(self) -> None:
+        """Load the index from disk and rebuild the postings lists"""
+        data = load_json(self.persist_path, default=None)
+        if not data or data.get("version") != INDEX_VERSION:
+            return
+        
+        for doc_id, entry in data.get("docs", {}).items():
+            self._insert(doc_id, entry.get("tf", {}), entry.get("folder", ""))
+    
+    def _insert(self, doc_id: str, term_counts: Dict[str, int], folder_path: str) -> None:
+        length = sum(term_counts.values())
+        self._doc_terms[doc_id] = term_counts
+        self._doc_lengths[doc_id] = length
+        self._doc_folders[doc_id] = folder_path
+        self._total_length += length
+        
+        for term, tf in term_counts.items():
+            self._postings.setdefault(term, {})[doc_id] = tf
+    
+    def _remove(self, doc_id: str) -> bool:
+        term_counts = self._doc_terms.pop(doc_id, None)
+        if term_counts is None:
+            return False
+        
+        self._total_length -= self._doc_lengths.pop(doc_id, 0)
+        self._doc_folders.pop(doc_id, None)
+        
+        for term in term_counts:
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+        
+        return True
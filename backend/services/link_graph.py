@@ -0,0 +1,303 @@
+"""
+Link Graph - Obsidian [[wikilinks]] and #tags between notes, for graph queries and link-expanded retrieval
+
+Built from chunk metadata like the other search indexes: the first chunk of a
+Markdown note carries its link targets and every chunk its tags. Links are
+kept as written and resolved when read, so a note indexed after the notes
+that link to it is found without revisiting them.
+"""
+import logging
+import os
+import threading
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from services.metadata_index import normalize_tag, parse_tags
+from services.storage import atomic_write_json, load_json
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+
+# Separates link targets in chunk metadata; it cannot occur in a target, where it starts the alias
+LINK_SEPARATOR = "|"
+
+MARKDOWN_EXTENSIONS = (".md", ".markdown")
+
+
+def link_key(target: str) -> str:
+    """Normalized link target: no heading or block reference, no .md, forward slashes, lowercase"""
+    target = target.split("#", 1)[0].strip().replace("\\", "/").strip("/")
+    for ext in MARKDOWN_EXTENSIONS:
+        if target.lower().endswith(ext):
+            target = target[:-len(ext)]
+            break
+    return target.lower()
+
+
+def parse_links(value) -> List[str]:
+    """Distinct normalized link targets from chunk metadata"""
+    if not value:
+        return []
+    raw = value.split(LINK_SEPARATOR) if isinstance(value, str) else value
+    return [key for key in dict.fromkeys(link_key(target) for target in raw) if key]
+
+
+def note_key(file_path: str, folder_path: str) -> str:
+    """The link key a file answers to: its path below the folder, without .md"""
+    relative = os.path.relpath(file_path, folder_path) if folder_path else os.path.basename(file_path)
+    return link_key(relative)
+
+
+class LinkGraph:
+    """Adjacency and tag maps over indexed files, persisted as JSON"""
+    
+    def __init__(self, persist_path: str):
+        self.persist_path = persist_path
+        self._lock = threading.RLock()
+        
+        # file_path -> {"folder", "key", "links", "tags", "chunks"}
+        self._notes: Dict[str, Dict] = {}
+        self._file_of: Dict[str, str] = {}
+        # Last component of a note key -> files, for resolving [[Name]] and [[dir/Name]]
+        self._by_name: Dict[str, Set[str]] = {}
+        # Link key as written -> files linking with it
+        self._linkers: Dict[str, Set[str]] = {}
+        self._by_tag: Dict[str, Set[str]] = {}
+        
+        self._load()
+        logger.info(f"LinkGraph loaded with {len(self._notes)} notes")
+    
+    def __len__(self) -> int:
+        return len(self._file_of)
+    
+    def add_documents(self, ids: List[str], documents: List[str], metadatas: List[Dict], save: bool = True) -> None:
+        """Add chunks to their files' nodes; a file's first chunk sets its links"""
+        if not ids:
+            return
+        
+        with self._lock:
+            for doc_id, metadata in zip(ids, metadatas):
+                metadata = metadata or {}
+                file_path = metadata.get("file_path")
+                if not file_path:
+                    continue
+                if self._file_of.get(doc_id, file_path) != file_path:
+                    self._remove_chunk(doc_id)
+                
+                note = self._notes.get(file_path)
+                if note is None:
+                    note = self._insert_note(file_path, metadata.get("folder_path", ""))
+                note["chunks"].add(doc_id)
+                self._file_of[doc_id] = file_path
+                self._set_tags(file_path, note, parse_tags(metadata.get("tags")))
+                if metadata.get("chunk_index", 0) == 0:
+                    self._set_links(file_path, note, parse_links(metadata.get("links")))
+            if save:
+                self.save()
+    
+    def delete_ids(self, ids: List[str], save: bool = True) -> int:
+        """Remove chunks by ID, and files left without chunks"""
+        with self._lock:
+            removed = sum(1 for doc_id in ids if self._remove_chunk(doc_id))
+            if removed and save:
+                self.save()
+        return removed
+    
+    def delete_by_folder(self, folder_path: str, save: bool = True) -> int:
+        """Remove every file of a folder"""
+        with self._lock:
+            ids = [
+                doc_id
+                for note in self._notes.values() if note["folder"] == folder_path
+                for doc_id in note["chunks"]
+            ]
+        return self.delete_ids(ids, save=save)
+    
+    def note(self, file_path: str) -> Optional[Dict]:
+        """A file's tags, resolved and unresolved outgoing links, and backlinks; None if not indexed"""
+        with self._lock:
+            note = self._notes.get(file_path)
+            if note is None:
+                return None
+            links, unresolved = self._outgoing(file_path, note)
+            return {
+                "file_path": file_path,
+                "tags": list(note["tags"]),
+                "links": links,
+                "unresolved": unresolved,
+                "backlinks": self._backlinks(file_path, note),
+            }
+    
+    def neighbors(self, file_path: str, depth: int = 1, limit: int = 200) -> List[Dict]:
+        """Files within depth links of a file, either direction, nearest first"""
+        with self._lock:
+            if file_path not in self._notes:
+                return []
+            distances = {file_path: 0}
+            queue = deque([file_path])
+            while queue and len(distances) <= limit:
+                current = queue.popleft()
+                if distances[current] >= depth:
+                    continue
+                for neighbor in self._adjacent(current):
+                    if neighbor not in distances:
+                        distances[neighbor] = distances[current] + 1
+                        queue.append(neighbor)
+            del distances[file_path]
+        
+        ordered = sorted(distances.items(), key=lambda item: (item[1], item[0]))[:limit]
+        return [{"file_path": path, "distance": distance} for path, distance in ordered]
+    
+    def linked_notes(self, file_paths: List[str], limit: int = 50) -> Dict[str, str]:
+        """Files one link away from any of file_paths, each mapped to the first of them it is linked with"""
+        linked: Dict[str, str] = {}
+        with self._lock:
+            exclude = set(file_paths)
+            for file_path in file_paths:
+                if file_path not in self._notes:
+                    continue
+                for neighbor in self._adjacent(file_path):
+                    if neighbor not in exclude and neighbor not in linked:
+                        linked[neighbor] = file_path
+                        if len(linked) >= limit:
+                            return linked
+        return linked
+    
+    def chunks_of(self, file_paths: Iterable[str]) -> Dict[str, str]:
+        """Chunk IDs of files, mapped to their file"""
+        with self._lock:
+            return {
+                doc_id: file_path
+                for file_path in file_paths if file_path in self._notes
+                for doc_id in self._notes[file_path]["chunks"]
+            }
+    
+    def tags(self) -> Dict[str, int]:
+        """Every tag with the number of files carrying it"""
+        with self._lock:
+            return {tag: len(files) for tag, files in sorted(self._by_tag.items())}
+    
+    def files_with_tag(self, tag: str) -> List[str]:
+        """Files carrying a tag, or a tag nested below it"""
+        with self._lock:
+            return sorted(self._by_tag.get(normalize_tag(tag), ()))
+    
+    def clear(self) -> None:
+        """Remove everything from the graph"""
+        with self._lock:
+            for postings in (self._notes, self._file_of, self._by_name, self._linkers, self._by_tag):
+                postings.clear()
+            self.save()
+    
+    def save(self) -> None:
+        """Persist the graph to disk"""
+        with self._lock:
+            notes = {
+                file_path: [note["folder"], note["links"], note["tags"], sorted(note["chunks"])]
+                for file_path, note in self._notes.items()
+            }
+            try:
+                atomic_write_json(self.persist_path, {"version": INDEX_VERSION, "notes": notes})
+            except Exception as e:
+                logger.error(f"Failed to save link graph: {e}")
+    
+    def _load(self) -> None:
+        data = load_json(self.persist_path, default=None)
+        if not data or data.get("version") != INDEX_VERSION:
+            return
+        for file_path, (folder, links, tags, chunks) in data.get("notes", {}).items():
+            note = self._insert_note(file_path, folder)
+            self._set_links(file_path, note, links)
+            self._set_tags(file_path, note, tags)
+            note["chunks"].update(chunks)
+            self._file_of.update((doc_id, file_path) for doc_id in chunks)
+    
+    def _insert_note(self, file_path: str, folder_path: str) -> Dict:
+        key = note_key(file_path, folder_path)
+        note = {"folder": folder_path, "key": key, "links": [], "tags": [], "chunks": set()}
+        self._notes[file_path] = note
+        self._by_name.setdefault(key.rpartition("/")[2], set()).add(file_path)
+        return note
+    
+    def _set_links(self, file_path: str, note: Dict, links: List[str]) -> None:
+        for key in note["links"]:
+            _discard(self._linkers, key, file_path)
+        note["links"] = list(links)
+        for key in links:
+            self._linkers.setdefault(key, set()).add(file_path)
+    
+    def _set_tags(self, file_path: str, note: Dict, tags: List[str]) -> None:
+        for tag in note["tags"]:
+            _discard(self._by_tag, tag, file_path)
+        note["tags"] = list(tags)
+        for tag in tags:
+            self._by_tag.setdefault(tag, set()).add(file_path)
+    
+    def _remove_chunk(self, doc_id: str) -> bool:
+        file_path = self._file_of.pop(doc_id, None)
+        if file_path is None:
+            return False
+        note = self._notes[file_path]
+        note["chunks"].discard(doc_id)
+        if not note["chunks"]:
+            self._set_links(file_path, note, [])
+            self._set_tags(file_path, note, [])
+            _discard(self._by_name, note["key"].rpartition("/")[2], file_path)
+            del self._notes[file_path]
+        return True
+    
+    def _resolve(self, key: str, source: str) -> Optional[str]:
+        """The file a link from source points to, picked like Obsidian: same folder first, then shortest path"""
+        candidates = self._by_name.get(key.rpartition("/")[2])
+        if not candidates:
+            return None
+        if "/" in key:
+            candidates = [
+                path for path in candidates
+                if self._notes[path]["key"] == key or self._notes[path]["key"].endswith("/" + key)
+            ]
+            if not candidates:
+                return None
+        if len(candidates) == 1:
+            return next(iter(candidates))
+        
+        source_folder = self._notes[source]["folder"] if source in self._notes else None
+        return min(
+            candidates,
+            key=lambda path: (self._notes[path]["folder"] != source_folder, len(self._notes[path]["key"]), path)
+        )
+    
+    def _outgoing(self, file_path: str, note: Dict) -> Tuple[List[str], List[str]]:
+        links, unresolved = [], []
+        for key in note["links"]:
+            target = self._resolve(key, file_path)
+            if target is None:
+                unresolved.append(key)
+            elif target != file_path and target not in links:
+                links.append(target)
+        return links, unresolved
+    
+    def _backlinks(self, file_path: str, note: Dict) -> List[str]:
+        # A link names a file by any path suffix of its key, e.g. [[plan]] or [[alpha/plan]]
+        parts = note["key"].split("/")
+        sources = set()
+        for i in range(len(parts)):
+            suffix = "/".join(parts[i:])
+            for source in self._linkers.get(suffix, ()):
+                if source != file_path and self._resolve(suffix, source) == file_path:
+                    sources.add(source)
+        return sorted(sources)
+    
+    def _adjacent(self, file_path: str) -> List[str]:
+        note = self._notes[file_path]
+        links, _ = self._outgoing(file_path, note)
+        return links + [source for source in self._backlinks(file_path, note) if source not in links]
+
+
+def _discard(postings: Dict[str, Set[str]], key: str, value: str) -> None:
+    values = postings.get(key)
+    if values is not None:
+        values.discard(value)
+        if not values:
+            del postings[key]
@@ -0,0 +1,258 @@
+"""
+Metadata Index - pre-built postings for filtering searches by folder, file type, path, tags and date
+
+Filters resolve here to the ids of matching chunks before any vector or BM25
+scoring, so a narrow filter shrinks the work instead of discarding most of a
+larger top-k afterwards.
+"""
+import bisect
+import fnmatch
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from services.archives import ARCHIVE_SEPARATOR
+from services.storage import atomic_write_json, load_json
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+
+# Chunk metadata stores tags as one comma-separated string, since Chroma only takes scalars
+TAG_SEPARATOR = ","
+
+# (folder_path, file_type, file_path, tags, modified timestamp)
+Entry = Tuple[str, str, str, Tuple[str, ...], Optional[float]]
+
+
+def normalize_tag(tag: str) -> str:
+    return tag.strip().strip('"\'').lstrip('#').lower()
+
+
+def parse_tags(value) -> List[str]:
+    """Normalized tags from chunk metadata, plus the parents of nested tags like project/alpha"""
+    if not value:
+        return []
+    raw = value.split(TAG_SEPARATOR) if isinstance(value, str) else value
+    tags = []
+    for tag in raw:
+        tag = normalize_tag(tag)
+        while tag and tag not in tags:
+            tags.append(tag)
+            tag = tag.rpartition("/")[0]
+    return tags
+
+
+def normalize_file_type(file_type: str) -> str:
+    return file_type.strip().lstrip(".").lower()
+
+
+def to_timestamp(value) -> Optional[float]:
+    """Seconds since the epoch from a datetime, an ISO 8601 string or a number; naive times are local"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    return value.timestamp()
+
+
+class MetadataIndex:
+    """Inverted indexes from metadata values to chunk ids, persisted as JSON"""
+    
+    def __init__(self, persist_path: str):
+        self.persist_path = persist_path
+        self._lock = threading.RLock()
+        
+        self._docs: Dict[str, Entry] = {}
+        self._by_folder: Dict[str, Set[str]] = {}
+        self._by_type: Dict[str, Set[str]] = {}
+        self._by_path: Dict[str, Set[str]] = {}
+        self._by_tag: Dict[str, Set[str]] = {}
+        # Sorted (timestamp, id) pairs, rebuilt on the first date filter after a change
+        self._by_modified: Optional[List[Tuple[float, str]]] = None
+        
+        self._load()
+        logger.info(f"MetadataIndex loaded with {len(self._docs)} documents")
+    
+    def __len__(self) -> int:
+        return len(self._docs)
+    
+    def add_documents(self, ids: List[str], documents: List[str], metadatas: List[Dict], save: bool = True) -> None:
+        """Index the metadata of documents, replacing any existing entries with the same IDs"""
+        if not ids:
+            return
+        
+        with self._lock:
+            for doc_id, metadata in zip(ids, metadatas):
+                self._remove(doc_id)
+                metadata = metadata or {}
+                self._insert(doc_id, (
+                    metadata.get("folder_path", ""),
+                    normalize_file_type(metadata.get("file_type", "")),
+                    metadata.get("file_path", ""),
+                    tuple(parse_tags(metadata.get("tags"))),
+                    to_timestamp(metadata.get("modified_at")),
+                ))
+            if save:
+                self.save()
+    
+    def delete_ids(self, ids: List[str], save: bool = True) -> int:
+        """Remove documents by ID"""
+        with self._lock:
+            removed = sum(1 for doc_id in ids if self._remove(doc_id))
+            if removed and save:
+                self.save()
+        return removed
+    
+    def delete_by_folder(self, folder_path: str, save: bool = True) -> int:
+        """Remove all documents that belong to a folder"""
+        with self._lock:
+            ids = list(self._by_folder.get(folder_path, ()))
+        return self.delete_ids(ids, save=save)
+    
+    def resolve(self, filters: Dict) -> Optional[List[str]]:
+        """IDs of the chunks matching every given filter, or None when nothing is filtered out
+        
+        Keys: folders, file_types and tags match any listed value; path_glob is an
+        fnmatch pattern on the file path; modified_after / modified_before bound the
+        file's modification time.
+        """
+        folders = filters.get("folders") or []
+        file_types = filters.get("file_types") or []
+        tags = filters.get("tags") or []
+        path_glob = filters.get("path_glob")
+        after = to_timestamp(filters.get("modified_after"))
+        before = to_timestamp(filters.get("modified_before"))
+        if not (folders or file_types or tags or path_glob or after is not None or before is not None):
+            return None
+        
+        with self._lock:
+            postings: List[Set[str]] = []
+            if folders:
+                postings.append(self._union(self._folder_ids(folder) for folder in folders))
+            if file_types:
+                postings.append(self._union(self._by_type.get(normalize_file_type(t), set()) for t in file_types))
+            if tags:
+                postings.append(self._union(self._by_tag.get(normalize_tag(tag), set()) for tag in tags))
+            if path_glob:
+                postings.append(self._union(
+                    ids for path, ids in self._by_path.items() if fnmatch.fnmatch(path, path_glob)
+                ))
+            
+            # Intersect smallest first, so the running set only shrinks
+            postings.sort(key=len)
+            matched = set(postings[0]) if postings else None
+            for ids in postings[1:]:
+                matched &= ids
+                if not matched:
+                    break
+            
+            if after is not None or before is not None:
+                matched = self._modified_between(matched, after, before)
+            
+            # Restricting the search to every chunk would only make it slower
+            if len(matched) == len(self._docs):
+                return None
+        
+        return list(matched)
+    
+    def ids_with_path_prefix(self, prefix: str) -> List[str]:
+        """IDs of the chunks of every file whose path starts with prefix, such as an archive's members"""
+        with self._lock:
+            return list(self._union(ids for path, ids in self._by_path.items() if path.startswith(prefix)))
+    
+    def clear(self) -> None:
+        """Remove everything from the index"""
+        with self._lock:
+            for postings in (self._docs, self._by_folder, self._by_type, self._by_path, self._by_tag):
+                postings.clear()
+            self._by_modified = None
+            self.save()
+    
+    def save(self) -> None:
+        """Persist the index to disk"""
+        with self._lock:
+            docs = {doc_id: [*entry[:3], list(entry[3]), entry[4]] for doc_id, entry in self._docs.items()}
+            try:
+                atomic_write_json(self.persist_path, {"version": INDEX_VERSION, "docs": docs})
+            except Exception as e:
+                logger.error(f"Failed to save metadata index: {e}")
+    
+    def _load(self) -> None:
+        data = load_json(self.persist_path, default=None)
+        if not data or data.get("version") != INDEX_VERSION:
+            return
+        for doc_id, (folder, file_type, file_path, tags, modified) in data.get("docs", {}).items():
+            self._insert(doc_id, (folder, file_type, file_path, tuple(tags), modified))
+    
+    def _insert(self, doc_id: str, entry: Entry) -> None:
+        folder, file_type, file_path, tags, _ = entry
+        self._docs[doc_id] = entry
+        self._by_folder.setdefault(folder, set()).add(doc_id)
+        self._by_type.setdefault(file_type, set()).add(doc_id)
+        self._by_path.setdefault(file_path, set()).add(doc_id)
+        for tag in tags:
+            self._by_tag.setdefault(tag, set()).add(doc_id)
+        self._by_modified = None
+    
+    def _remove(self, doc_id: str) -> bool:
+        entry = self._docs.pop(doc_id, None)
+        if entry is None:
+            return False
+        folder, file_type, file_path, tags, _ = entry
+        _discard(self._by_folder, folder, doc_id)
+        _discard(self._by_type, file_type, doc_id)
+        _discard(self._by_path, file_path, doc_id)
+        for tag in tags:
+            _discard(self._by_tag, tag, doc_id)
+        self._by_modified = None
+        return True
+    
+    def _folder_ids(self, folder: str) -> Set[str]:
+        """An indexed folder, or any directory or archive below one"""
+        if folder in self._by_folder:
+            return self._by_folder[folder]
+        prefixes = (folder.rstrip("/\\") + os.sep, folder + ARCHIVE_SEPARATOR)
+        return self._union(ids for path, ids in self._by_path.items() if path.startswith(prefixes))
+    
+    def _modified_between(self, matched: Optional[Set[str]], after: Optional[float], before: Optional[float]) -> Set[str]:
+        low = float("-inf") if after is None else after
+        high = float("inf") if before is None else before
+        
+        # A narrow set is cheaper to check entry by entry than to slice the date order
+        if matched is not None:
+            return {doc_id for doc_id in matched if _in_range(self._docs[doc_id][4], low, high)}
+        
+        if self._by_modified is None:
+            self._by_modified = sorted(
+                (entry[4], doc_id) for doc_id, entry in self._docs.items() if entry[4] is not None
+            )
+        start = bisect.bisect_left(self._by_modified, low, key=lambda item: item[0])
+        end = bisect.bisect_right(self._by_modified, high, key=lambda item: item[0])
+        return {doc_id for _, doc_id in self._by_modified[start:end]}
+    
+    @staticmethod
+    def _union(sets) -> Set[str]:
+        result: Set[str] = set()
+        for ids in sets:
+            result |= ids
+        return result
+
+
+def _discard(postings: Dict[str, Set[str]], key: str, doc_id: str) -> None:
+    ids = postings.get(key)
+    if ids is not None:
+        ids.discard(doc_id)
+        if not ids:
+            del postings[key]
+
+
+def _in_range(modified: Optional[float], low: float, high: float) -> bool:
+    return modified is not None and low <= modified <= high
@@ -0,0 +1,370 @@
+"""
+Metrics - in-process counters, gauges and histograms in Prometheus text format
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Seconds; covers sub-millisecond lexical lookups up to minute-long embedding runs
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 250, 500)
+
+
+class _Child:
+    """One labelled series; updates take a lock so worker threads can record too"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+
+
+class _CounterChild(_Child):
+    def __init__(self):
+        super().__init__()
+        self.value = 0.0
+    
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild(_Child):
+    def __init__(self):
+        super().__init__()
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+    
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+    
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+    
+    def set(self, value: float) -> None:
+        self.value = value
+    
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Read the value from function at scrape time instead"""
+        self.function = function
+    
+    def get(self) -> float:
+        return float(self.function()) if self.function is not None else self.value
+    
+    @contextmanager
+    def track_inprogress(self):
+        self.inc()
+        try:
+            yield
+        finally:
+            self.dec()
+
+
+class _HistogramChild(_Child):
+    def __init__(self, buckets: Tuple[float, ...]):
+        super().__init__()
+        self.buckets = buckets
+        # Per-bucket counts, made cumulative only when rendered; the last slot is +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+    
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+    
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class _Metric:
+    kind = ""
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], _Child] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._child_for(())
+        (registry or REGISTRY).register(self)
+    
+    def labels(self, **labels: str):
+        """The series for these label values, created on first use"""
+        key = tuple([str(labels[name]) for name in self.labelnames])
+        child = self._children.get(key)
+        if child is None:
+            child = self._child_for(key)
+        return child
+    
+    def _child_for(self, key: Tuple[str, ...]) -> _Child:
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+            return child
+    
+    def _new_child(self) -> _Child:
+        raise NotImplementedError
+    
+    def _label_text(self, key: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            children = sorted(self._children.items())
+        for key, child in children:
+            lines.extend(self._render_child(key, child))
+        return lines
+    
+    def _render_child(self, key: Tuple[str, ...], child: _Child) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+    
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+    
+    def inc(self, amount: float = 1.0) -> None:
+        self._default.inc(amount)
+    
+    def _render_child(self, key, child) -> List[str]:
+        return [f"{self.name}{self._label_text(key)} {_number(child.value)}"]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+    
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+    
+    def inc(self, amount: float = 1.0) -> None:
+        self._default.inc(amount)
+    
+    def dec(self, amount: float = 1.0) -> None:
+        self._default.dec(amount)
+    
+    def set(self, value: float) -> None:
+        self._default.set(value)
+    
+    def set_function(self, function: Callable[[], float]) -> None:
+        self._default.set_function(function)
+    
+    def track_inprogress(self):
+        return self._default.track_inprogress()
+    
+    def _render_child(self, key, child) -> List[str]:
+        try:
+            value = child.get()
+        except Exception:
+            # A failing source drops out of this scrape rather than breaking it
+            return []
+        return [f"{self.name}{self._label_text(key)} {_number(value)}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+    
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+        registry=None
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+    
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+    
+    def observe(self, value: float) -> None:
+        self._default.observe(value)
+    
+    def time(self):
+        return self._default.time()
+    
+    def _render_child(self, key, child) -> List[str]:
+        with child._lock:
+            counts = list(child.counts)
+            total = child.sum
+        
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else _number(bound)
+            labels = self._label_text(key, f'le="{le}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        lines.append(f"{self.name}_sum{self._label_text(key)} {_number(total)}")
+        lines.append(f"{self.name}_count{self._label_text(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """The set of metrics served by /metrics"""
+    
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+    
+    def register(self, metric: _Metric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+    
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# HTTP
+HTTP_REQUESTS = Counter(
+    "mnemora_http_requests_total", "HTTP requests by route and status", ["method", "route", "status"]
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "mnemora_http_request_duration_seconds",
+    "Time until the whole response, including streamed bodies, was sent",
+    ["method", "route"]
+)
+HTTP_IN_PROGRESS = Gauge("mnemora_http_requests_in_progress", "HTTP requests being handled")
+HTTP_DISCONNECTS = Counter(
+    "mnemora_http_client_disconnects_total", "Requests whose client left before the response finished", ["route"]
+)
+
+# Indexing
+INDEX_STAGE_SECONDS = Histogram(
+    "mnemora_index_stage_duration_seconds", "Time spent in each indexing stage per folder or file", ["stage"]
+)
+INDEXED_FILES = Counter("mnemora_indexed_files_total", "Files parsed and chunked", ["file_type"])
+INDEX_FILE_ERRORS = Counter("mnemora_index_file_errors_total", "Files that failed to parse or chunk")
+INDEXED_CHUNKS = Counter("mnemora_indexed_chunks_total", "Chunks written to the stores")
+DEDUPLICATED_CHUNKS = Counter("mnemora_deduplicated_chunks_total", "Chunks that reused a duplicate's embedding")
+
+# Querying
+QUERY_STAGE_SECONDS = Histogram(
+    "mnemora_query_stage_duration_seconds", "Time spent in each stage of search and query requests", ["stage"]
+)
+QUERY_MARK_SECONDS = Histogram(
+    "mnemora_query_mark_seconds",
+    "Time from the start of a request to a point such as the first token",
+    ["mark"]
+)
+BATCH_QUERIES_PENDING = Gauge("mnemora_batch_queries_pending", "Batch questions waiting for or being answered")
+
+# Admission control
+ADMISSION_ACTIVE = Gauge("mnemora_admission_active_slots", "Generation slots held by admitted requests")
+ADMISSION_QUEUED = Gauge("mnemora_admission_queued_requests", "Requests waiting for a generation slot")
+ADMISSION_REJECTED = Counter(
+    "mnemora_admission_rejected_total", "Requests turned away by admission control", ["reason"]
+)
+ADMISSION_WAIT_SECONDS = Histogram("mnemora_admission_wait_seconds", "Time requests waited for a slot")
+
+# Ollama
+OLLAMA_IN_FLIGHT = Gauge("mnemora_ollama_requests_in_flight", "Requests currently open against Ollama", ["endpoint"])
+OLLAMA_REQUEST_SECONDS = Histogram(
+    "mnemora_ollama_request_duration_seconds", "Ollama request latency, whole stream for chat", ["endpoint"]
+)
+OLLAMA_ERRORS = Counter("mnemora_ollama_errors_total", "Failed Ollama requests", ["endpoint"])
+OLLAMA_CANCELLED = Counter(
+    "mnemora_ollama_cancelled_total", "Ollama requests abandoned because their caller went away", ["endpoint"]
+)
+EMBEDDING_BATCH_SIZE = Histogram(
+    "mnemora_embedding_batch_size", "Texts per embedding batch sent to Ollama", buckets=SIZE_BUCKETS
+)
+EMBEDDING_QUEUE_DEPTH = Gauge("mnemora_embedding_queue_depth", "Texts waiting to be embedded")
+CHAT_TTFT_SECONDS = Histogram(
+    "mnemora_chat_time_to_first_token_seconds", "Time from sending a chat request to its first token", ["model"]
+)
+CHAT_TOKENS_PER_SECOND = Histogram(
+    "mnemora_chat_tokens_per_second", "Generation rate after the first token", ["model"], buckets=RATE_BUCKETS
+)
+CHAT_TOKENS = Counter("mnemora_chat_tokens_total", "Streamed chat tokens", ["model"])
+
+# Caches and stores
+ANSWER_CACHE_LOOKUPS = Counter("mnemora_answer_cache_lookups_total", "Answer cache lookups", ["result"])
+MODEL_WARM_CHECKS = Counter(
+    "mnemora_model_warm_checks_total", "Whether a query found its chat model already loaded", ["result"]
+)
+ANSWER_CACHE_ENTRIES = Gauge("mnemora_answer_cache_entries", "Cached answers")
+CHAT_SESSIONS = Gauge("mnemora_chat_sessions", "Active chat sessions")
+VECTOR_DOCUMENTS = Gauge("mnemora_vector_store_documents", "Chunks in the vector store")
+LEXICAL_DOCUMENTS = Gauge("mnemora_lexical_index_documents", "Chunks in the lexical index")
+
+# Startup
+STARTUP_SECONDS = Gauge(
+    "mnemora_startup_component_seconds", "Time each background-loaded component took to become ready", ["component"]
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware counting requests and timing them until the last body byte"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        state = {"code": 500, "complete": False, "disconnected": False}
+        
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["code"] = message["status"]
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                state["complete"] = True
+            await send(message)
+        
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.disconnect" and not state["complete"]:
+                state["disconnected"] = True
+            return message
+        
+        start = time.perf_counter()
+        HTTP_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            HTTP_IN_PROGRESS.dec()
+            # Route templates keep path parameters out of the label values
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            HTTP_REQUEST_SECONDS.labels(method=scope["method"], route=path).observe(time.perf_counter() - start)
+            HTTP_REQUESTS.labels(method=scope["method"], route=path, status=state["code"]).inc()
+            if state["disconnected"]:
+                HTTP_DISCONNECTS.labels(route=path).inc()
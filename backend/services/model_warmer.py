@@ -0,0 +1,72 @@
+"""
+Model Warmer - load chat models ahead of generation and keep them resident
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+from services.metrics import MODEL_WARM_CHECKS
+from services.ollama_client import OllamaClient
+
+logger = logging.getLogger(__name__)
+
+# How long Ollama keeps a model loaded after each warm-up or ping
+KEEP_ALIVE = "10m"
+
+# A model warmed this recently is assumed to still be loaded
+WARM_TTL_SECONDS = 120
+
+# Models used within the idle window are pinged this often so they never unload
+KEEPALIVE_INTERVAL_SECONDS = 240
+IDLE_AFTER_SECONDS = 30 * 60
+
+
+class ModelWarmer:
+    """Start model loads early and deduplicate them across concurrent requests"""
+    
+    def __init__(self, ollama: OllamaClient, keep_alive: str = KEEP_ALIVE):
+        self.ollama = ollama
+        self.keep_alive = keep_alive
+        self._warmed_at: Dict[str, float] = {}
+        self._used_at: Dict[str, float] = {}
+        self._pending: Dict[str, asyncio.Task] = {}
+    
+    def ensure_warm(self, model: str) -> Optional[asyncio.Task]:
+        """Begin loading a model in the background unless it is known to be loaded"""
+        now = time.monotonic()
+        self._used_at[model] = now
+        
+        if model in self._pending:
+            MODEL_WARM_CHECKS.labels(result="loading").inc()
+            return self._pending[model]
+        if now - self._warmed_at.get(model, float("-inf")) < WARM_TTL_SECONDS:
+            MODEL_WARM_CHECKS.labels(result="warm").inc()
+            return None
+        
+        MODEL_WARM_CHECKS.labels(result="cold").inc()
+        return self._start(model)
+    
+    async def run_keepalive(self) -> None:
+        """Ping recently used models until cancelled"""
+        while True:
+            await asyncio.sleep(KEEPALIVE_INTERVAL_SECONDS)
+            cutoff = time.monotonic() - IDLE_AFTER_SECONDS
+            for model in [m for m, used in self._used_at.items() if used >= cutoff]:
+                await (self._pending.get(model) or self._start(model))
+    
+    def _start(self, model: str) -> asyncio.Task:
+        task = asyncio.create_task(self._warm(model))
+        self._pending[model] = task
+        return task
+    
+    async def _warm(self, model: str) -> bool:
+        try:
+            start = time.perf_counter()
+            loaded = await self.ollama.warm_model(model, keep_alive=self.keep_alive)
+            if loaded:
+                self._warmed_at[model] = time.monotonic()
+                logger.debug(f"Warmed {model} in {(time.perf_counter() - start) * 1000:.0f}ms")
+            return loaded
+        finally:
+            self._pending.pop(model, None)
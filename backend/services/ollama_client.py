@@ -3,10 +3,26 @@ Ollama API Client for embeddings and chat completion
 """
 import asyncio
 import logging
+import time
+from contextlib import contextmanager
 from typing import AsyncGenerator, List, Optional
 
 import httpx
 
+from services.metrics import (
+    CHAT_TOKENS,
+    CHAT_TOKENS_PER_SECOND,
+    CHAT_TTFT_SECONDS,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_QUEUE_DEPTH,
+    OLLAMA_CANCELLED,
+    OLLAMA_ERRORS,
+    OLLAMA_IN_FLIGHT,
+    OLLAMA_REQUEST_SECONDS,
+)
+from services.streaming import loads
+from services.tracing import span
+
 logger = logging.getLogger(__name__)
 
 OLLAMA_BASE_URL = "http://localhost:11434"
@@ -19,27 +35,31 @@ class OllamaClient:
         self.base_url = base_url
         self.default_embedding_model = "nomic-embed-text"
         self.timeout = httpx.Timeout(60.0, connect=10.0)
+        # Loading CA certificates costs tens of milliseconds, so every client shares one context
+        self.ssl_context = httpx.create_ssl_context()
     
     async def check_health(self) -> bool:
         """Check if Ollama is running and responsive"""
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
+            async with httpx.AsyncClient(timeout=self.timeout, verify=self.ssl_context) as client:
                 response = await client.get(f"{self.base_url}/api/tags")
                 return response.status_code == 200
         except Exception as e:
+            _raise_if_cancelled(e)
             logger.warning(f"Ollama health check failed: {e}")
             return False
     
     async def list_models(self) -> List[dict]:
         """List available Ollama models"""
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
+            async with httpx.AsyncClient(timeout=self.timeout, verify=self.ssl_context) as client:
                 response = await client.get(f"{self.base_url}/api/tags")
                 if response.status_code == 200:
                     data = response.json()
                     return data.get("models", [])
                 return []
         except Exception as e:
+            _raise_if_cancelled(e)
             logger.error(f"Failed to list models: {e}")
             return []
     
@@ -58,7 +78,7 @@ class OllamaClient:
         logger.info(f"Starting to pull model: {model_name}")
         
         try:
-            async with httpx.AsyncClient(timeout=httpx.Timeout(600.0)) as client:
+            async with httpx.AsyncClient(timeout=httpx.Timeout(600.0), verify=self.ssl_context) as client:
                 async with client.stream(
                     "POST",
                     f"{self.base_url}/api/pull",
@@ -71,12 +91,12 @@ class OllamaClient:
                     async for line in response.aiter_lines():
                         if line:
                             try:
-                                import json
-                                data = json.loads(line)
+                                data = loads(line)
                                 yield data
                             except Exception:
                                 continue
         except Exception as e:
+            _raise_if_cancelled(e)
             logger.error(f"Error pulling model {model_name}: {e}")
             yield {"status": "error", "message": str(e)}
     
@@ -124,25 +144,47 @@ class OllamaClient:
             "recommended_embedding": "nomic-embed-text"
         }
     
+    async def warm_model(self, model: str, keep_alive: str = "10m") -> bool:
+        """Load a model into memory without generating, keeping it loaded for keep_alive"""
+        try:
+            with _track_request("generate"):
+                async with httpx.AsyncClient(timeout=httpx.Timeout(120.0, connect=10.0), verify=self.ssl_context) as client:
+                    response = await client.post(
+                        f"{self.base_url}/api/generate",
+                        json={"model": model, "keep_alive": keep_alive}
+                    )
+            if response.status_code != 200:
+                OLLAMA_ERRORS.labels(endpoint="generate").inc()
+            return response.status_code == 200
+        except Exception as e:
+            _raise_if_cancelled(e)
+            logger.warning(f"Failed to warm model {model}: {e}")
+            OLLAMA_ERRORS.labels(endpoint="generate").inc()
+            return False
+    
     async def generate_embedding(self, text: str, model: Optional[str] = None) -> List[float]:
         """Generate embedding for a single text"""
         model = model or self.default_embedding_model
         
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.base_url}/api/embeddings",
-                    json={"model": model, "prompt": text}
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    return data.get("embedding", [])
-                else:
-                    logger.error(f"Embedding failed: {response.text}")
-                    return []
+            with _track_request("embeddings"):
+                async with httpx.AsyncClient(timeout=self.timeout, verify=self.ssl_context) as client:
+                    response = await client.post(
+                        f"{self.base_url}/api/embeddings",
+                        json={"model": model, "prompt": text}
+                    )
+            
+            if response.status_code == 200:
+                data = response.json()
+                return data.get("embedding", [])
+            else:
+                logger.error(f"Embedding failed: {response.text}")
+                OLLAMA_ERRORS.labels(endpoint="embeddings").inc()
+                return []
         except Exception as e:
+            _raise_if_cancelled(e)
             logger.error(f"Embedding error: {e}")
+            OLLAMA_ERRORS.labels(endpoint="embeddings").inc()
             return []
     
     async def generate_embeddings_batch(
@@ -155,68 +197,139 @@ class OllamaClient:
         model = model or self.default_embedding_model
         embeddings = []
         
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i + batch_size]
-            batch_embeddings = await asyncio.gather(
-                *[self.generate_embedding(text, model) for text in batch]
-            )
-            embeddings.extend(batch_embeddings)
+        # Texts count as queued until their batch comes back
+        EMBEDDING_QUEUE_DEPTH.inc(len(texts))
+        try:
+            for i in range(0, len(texts), batch_size):
+                batch = texts[i:i + batch_size]
+                EMBEDDING_BATCH_SIZE.observe(len(batch))
+                batch_embeddings = await asyncio.gather(
+                    *[self.generate_embedding(text, model) for text in batch]
+                )
+                embeddings.extend(batch_embeddings)
+                EMBEDDING_QUEUE_DEPTH.dec(len(batch))
+        finally:
+            EMBEDDING_QUEUE_DEPTH.dec(len(texts) - len(embeddings))
         
         return embeddings
     
+    async def embed_many(self, texts: List[str], model: Optional[str] = None) -> List[List[float]]:
+        """Embed many texts in one /api/embed request, falling back to one request per text"""
+        model = model or self.default_embedding_model
+        if not texts:
+            return []
+        
+        try:
+            EMBEDDING_BATCH_SIZE.observe(len(texts))
+            with _track_request("embed", texts=len(texts)):
+                async with httpx.AsyncClient(timeout=self.timeout, verify=self.ssl_context) as client:
+                    response = await client.post(
+                        f"{self.base_url}/api/embed",
+                        json={"model": model, "input": texts}
+                    )
+            
+            if response.status_code == 200:
+                embeddings = response.json().get("embeddings", [])
+                if len(embeddings) == len(texts):
+                    return embeddings
+                logger.error(f"Batch embedding returned {len(embeddings)} vectors for {len(texts)} texts")
+                OLLAMA_ERRORS.labels(endpoint="embed").inc()
+            elif response.status_code != 404:
+                logger.error(f"Batch embedding failed: {response.text}")
+                OLLAMA_ERRORS.labels(endpoint="embed").inc()
+        except Exception as e:
+            _raise_if_cancelled(e)
+            logger.error(f"Batch embedding error: {e}")
+            OLLAMA_ERRORS.labels(endpoint="embed").inc()
+        
+        # Older Ollama versions only have /api/embeddings
+        return await self.generate_embeddings_batch(texts, model)
+    
     async def chat_stream(
         self,
         prompt: str,
         model: str = "llama3.2:3b",
         system_prompt: Optional[str] = None,
-        context: Optional[str] = None
+        context: Optional[str] = None,
+        messages: Optional[List[dict]] = None,
+        options: Optional[dict] = None
     ) -> AsyncGenerator[str, None]:
-        """Stream chat completion responses"""
-        
-        messages = []
+        """Stream chat completion responses, from a prompt or a prepared message list"""
         
-        # System prompt
-        if system_prompt:
-            messages.append({"role": "system", "content": system_prompt})
+        if messages is None:
+            messages = []
+            
+            # System prompt
+            if system_prompt:
+                messages.append({"role": "system", "content": system_prompt})
+            
+            # Add context as system message if provided
+            if context:
+                messages.append({
+                    "role": "system", 
+                    "content": f"Use the following context to answer the user's question:\n\n{context}"
+                })
+            
+            # User message
+            messages.append({"role": "user", "content": prompt})
         
-        # Add context as system message if provided
-        if context:
-            messages.append({
-                "role": "system", 
-                "content": f"Use the following context to answer the user's question:\n\n{context}"
-            })
+        payload = {
+            "model": model,
+            "messages": messages,
+            "stream": True
+        }
+        if options:
+            payload["options"] = options
         
-        # User message
-        messages.append({"role": "user", "content": prompt})
+        start = time.perf_counter()
+        first_token_at = None
+        tokens = 0
         
         try:
-            async with httpx.AsyncClient(timeout=httpx.Timeout(120.0)) as client:
-                async with client.stream(
-                    "POST",
-                    f"{self.base_url}/api/chat",
-                    json={
-                        "model": model,
-                        "messages": messages,
-                        "stream": True
-                    }
-                ) as response:
-                    if response.status_code != 200:
-                        yield f"Error: {response.status_code}"
-                        return
-                    
-                    async for line in response.aiter_lines():
-                        if line:
-                            try:
-                                import json
-                                data = json.loads(line)
-                                if "message" in data and "content" in data["message"]:
-                                    yield data["message"]["content"]
-                            except Exception:
-                                continue
+            with _track_request("chat", model=model, messages=len(messages)) as span_attrs:
+                async with httpx.AsyncClient(timeout=httpx.Timeout(120.0), verify=self.ssl_context) as client:
+                    async with client.stream(
+                        "POST",
+                        f"{self.base_url}/api/chat",
+                        json=payload
+                    ) as response:
+                        if response.status_code != 200:
+                            OLLAMA_ERRORS.labels(endpoint="chat").inc()
+                            yield f"Error: {response.status_code}"
+                            return
+                        
+                        async for line in response.aiter_lines():
+                            if line:
+                                try:
+                                    data = loads(line)
+                                    if "message" in data and "content" in data["message"]:
+                                        content = data["message"]["content"]
+                                        # The closing "done" line carries no content
+                                        if content:
+                                            if first_token_at is None:
+                                                first_token_at = time.perf_counter()
+                                                CHAT_TTFT_SECONDS.labels(model=model).observe(first_token_at - start)
+                                                span_attrs["ttft_ms"] = round((first_token_at - start) * 1000, 1)
+                                            tokens += 1
+                                            span_attrs["tokens"] = tokens
+                                        yield content
+                                except Exception:
+                                    continue
         
         except Exception as e:
+            _raise_if_cancelled(e)
             logger.error(f"Chat stream error: {e}")
+            OLLAMA_ERRORS.labels(endpoint="chat").inc()
             yield f"Error: {str(e)}"
+        
+        finally:
+            # Ollama streams one token per line; the rate excludes the wait for the first
+            if tokens:
+                CHAT_TOKENS.labels(model=model).inc(tokens)
+            if tokens > 1:
+                generating = time.perf_counter() - first_token_at
+                if generating > 0:
+                    CHAT_TOKENS_PER_SECOND.labels(model=model).observe((tokens - 1) / generating)
     
     async def chat(
         self,
@@ -230,3 +343,35 @@ class OllamaClient:
         async for token in self.chat_stream(prompt, model, system_prompt, context):
             full_response += token
         return full_response
+
+
+def _cancelling() -> bool:
+    """Whether the running task is being cancelled, however the cancellation surfaced"""
+    task = asyncio.current_task()
+    # Task.cancelling() is new in Python 3.11
+    return task is not None and getattr(task, "cancelling", lambda: 0)() > 0
+
+
+def _raise_if_cancelled(error: Exception) -> None:
+    """Re-raise a cancellation that surfaced as another exception, e.g. from anyio while connecting"""
+    if _cancelling():
+        raise asyncio.CancelledError() from error
+
+
+@contextmanager
+def _track_request(endpoint: str, **attrs):
+    """Count a request as in flight, time it and trace it; yields the span attributes"""
+    in_flight = OLLAMA_IN_FLIGHT.labels(endpoint=endpoint)
+    in_flight.inc()
+    start = time.perf_counter()
+    try:
+        with span(f"ollama.{endpoint}", **attrs) as span_attrs:
+            yield span_attrs
+    except BaseException as e:
+        # The caller went away, e.g. a client disconnect; the connection closes as this unwinds
+        if isinstance(e, (asyncio.CancelledError, GeneratorExit)) or _cancelling():
+            OLLAMA_CANCELLED.labels(endpoint=endpoint).inc()
+        raise
+    finally:
+        in_flight.dec()
+        OLLAMA_REQUEST_SECONDS.labels(endpoint=endpoint).observe(time.perf_counter() - start)
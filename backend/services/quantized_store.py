@@ -0,0 +1,637 @@
+"""
+Quantized Vector Store - exact cosine search over a memory-mapped embedding matrix
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services.embedding_reduction import EmbeddingReducer, METADATA_MODE_KEY, resolve_reducer
+from services.storage import atomic_write_json, load_json
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_DTYPES = ("float16", "int8")
+
+# Rows scored per matrix product; bounds the float32 scratch space per query (~24 MB at 768 dims)
+BLOCK_ROWS = 8192
+
+INITIAL_CAPACITY = 1024
+
+# Metadata operators understood by where filters
+COMPARISON_OPERATORS = {
+    "$eq": "=",
+    "$ne": "!=",
+    "$gt": ">",
+    "$gte": ">=",
+    "$lt": "<",
+    "$lte": "<=",
+}
+
+
+class QuantizedVectorStore:
+    """Exact brute-force vector search over float16 or int8 embeddings on disk"""
+    
+    def __init__(
+        self,
+        persist_directory: str,
+        dtype: str = "float16",
+        reducer: Optional[EmbeddingReducer] = None
+    ):
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"Unsupported dtype: {dtype}. Expected one of {', '.join(SUPPORTED_DTYPES)}")
+        
+        self.persist_directory = persist_directory
+        os.makedirs(persist_directory, exist_ok=True)
+        
+        self._lock = threading.RLock()
+        self._matrix_path = os.path.join(persist_directory, "embeddings.bin")
+        self._scales_path = os.path.join(persist_directory, "scales.bin")
+        self._meta_path = os.path.join(persist_directory, "store.json")
+        self._reduction_path = os.path.join(persist_directory, "reduction.npz")
+        
+        # Side table: row number -> id, document and metadata
+        self.db = sqlite3.connect(
+            os.path.join(persist_directory, "documents.sqlite3"),
+            check_same_thread=False
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, folder_path TEXT, "
+            "document TEXT, metadata TEXT)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS documents_folder ON documents(folder_path)")
+        self.db.commit()
+        
+        meta = load_json(self._meta_path, default={}) or {}
+        self.dtype = meta.get("dtype", dtype)
+        if self.dtype != dtype:
+            logger.warning(f"Existing store uses {self.dtype}, ignoring requested {dtype}")
+        self.dim = meta.get("dim")
+        self._capacity = meta.get("capacity", 0)
+        self._size = meta.get("size", 0)
+        
+        self._matrix = None
+        self._scales = None
+        self._alive = np.zeros(self._capacity, dtype=bool)
+        
+        if self.dim:
+            self._open_matrix()
+            rows = [row for (row,) in self.db.execute("SELECT row FROM documents")]
+            self._alive[rows] = True
+        
+        # An empty store starts over, so it can take a new dimension and reduction
+        if self.get_document_count() == 0:
+            self._reset_storage()
+            self.dtype = dtype
+            meta = {}
+        
+        self.reducer = resolve_reducer(
+            meta,
+            reducer,
+            self.get_document_count(),
+            state_path=self._reduction_path
+        )
+        
+        logger.info(f"QuantizedVectorStore ({self.dtype}) initialized at {persist_directory}")
+        logger.info(f"Collection has {self.get_document_count()} documents")
+    
+    def add_documents(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: List[Dict]
+    ) -> None:
+        """Add documents with embeddings to the store"""
+        if not ids:
+            return
+        
+        vectors = self._normalize(np.asarray(self.reducer.project_documents(embeddings), dtype=np.float32))
+        self._store(ids, vectors, documents, metadatas)
+        logger.info(f"Added {len(ids)} documents to vector store")
+        if not self.reducer.fitted:
+            self._fit_reduction()
+    
+    def restore_documents(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: List[Dict]
+    ) -> None:
+        """Add documents whose embeddings are already projected, e.g. from a snapshot"""
+        if not ids:
+            return
+        self._store(ids, self._normalize(np.asarray(embeddings, dtype=np.float32)), documents, metadatas)
+    
+    def _store(self, ids: List[str], vectors: np.ndarray, documents: List[str], metadatas: List[Dict]) -> None:
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._grow(max(INITIAL_CAPACITY, len(ids)))
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match store dimension {self.dim}")
+            
+            # Re-adding an ID replaces the old row
+            self._delete_ids(ids)
+            
+            rows = self._allocate_rows(len(ids))
+            self._write_rows(rows, vectors)
+            
+            self.db.executemany(
+                "INSERT INTO documents (row, id, folder_path, document, metadata) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (int(row), doc_id, (metadata or {}).get("folder_path"), document, json.dumps(metadata or {}))
+                    for row, doc_id, document, metadata in zip(rows, ids, documents, metadatas)
+                ]
+            )
+            self.db.commit()
+            self._alive[rows] = True
+            self._flush()
+    
+    def query(
+        self,
+        query_embedding: List[float],
+        top_k: int = 5,
+        where: Optional[Dict] = None,
+        include_embeddings: bool = False,
+        ids: Optional[List[str]] = None,
+        include_payload: bool = True
+    ) -> List[Dict]:
+        """Query the store for similar documents"""
+        if not query_embedding:
+            return []
+        return self.query_batch(
+            [query_embedding], top_k=top_k, where=where, include_embeddings=include_embeddings, ids=ids,
+            include_payload=include_payload
+        )[0]
+    
+    def query_batch(
+        self,
+        query_embeddings: List[List[float]],
+        top_k: int = 5,
+        where: Optional[Dict] = None,
+        include_embeddings: bool = False,
+        ids: Optional[List[str]] = None,
+        include_payload: bool = True
+    ) -> List[List[Dict]]:
+        """Query the store for several embeddings with one pass over the matrix, only among ids when given"""
+        if not query_embeddings:
+            return []
+        
+        # Snapshot the live rows and the memmaps under the lock, then scan without it so
+        # concurrent queries and indexing don't wait on each other
+        with self._lock:
+            if self.dim is None or top_k <= 0:
+                return [[] for _ in query_embeddings]
+            
+            queries = self._normalize(np.asarray(self.reducer.project_queries(query_embeddings), dtype=np.float32))
+            live = self._rows_matching(where) if where else np.flatnonzero(self._alive[:self._size])
+            if ids is not None:
+                live = np.intersect1d(live, self._rows_for_ids(ids))
+            matrix = self._matrix
+            scales = self._scales if self.dtype == "int8" else None
+        
+        top_rows, top_scores = self._search(queries, top_k, live, matrix, scales)
+        
+        # Rows deleted during the scan have no payload any more and are skipped below
+        with self._lock:
+            all_rows = sorted({int(row) for rows in top_rows for row in rows})
+            payloads = self._load_rows(all_rows, include_payload)
+            if include_embeddings:
+                self._attach_embeddings(payloads)
+        
+        results = []
+        for rows, scores in zip(top_rows, top_scores):
+            formatted = []
+            for row, score in zip(rows, scores):
+                payload = payloads.get(int(row))
+                if payload is None:
+                    continue
+                formatted.append({
+                    **payload,
+                    "distance": float(1 - score),
+                    "score": float(score),
+                })
+            results.append(formatted)
+        
+        return results
+    
+    def get_documents(self, ids: List[str], include_embeddings: bool = False, include_payload: bool = True) -> List[Dict]:
+        """Fetch documents by ID, preserving the requested order; without include_payload only ids and embeddings"""
+        if not ids:
+            return []
+        
+        by_row = {}
+        with self._lock:
+            for chunk in _chunked(ids, 500):
+                placeholders = ",".join("?" * len(chunk))
+                columns = "row, id, document, metadata" if include_payload else "row, id"
+                cursor = self.db.execute(f"SELECT {columns} FROM documents WHERE id IN ({placeholders})", chunk)
+                for row, doc_id, *payload in cursor:
+                    by_row[row] = _payload(doc_id, payload)
+            if include_embeddings:
+                self._attach_embeddings(by_row)
+        
+        by_id = {payload["id"]: payload for payload in by_row.values()}
+        return [by_id[doc_id] for doc_id in ids if doc_id in by_id]
+    
+    def iter_documents(self, batch_size: int = 1000, include_embeddings: bool = False):
+        """Yield pages of stored documents with their metadata, and stored embeddings if asked"""
+        last_row = -1
+        while True:
+            with self._lock:
+                rows = self.db.execute(
+                    "SELECT row, id, document, metadata FROM documents WHERE row > ? ORDER BY row LIMIT ?",
+                    (last_row, batch_size)
+                ).fetchall()
+                
+                page = {
+                    row: {"id": doc_id, "content": document or "", "metadata": json.loads(metadata)}
+                    for row, doc_id, document, metadata in rows
+                }
+                if include_embeddings:
+                    self._attach_embeddings(page)
+            
+            if not rows:
+                return
+            
+            yield [page[row] for row, _, _, _ in rows]
+            
+            last_row = rows[-1][0]
+    
+    def delete_by_folder(self, folder_path: str) -> int:
+        """Delete all documents from a specific folder"""
+        try:
+            with self._lock:
+                rows = [row for (row,) in self.db.execute(
+                    "SELECT row FROM documents WHERE folder_path = ?", (folder_path,)
+                )]
+                if not rows:
+                    return 0
+                
+                self.db.execute("DELETE FROM documents WHERE folder_path = ?", (folder_path,))
+                self.db.commit()
+                self._alive[rows] = False
+            
+            logger.info(f"Deleted {len(rows)} documents from {folder_path}")
+            return len(rows)
+        except Exception as e:
+            logger.error(f"Error deleting documents: {e}")
+            return 0
+    
+    def get_document_count(self) -> int:
+        """Get total number of documents in the store"""
+        return int(self._alive.sum())
+    
+    def get_dimension(self) -> Optional[int]:
+        """Width of the stored vectors, None before the first write"""
+        return self.dim
+    
+    def get_folders(self) -> List[str]:
+        """Get list of indexed folders"""
+        try:
+            with self._lock:
+                return [
+                    folder for (folder,) in
+                    self.db.execute("SELECT DISTINCT folder_path FROM documents WHERE folder_path IS NOT NULL")
+                ]
+        except Exception as e:
+            logger.error(f"Error getting folders: {e}")
+            return []
+    
+    def clear_all(self) -> None:
+        """Clear all documents from the store"""
+        try:
+            with self._lock:
+                self._reset_storage()
+                self.reducer.reset()
+            logger.info("Cleared all documents from vector store")
+        except Exception as e:
+            logger.error(f"Error clearing vector store: {e}")
+    
+    def get_reduction(self) -> Dict:
+        """The reduction stored vectors were projected with, including a fitted PCA projection"""
+        return {**self.reducer.to_metadata(), "state": self.reducer.get_state()}
+    
+    def get_reduction_status(self) -> Dict:
+        """Whether stored vectors are reduced yet"""
+        return self.reducer.status()
+    
+    def adopt_reduction(self, metadata: Dict, state: Optional[Dict] = None) -> None:
+        """Take over another store's reduction so its projected vectors can be restored here"""
+        with self._lock:
+            if self.reducer.matches(metadata, state):
+                return
+            if self.get_document_count() > 0:
+                raise ValueError(
+                    f"Index holds vectors reduced with {self.reducer.mode}/{self.reducer.dim}; "
+                    f"clear it before restoring vectors reduced with {metadata.get(METADATA_MODE_KEY, 'none')}"
+                )
+            
+            self._reset_storage()
+            self.reducer = EmbeddingReducer.from_metadata(metadata, state_path=self._reduction_path)
+            if state is not None:
+                self.reducer.set_state(state["mean"], state["components"])
+        logger.info(f"Vector store now uses reduction {self.reducer.mode}/{self.reducer.dim}")
+    
+    # ---- internals ----
+    
+    def _fit_reduction(self) -> None:
+        """Fit PCA once enough full-width rows are stored, then rewrite the matrix projected, block by block
+        
+        Rows keep their numbers, so the side table is untouched; the projected matrix is written
+        next to the live one and swapped in only when complete.
+        """
+        with self._lock:
+            live = np.flatnonzero(self._alive[:self._size])
+            if live.size < self.reducer.min_samples:
+                return
+            # Fitted apart from the store's reducer, so nothing projects queries before the matrix matches
+            fitted = EmbeddingReducer(mode=self.reducer.mode, dim=self.reducer.dim)
+            blocks = [live[start:start + BLOCK_ROWS] for start in range(0, live.size, BLOCK_ROWS)]
+            if not fitted.fit((self._read_vectors(rows) for rows in blocks), live.size):
+                return
+            
+            matrix_path = f"{self._matrix_path}.reprojected"
+            scales_path = f"{self._scales_path}.reprojected"
+            shape = (self._capacity, fitted.dim)
+            matrix = np.memmap(matrix_path, dtype=self.dtype, mode="w+", shape=shape)
+            scales = None
+            if self.dtype == "int8":
+                scales = np.memmap(scales_path, dtype=np.float32, mode="w+", shape=(self._capacity,))
+            for rows in blocks:
+                vectors = np.asarray(fitted.project_documents(self._read_vectors(rows)), dtype=np.float32)
+                self._encode_rows(matrix, scales, rows, self._normalize(vectors))
+            matrix.flush()
+            if scales is not None:
+                scales.flush()
+            del matrix, scales
+            
+            self._matrix = None
+            self._scales = None
+            os.replace(matrix_path, self._matrix_path)
+            if self.dtype == "int8":
+                os.replace(scales_path, self._scales_path)
+            self.dim = fitted.dim
+            state = fitted.get_state()
+            self.reducer.set_state(state["mean"], state["components"])
+            self._open_matrix()
+            self._flush()
+        logger.info(f"Re-projected {live.size} stored vectors to {self.dim} dimensions")
+    
+    def _reset_storage(self) -> None:
+        """Drop all rows, the matrix files and any fitted projection"""
+        self.db.execute("DELETE FROM documents")
+        self.db.commit()
+        self._matrix = None
+        self._scales = None
+        for path in (self._matrix_path, self._scales_path, self._meta_path, self._reduction_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self.dim = None
+        self._capacity = 0
+        self._size = 0
+        self._alive = np.zeros(0, dtype=bool)
+    
+    def _search(
+        self,
+        queries: np.ndarray,
+        top_k: int,
+        live: np.ndarray,
+        matrix: np.memmap,
+        scales: Optional[np.memmap]
+    ) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+        """Score queries against the given sorted rows block by block and keep the top-k per query"""
+        n_queries = queries.shape[0]
+        if live.size == 0:
+            return [np.array([], dtype=np.int64)] * n_queries, [np.array([])] * n_queries
+        
+        k = min(top_k, live.size)
+        best_rows = np.empty((n_queries, 0), dtype=np.int64)
+        best_scores = np.empty((n_queries, 0), dtype=np.float32)
+        
+        for start in range(0, live.size, BLOCK_ROWS):
+            rows = live[start:start + BLOCK_ROWS]
+            
+            # Contiguous live rows can be sliced straight from the memmap
+            if rows[-1] - rows[0] + 1 == rows.size:
+                block = matrix[rows[0]:rows[-1] + 1]
+            else:
+                block = matrix[rows]
+            
+            scores = queries @ block.astype(np.float32).T
+            if scales is not None:
+                scores /= scales[rows]
+            
+            # Merge this block's candidates into the running top-k
+            merged_scores = np.concatenate([best_scores, scores], axis=1)
+            merged_rows = np.concatenate([best_rows, np.broadcast_to(rows, scores.shape)], axis=1)
+            if merged_scores.shape[1] > k:
+                keep = np.argpartition(-merged_scores, k - 1, axis=1)[:, :k]
+                merged_scores = np.take_along_axis(merged_scores, keep, axis=1)
+                merged_rows = np.take_along_axis(merged_rows, keep, axis=1)
+            best_scores, best_rows = merged_scores, merged_rows
+        
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        
+        return list(best_rows), list(best_scores)
+    
+    def _rows_matching(self, where: Dict) -> np.ndarray:
+        """Resolve a metadata filter to the matching row numbers"""
+        clause, params = _where_to_sql(where)
+        rows = [row for (row,) in self.db.execute(f"SELECT row FROM documents WHERE {clause}", params)]
+        return np.array(sorted(rows), dtype=np.int64)
+    
+    def _rows_for_ids(self, ids: List[str]) -> np.ndarray:
+        """Row numbers of existing IDs, sorted"""
+        rows = []
+        for chunk in _chunked(ids, 500):
+            placeholders = ",".join("?" * len(chunk))
+            rows.extend(row for (row,) in self.db.execute(
+                f"SELECT row FROM documents WHERE id IN ({placeholders})", chunk
+            ))
+        return np.array(sorted(rows), dtype=np.int64)
+    
+    def _load_rows(self, rows: List[int], include_payload: bool = True) -> Dict[int, Dict]:
+        """Fetch the id, and document and metadata if asked, for row numbers"""
+        payloads = {}
+        for chunk in _chunked(rows, 500):
+            placeholders = ",".join("?" * len(chunk))
+            columns = "row, id, document, metadata" if include_payload else "row, id"
+            cursor = self.db.execute(f"SELECT {columns} FROM documents WHERE row IN ({placeholders})", chunk)
+            for row, doc_id, *payload in cursor:
+                payloads[row] = _payload(doc_id, payload)
+        return payloads
+    
+    def _attach_embeddings(self, payloads: Dict[int, Dict]) -> None:
+        """Add dequantized embeddings to payloads keyed by row"""
+        if not payloads:
+            return
+        
+        rows = np.array(sorted(payloads), dtype=np.int64)
+        vectors = self._read_vectors(rows)
+        
+        for row, vector in zip(rows, vectors):
+            payloads[int(row)]["embedding"] = vector
+    
+    def _delete_ids(self, ids: List[str]) -> None:
+        """Free the rows held by existing IDs"""
+        rows = []
+        for chunk in _chunked(ids, 500):
+            placeholders = ",".join("?" * len(chunk))
+            rows.extend(row for (row,) in self.db.execute(
+                f"SELECT row FROM documents WHERE id IN ({placeholders})", chunk
+            ))
+            self.db.execute(f"DELETE FROM documents WHERE id IN ({placeholders})", chunk)
+        if rows:
+            self._alive[rows] = False
+    
+    def _allocate_rows(self, count: int) -> np.ndarray:
+        """Reuse freed rows first, then append, growing the matrix as needed"""
+        free = np.flatnonzero(~self._alive[:self._size])[:count]
+        needed = count - free.size
+        
+        if needed > 0:
+            if self._size + needed > self._capacity:
+                self._grow(max(self._capacity * 2, self._size + needed))
+            appended = np.arange(self._size, self._size + needed)
+            self._size += needed
+            return np.concatenate([free, appended])
+        
+        return free
+    
+    def _read_vectors(self, rows: np.ndarray) -> np.ndarray:
+        """Dequantized float32 vectors of rows"""
+        vectors = self._matrix[rows].astype(np.float32)
+        if self.dtype == "int8":
+            vectors /= self._scales[rows][:, None]
+        return vectors
+    
+    def _write_rows(self, rows: np.ndarray, vectors: np.ndarray) -> None:
+        self._encode_rows(self._matrix, self._scales, rows, vectors)
+    
+    def _encode_rows(
+        self,
+        matrix: np.ndarray,
+        scales: Optional[np.ndarray],
+        rows: np.ndarray,
+        vectors: np.ndarray
+    ) -> None:
+        """Write vectors to rows of matrix, quantizing them for int8 stores"""
+        if self.dtype == "int8":
+            # Per-row scale so each vector uses the full int8 range
+            peaks = np.abs(vectors).max(axis=1)
+            row_scales = np.where(peaks > 0, 127.0 / np.maximum(peaks, 1e-12), 1.0).astype(np.float32)
+            matrix[rows] = np.round(vectors * row_scales[:, None]).astype(np.int8)
+            scales[rows] = row_scales
+        else:
+            matrix[rows] = vectors.astype(np.float16)
+    
+    def _grow(self, capacity: int) -> None:
+        """Resize the memory-mapped files to hold capacity rows"""
+        self._flush()
+        self._matrix = None
+        self._scales = None
+        
+        itemsize = np.dtype(self.dtype).itemsize
+        _resize_file(self._matrix_path, capacity * self.dim * itemsize)
+        if self.dtype == "int8":
+            _resize_file(self._scales_path, capacity * 4)
+        
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self._alive.size] = self._alive
+        self._alive = alive
+        self._capacity = capacity
+        
+        self._open_matrix()
+    
+    def _open_matrix(self) -> None:
+        self._matrix = np.memmap(self._matrix_path, dtype=self.dtype, mode="r+", shape=(self._capacity, self.dim))
+        if self.dtype == "int8":
+            self._scales = np.memmap(self._scales_path, dtype=np.float32, mode="r+", shape=(self._capacity,))
+    
+    def _flush(self) -> None:
+        if self._matrix is None:
+            return
+        
+        self._matrix.flush()
+        if self._scales is not None:
+            self._scales.flush()
+        
+        atomic_write_json(self._meta_path, {
+            "dtype": self.dtype,
+            "dim": self.dim,
+            "capacity": self._capacity,
+            "size": self._size,
+            **self.reducer.to_metadata(),
+        })
+    
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+def _resize_file(path: str, size: int) -> None:
+    with open(path, "ab") as f:
+        f.truncate(size)
+
+
+def _payload(doc_id: str, payload: List) -> Dict:
+    """A result from a side table row; payload is [document, metadata], or empty when not selected"""
+    if not payload:
+        return {"id": doc_id}
+    document, metadata = payload
+    return {"id": doc_id, "content": document or "", "metadata": json.loads(metadata)}
+
+
+def _chunked(items: List, size: int):
+    for i in range(0, len(items), size):
+        yield list(items[i:i + size])
+
+
+def _where_to_sql(where: Dict) -> Tuple[str, List]:
+    """Translate a Chroma-style metadata filter into a SQL clause over the side table"""
+    clauses = []
+    params: List = []
+    
+    for key, condition in where.items():
+        if key in ("$and", "$or"):
+            parts = [_where_to_sql(sub) for sub in condition]
+            joiner = " AND " if key == "$and" else " OR "
+            clauses.append("(" + joiner.join(clause for clause, _ in parts) + ")")
+            for _, sub_params in parts:
+                params.extend(sub_params)
+            continue
+        
+        column = "folder_path" if key == "folder_path" else "json_extract(metadata, ?)"
+        column_params = [] if key == "folder_path" else [f"$.{key}"]
+        
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        
+        for op, value in condition.items():
+            if op in ("$in", "$nin"):
+                values = list(value)
+                if not values:
+                    clauses.append("0" if op == "$in" else "1")
+                    continue
+                placeholders = ",".join("?" * len(values))
+                negate = "NOT " if op == "$nin" else ""
+                clauses.append(f"{column} {negate}IN ({placeholders})")
+                params.extend(column_params + values)
+            elif op in COMPARISON_OPERATORS:
+                clauses.append(f"{column} {COMPARISON_OPERATORS[op]} ?")
+                params.extend(column_params + [value])
+            else:
+                raise ValueError(f"Unsupported filter operator: {op}")
+    
+    return " AND ".join(clauses) or "1", params
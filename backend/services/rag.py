@@ -1,14 +1,50 @@
 """
 RAG Pipeline - Retrieval Augmented Generation
 """
+import asyncio
 import logging
-from typing import AsyncGenerator, Dict, List, Optional
+import re
+from typing import AsyncGenerator, Awaitable, Dict, List, Optional, Tuple, Union
 
+import numpy as np
+
+from services.chat_sessions import SESSION_NUM_CTX, ChatSession
+from services.context_packer import build_context, context_budget_for, pack_context
+from services.diversify import merge_adjacent, mmr_select
+from services.lexical_index import LexicalIndex, reciprocal_rank_fusion
+from services.link_graph import LinkGraph
+from services.metadata_index import MetadataIndex
+from services.symbol_index import SymbolIndex
+from services.tracing import span
+from services.stage_timer import StageTimer
 from services.ollama_client import OllamaClient
 from services.vector_store import VectorStore
 
 logger = logging.getLogger(__name__)
 
+# Retrieval modes
+SEARCH_MODES = ("hybrid", "vector", "lexical")
+
+# Candidates fetched per requested result, leaving room for fusion, dedup and MMR
+DEFAULT_OVERFETCH = 3
+
+# MMR trade-off: 0 ranks purely by relevance, 1 purely by novelty
+DEFAULT_DIVERSITY = 0.3
+
+# Notes linked to or from the hits that link expansion scores at most
+MAX_LINKED_NOTES = 50
+
+# Names in a query that read as code: snake_case, camelCase, PascalCase with two humps, or `quoted`
+CODE_IDENTIFIER = re.compile(r"`(\w+)`|\b([A-Za-z]\w*_\w*|_\w+|[a-z][a-z0-9]*[A-Z]\w*|[A-Z][a-z0-9]+[A-Z]\w*)\b")
+
+# Queries that only ask where something is defined. Only a name written as code, `quoted`, called() or
+# matching CODE_IDENTIFIER, is answered from the symbol index alone; "find config" still searches the notes
+DEFINITION_QUESTION = re.compile(
+    r"\s*(?:where\s+is|where's|find|go\s+to|(?:the\s+)?definition\s+of)\s+(?:the\s+)?"
+    r"(?P<quote>`)?(?P<name>[A-Za-z_]\w*)(?(quote)`)(?P<call>\(\))?(?:\s+(?:defined|declared))?\s*\??\s*",
+    re.IGNORECASE
+)
+
 SYSTEM_PROMPT = """You are Mnemora, a helpful AI assistant that answers questions based on the user's personal documents and files. 
 
 Guidelines:
@@ -27,37 +63,503 @@ class RAGPipeline:
         self, 
         vector_store: VectorStore, 
         ollama: OllamaClient,
-        model: str = "llama3.2:3b"
+        model: str = "llama3.2:3b",
+        lexical_index: Optional[LexicalIndex] = None,
+        metadata_index: Optional[MetadataIndex] = None,
+        link_graph: Optional[LinkGraph] = None,
+        symbol_index: Optional[SymbolIndex] = None
     ):
         self.vector_store = vector_store
         self.ollama = ollama
         self.model = model
+        self.lexical_index = lexical_index
+        self.metadata_index = metadata_index
+        self.link_graph = link_graph
+        self.symbol_index = symbol_index
     
-    async def retrieve(self, query: str, top_k: int = 5) -> List[Dict]:
-        """Retrieve relevant documents for a query"""
-        # Generate query embedding
-        query_embedding = await self.ollama.generate_embedding(query)
+    async def retrieve(
+        self,
+        query: str,
+        top_k: int = 5,
+        mode: str = "hybrid",
+        diversity: float = DEFAULT_DIVERSITY,
+        overfetch: int = DEFAULT_OVERFETCH,
+        merge_chunks: bool = True,
+        # An embedding, or a pending task computing one that the caller also reuses
+        query_embedding: Optional[Union[List[float], Awaitable[List[float]]]] = None,
+        timer: Optional[StageTimer] = None,
+        filters: Optional[Dict] = None,
+        expand_links: int = 0,
+        symbols: bool = True
+    ) -> List[Dict]:
+        """Retrieve relevant documents for a query, among chunks matching filters when given
         
-        if not query_embedding:
-            logger.warning("Failed to generate query embedding")
-            return []
+        With expand_links, up to that many notes linked to or from the hits follow
+        them, each represented by its chunk closest to the query.
         
-        # Search vector store
-        results = self.vector_store.query(query_embedding, top_k=top_k)
+        With symbols, chunks defining code identifiers named in the query come
+        first, and a query asking only where one is defined is answered by its
+        definitions without searching.
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode}")
         
-        # Format for response
-        sources = []
-        for result in results:
-            sources.append({
-                "file_path": result["metadata"].get("file_path", "Unknown"),
-                "file_name": result["metadata"].get("file_name", "Unknown"),
-                "content": result["content"][:500],  # Truncate for response
-                "score": round(result.get("score", 0), 3),
-                "chunk_index": result["metadata"].get("chunk_index", 0),
-            })
+        # Fall back to dense search when there is no lexical index
+        if self.lexical_index is None:
+            mode = "vector"
+        
+        timer = timer or StageTimer()
+        candidates = top_k * max(overfetch, 1)
+        with_embeddings = diversity > 0
+        allowed = self._resolve_filters(filters, timer)
+        query_vector = None
+        symbols = symbols and self.symbol_index is not None
+        
+        async def symbol_search(names: List[str], ignore_case: bool = False) -> List[Dict]:
+            ids = await allowed
+            if not names or (ids is not None and not ids):
+                return []
+            return await timer.track("symbols", asyncio.to_thread(
+                self._definition_candidates, names, ids, top_k, ignore_case
+            ))
+        
+        async def lexical_search() -> List[Dict]:
+            # Lexical search and hydration never touch Ollama, so they overlap the embedding
+            if mode not in ("hybrid", "lexical"):
+                return []
+            ids = await allowed
+            if ids is not None and not ids:
+                return []
+            return await timer.track(
+                "lexical_search",
+                asyncio.to_thread(self._lexical_candidates, query, candidates, with_embeddings, ids)
+            )
         
+        async def dense_search() -> List[Dict]:
+            nonlocal query_vector
+            if mode not in ("hybrid", "vector"):
+                return []
+            
+            # Generate query embedding
+            embedding = query_embedding
+            if embedding is None:
+                embedding = await timer.track("embed", self.embed_query(query))
+            elif not isinstance(embedding, list):
+                embedding = await embedding
+            
+            if not embedding:
+                logger.warning("Failed to generate query embedding")
+                return []
+            query_vector = embedding
+            
+            ids = await allowed
+            if ids is not None and not ids:
+                return []
+            
+            # Search vector store off the event loop; candidate text is loaded only for the final results
+            return await timer.track("vector_search", asyncio.to_thread(
+                self.vector_store.query, embedding, top_k=candidates, include_embeddings=with_embeddings, ids=ids,
+                include_payload=False
+            ))
+        
+        with span("retrieve", mode=mode, top_k=top_k) as attrs:
+            question = DEFINITION_QUESTION.fullmatch(query) if symbols else None
+            if question and self._names_code(question):
+                definitions = await symbol_search([question.group("name")], ignore_case=True)
+                if definitions:
+                    results = (await self._hydrate([definitions], top_k, timer))[0]
+                    sources = self._shape(results, merge_chunks=False)
+                    attrs["sources"] = len(sources)
+                    return sources
+            
+            names = self._code_identifiers(query) if symbols else []
+            if question and question.group("name") not in names:
+                # A plain word may be a note topic too, so its exact-case definitions only lead the search
+                names.append(question.group("name"))
+            lexical_results, dense_results, definitions = await asyncio.gather(
+                lexical_search(), dense_search(), symbol_search(names)
+            )
+            
+            with timer.stage("rerank"):
+                ranking = self._rank(mode, dense_results, lexical_results, top_k, candidates, diversity)
+                if definitions:
+                    defined = {result["id"] for result in definitions}
+                    ranking = definitions + [result for result in ranking if result["id"] not in defined]
+            results = (await self._hydrate([ranking], top_k, timer))[0]
+            sources = self._shape(results, merge_chunks)
+            
+            if expand_links and self.link_graph is not None and results:
+                # Linked notes are scored with the query embedding already computed, never a new one
+                linked = await timer.track("expand_links", asyncio.to_thread(
+                    self._linked_candidates, query, query_vector, results, expand_links, await allowed
+                ))
+                linked = (await self._hydrate([linked], expand_links, timer))[0]
+                sources += self._shape(linked, merge_chunks=False)
+            attrs["sources"] = len(sources)
         return sources
     
+    async def retrieve_batch(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        mode: str = "hybrid",
+        diversity: float = DEFAULT_DIVERSITY,
+        overfetch: int = DEFAULT_OVERFETCH,
+        merge_chunks: bool = True,
+        timer: Optional[StageTimer] = None,
+        filters: Optional[Dict] = None,
+        expand_links: int = 0,
+        symbols: bool = True
+    ) -> Tuple[List[List[Dict]], List[Optional[List[float]]]]:
+        """Retrieve sources and query embeddings for many queries with one embedding request and one vector query
+        
+        expand_links and symbols work per query as in retrieve, except that a query
+        answered by its definitions alone is still searched along with the others.
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode}")
+        
+        if self.lexical_index is None:
+            mode = "vector"
+        
+        timer = timer or StageTimer()
+        candidates = top_k * max(overfetch, 1)
+        with_embeddings = diversity > 0
+        allowed = self._resolve_filters(filters, timer)
+        symbols = symbols and self.symbol_index is not None
+        
+        async def symbol_search() -> List[Tuple[List[Dict], bool]]:
+            ids = await allowed
+            if not symbols or (ids is not None and not ids):
+                return [([], False)] * len(queries)
+            return await timer.track("symbols", asyncio.to_thread(self._batch_definitions, queries, ids, top_k))
+        
+        async def lexical_search() -> List[List[Dict]]:
+            ids = await allowed
+            if mode not in ("hybrid", "lexical") or (ids is not None and not ids):
+                return [[] for _ in queries]
+            return await timer.track("lexical_search", asyncio.to_thread(
+                lambda: [self._lexical_candidates(query, candidates, with_embeddings, ids) for query in queries]
+            ))
+        
+        async def dense_search() -> Tuple[List[Optional[List[float]]], List[List[Dict]]]:
+            if mode not in ("hybrid", "vector"):
+                return [None] * len(queries), [[] for _ in queries]
+            
+            embeddings = await timer.track("embed", self.ollama.embed_many(queries))
+            embedded = [i for i, embedding in enumerate(embeddings) if embedding]
+            if len(embedded) < len(queries):
+                logger.warning(f"Failed to embed {len(queries) - len(embedded)} of {len(queries)} queries")
+            
+            ids = await allowed
+            if ids is not None and not ids:
+                return [embedding or None for embedding in embeddings], [[] for _ in queries]
+            
+            # One multi-vector query for the whole batch
+            batches = await timer.track("vector_search", asyncio.to_thread(
+                self.vector_store.query_batch,
+                [embeddings[i] for i in embedded],
+                top_k=candidates,
+                include_embeddings=with_embeddings,
+                ids=ids,
+                include_payload=False
+            ))
+            
+            dense = [[] for _ in queries]
+            for i, results in zip(embedded, batches):
+                dense[i] = results
+            return [embedding or None for embedding in embeddings], dense
+        
+        with span("retrieve_batch", mode=mode, top_k=top_k, queries=len(queries)):
+            lexical_results, (embeddings, dense_results), found = await asyncio.gather(
+                lexical_search(), dense_search(), symbol_search()
+            )
+            
+            with timer.stage("rerank"):
+                rankings = []
+                for dense, lexical, (definitions, answered) in zip(dense_results, lexical_results, found):
+                    if answered:
+                        rankings.append(definitions)
+                        continue
+                    ranking = self._rank(mode, dense, lexical, top_k, candidates, diversity)
+                    if definitions:
+                        defined = {result["id"] for result in definitions}
+                        ranking = definitions + [result for result in ranking if result["id"] not in defined]
+                    rankings.append(ranking)
+            # One fetch loads the results of every query
+            selections = await self._hydrate(rankings, top_k, timer)
+            sources = [
+                self._shape(results, merge_chunks and not answered)
+                for results, (_, answered) in zip(selections, found)
+            ]
+            
+            if expand_links and self.link_graph is not None:
+                ids = await allowed
+                linked = await timer.track("expand_links", asyncio.to_thread(lambda: [
+                    self._linked_candidates(query, embedding, results, expand_links, ids)
+                    if results and not answered else []
+                    for query, embedding, results, (_, answered) in zip(queries, embeddings, selections, found)
+                ]))
+                linked = await self._hydrate(linked, expand_links, timer)
+                for shaped, results in zip(sources, linked):
+                    shaped += self._shape(results, merge_chunks=False)
+        return sources, embeddings
+    
+    def _rank(
+        self,
+        mode: str,
+        dense_results: List[Dict],
+        lexical_results: List[Dict],
+        top_k: int,
+        candidates: int,
+        diversity: float
+    ) -> List[Dict]:
+        """Order the candidates, which carry only ids, scores and embeddings, best first"""
+        if mode == "vector":
+            results = dense_results
+        elif mode == "lexical":
+            results = lexical_results
+        else:
+            results = self._fuse(dense_results, lexical_results, candidates)
+        
+        return self._diversify(results, top_k, diversity)
+    
+    async def _hydrate(self, rankings: List[List[Dict]], top_k: int, timer: StageTimer) -> List[List[Dict]]:
+        """Load text and metadata down each ranking until top_k results survive dedup
+        
+        Each round fetches, in one call for all rankings, just enough candidates to
+        fill the remaining slots, so a second round is only needed when duplicates or
+        chunks deleted since the search were dropped.
+        """
+        selections: List[List[Dict]] = [[] for _ in rankings]
+        seen_groups: List[set] = [set() for _ in rankings]
+        positions = [0] * len(rankings)
+        
+        with timer.stage("hydrate"):
+            while True:
+                batches = []
+                for i, ranking in enumerate(rankings):
+                    wanted = top_k - len(selections[i])
+                    batches.append(ranking[positions[i]:positions[i] + wanted] if wanted > 0 else [])
+                    positions[i] += len(batches[-1])
+                ids = list(dict.fromkeys(result["id"] for batch in batches for result in batch))
+                if not ids:
+                    return selections
+                
+                documents = await asyncio.to_thread(self.vector_store.get_documents, ids)
+                by_id = {document["id"]: document for document in documents}
+                for batch, selected, seen in zip(batches, selections, seen_groups):
+                    for result in batch:
+                        document = by_id.get(result["id"])
+                        if document is None:
+                            continue
+                        # Keep one chunk per duplicate group
+                        group = document["metadata"].get("dedup_group", result["id"])
+                        if group in seen:
+                            continue
+                        seen.add(group)
+                        selected.append({**result, **document})
+    
+    def _shape(self, results: List[Dict], merge_chunks: bool) -> List[Dict]:
+        """Stitch neighbouring chunks back together and format the sources for the response"""
+        if merge_chunks:
+            results = merge_adjacent(results)
+        return [self._format_source(result) for result in results]
+    
+    async def embed_query(self, query: str) -> List[float]:
+        """Embed a query for vector search"""
+        return await self.ollama.generate_embedding(query)
+    
+    def _diversify(self, results: List[Dict], top_k: int, diversity: float) -> List[Dict]:
+        """Order results by maximal marginal relevance, so any top_k-long stretch stays diverse after dedup"""
+        if diversity <= 0 or len(results) <= top_k:
+            return results
+        
+        relevance = np.array(
+            [result.get("fusion_score", result.get("score", 0)) for result in results],
+            dtype=np.float32
+        )
+        relevance /= max(float(relevance.max()), 1e-12)
+        embeddings = np.array([result["embedding"] for result in results], dtype=np.float32)
+        
+        picked = mmr_select(embeddings, relevance, len(results), diversity)
+        return [results[i] for i in picked]
+    
+    def _resolve_filters(self, filters: Optional[Dict], timer: StageTimer) -> asyncio.Future:
+        """Start resolving filters to the ids they allow, None meaning all; both searches await the result"""
+        if not filters:
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(None)
+            return future
+        if self.metadata_index is None:
+            raise ValueError("Filtering needs the metadata index")
+        return asyncio.ensure_future(timer.track("filter", asyncio.to_thread(self.metadata_index.resolve, filters)))
+    
+    def _lexical_candidates(
+        self,
+        query: str,
+        limit: int,
+        with_embeddings: bool = False,
+        ids: Optional[List[str]] = None
+    ) -> List[Dict]:
+        """Run BM25 search, among ids when given, best first; the store is only read for MMR's embeddings"""
+        hits = self.lexical_index.search(query, top_k=limit, ids=ids)
+        scores = self._lexical_scores(hits)
+        if not with_embeddings:
+            return [{"id": doc_id, "score": scores[doc_id]} for doc_id, _ in hits]
+        return self._load_scored([doc_id for doc_id, _ in hits], scores, with_embeddings)
+    
+    def _linked_candidates(
+        self,
+        query: str,
+        embedding: Optional[List[float]],
+        results: List[Dict],
+        limit: int,
+        allowed: Optional[List[str]] = None
+    ) -> List[Dict]:
+        """The best chunk of each note one link away from the results, best first"""
+        hit_files = list(dict.fromkeys(result["metadata"].get("file_path") for result in results))
+        linked = self.link_graph.linked_notes(hit_files, limit=MAX_LINKED_NOTES)
+        if not linked:
+            return []
+        
+        chunk_files = self.link_graph.chunks_of(list(linked))
+        if allowed is not None:
+            allowed = set(allowed)
+            chunk_files = {doc_id: path for doc_id, path in chunk_files.items() if doc_id in allowed}
+        ids = list(chunk_files)
+        if not ids:
+            return []
+        if embedding is not None:
+            matches = self.vector_store.query(embedding, top_k=len(ids), ids=ids, include_payload=False)
+            hits = [(match["id"], match["score"]) for match in matches]
+        else:
+            hits = self.lexical_index.search(query, top_k=len(ids), ids=ids)
+            scores = self._lexical_scores(hits)
+            hits = [(doc_id, scores[doc_id]) for doc_id, _ in hits]
+            # Linked notes sharing no term with the query still follow, after those that do
+            hits += [(doc_id, 0.0) for doc_id in ids if doc_id not in scores]
+        
+        picked = []
+        seen_files = set()
+        for doc_id, score in hits:
+            file_path = chunk_files.get(doc_id)
+            if file_path is None or file_path in seen_files:
+                continue
+            seen_files.add(file_path)
+            picked.append({"id": doc_id, "score": score, "linked_from": linked[file_path]})
+            if len(picked) == limit:
+                break
+        return picked
+    
+    @staticmethod
+    def _names_code(question: re.Match) -> bool:
+        """Whether a definition question's name is written as code rather than a plain word"""
+        name = question.group("name")
+        return bool(question.group("quote") or question.group("call") or CODE_IDENTIFIER.fullmatch(name))
+    
+    def _code_identifiers(self, query: str) -> List[str]:
+        """Names in the query that look like code rather than prose"""
+        return list(dict.fromkeys(quoted or bare for quoted, bare in CODE_IDENTIFIER.findall(query)))
+    
+    def _batch_definitions(
+        self,
+        queries: List[str],
+        allowed: Optional[List[str]],
+        limit: int
+    ) -> List[Tuple[List[Dict], bool]]:
+        """Each query's definitions as retrieve finds them, and whether they answer the query alone"""
+        found = []
+        for query in queries:
+            question = DEFINITION_QUESTION.fullmatch(query)
+            if question and self._names_code(question):
+                definitions = self._definition_candidates([question.group("name")], allowed, limit, ignore_case=True)
+                if definitions:
+                    found.append((definitions, True))
+                    continue
+            
+            names = self._code_identifiers(query)
+            if question and question.group("name") not in names:
+                names.append(question.group("name"))
+            found.append((self._definition_candidates(names, allowed, limit) if names else [], False))
+        return found
+    
+    def _definition_candidates(
+        self,
+        names: List[str],
+        allowed: Optional[List[str]],
+        limit: int,
+        ignore_case: bool = False
+    ) -> List[Dict]:
+        """Chunks defining any of names, one result per chunk"""
+        picked: Dict[str, Dict] = {}
+        for definition in self.symbol_index.definitions(names, ids=allowed, ignore_case=ignore_case):
+            if definition["chunk_id"] not in picked:
+                picked[definition["chunk_id"]] = {"id": definition["chunk_id"], "score": 1.0, "symbol": definition}
+                if len(picked) == limit:
+                    break
+        return list(picked.values())
+    
+    def _fuse(self, dense_results: List[Dict], lexical_results: List[Dict], limit: int) -> List[Dict]:
+        """Combine dense and lexical rankings with reciprocal rank fusion"""
+        if not lexical_results:
+            return dense_results
+        
+        fused = reciprocal_rank_fusion([
+            [result["id"] for result in dense_results],
+            [result["id"] for result in lexical_results],
+        ])[:limit]
+        
+        # Prefer the dense copy, which carries the vector similarity score
+        by_id = {result["id"]: result for result in lexical_results}
+        by_id.update({result["id"]: result for result in dense_results})
+        
+        results = []
+        for doc_id, fusion_score in fused:
+            by_id[doc_id]["fusion_score"] = fusion_score
+            results.append(by_id[doc_id])
+        return results
+    
+    def _lexical_scores(self, hits: List[Tuple[str, float]]) -> Dict[str, float]:
+        """Scale BM25 scores into 0-1 relative to the best hit"""
+        if not hits:
+            return {}
+        best = hits[0][1] or 1.0
+        return {doc_id: score / best for doc_id, score in hits}
+    
+    def _load_scored(
+        self,
+        ids: List[str],
+        scores: Dict[str, float],
+        with_embeddings: bool = False
+    ) -> List[Dict]:
+        """Fetch ids still in the vector store, with embeddings if asked, and attach scores"""
+        results = self.vector_store.get_documents(ids, include_embeddings=with_embeddings, include_payload=False)
+        for result in results:
+            result["score"] = scores.get(result["id"], 0)
+        return results
+    
+    def _format_source(self, result: Dict) -> Dict:
+        """Shape a search result for the response"""
+        source = {
+            "chunk_ids": result.get("merged_ids", [result["id"]]),
+            "file_path": result["metadata"].get("file_path", "Unknown"),
+            "file_name": result["metadata"].get("file_name", "Unknown"),
+            "content": result["content"],
+            "score": round(result.get("score", 0), 3),
+            "chunk_index": result["metadata"].get("chunk_index", 0),
+            "chunk_end": result["metadata"].get("chunk_end", result["metadata"].get("chunk_index", 0)),
+        }
+        if "linked_from" in result:
+            source["linked_from"] = result["linked_from"]
+        if "symbol" in result:
+            source["symbol"] = result["symbol"]
+        return source
+    
+    def pack_context(self, sources: List[Dict], budget: Optional[int] = None) -> Tuple[List[Dict], int]:
+        """Keep the sources that fit this model's context budget, returning them and their token count"""
+        return pack_context(sources, budget or context_budget_for(self.model))
+    
     async def generate(
         self, 
         query: str, 
@@ -65,16 +567,8 @@ class RAGPipeline:
     ) -> AsyncGenerator[str, None]:
         """Generate a response using retrieved context"""
         
-        # Build context from sources
-        if sources:
-            context_parts = []
-            for i, source in enumerate(sources, 1):
-                context_parts.append(
-                    f"[Source {i}: {source['file_name']}]\n{source['content']}"
-                )
-            context = "\n\n---\n\n".join(context_parts)
-        else:
-            context = "No relevant documents found in the knowledge base."
+        # Build context from packed sources
+        context = build_context(sources) or "No relevant documents found in the knowledge base."
         
         # Stream the response
         async for token in self.ollama.chat_stream(
@@ -85,10 +579,35 @@ class RAGPipeline:
         ):
             yield token
     
-    async def query(self, query: str, top_k: int = 5) -> Dict:
+    async def generate_in_session(
+        self,
+        session: ChatSession,
+        query: str,
+        sources: List[Dict]
+    ) -> AsyncGenerator[str, None]:
+        """Generate the next turn of a session, sending only context it has not seen yet"""
+        session.add_context(sources)
+        session.add_user_message(query)
+        
+        response = ""
+        try:
+            async for token in self.ollama.chat_stream(
+                prompt=query,
+                model=session.model,
+                messages=session.messages,
+                options={"num_ctx": SESSION_NUM_CTX}
+            ):
+                response += token
+                yield token
+        finally:
+            # The answer, even a cut-off one, becomes part of the prefix for the next turn
+            session.add_assistant_message(response)
+    
+    async def query(self, query: str, top_k: int = 5, mode: str = "hybrid") -> Dict:
         """Full RAG query - retrieve and generate"""
         # Retrieve
-        sources = await self.retrieve(query, top_k=top_k)
+        sources = await self.retrieve(query, top_k=top_k, mode=mode)
+        sources, _ = self.pack_context(sources)
         
         # Generate
         response = ""
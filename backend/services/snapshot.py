@@ -0,0 +1,252 @@
+"""
+Index Snapshots - export and restore the whole store without re-embedding
+
+A snapshot is a zip archive, like an .npz, read and written one shard at a time:
+
+    manifest.json             version, reduction, shard list with counts and sha256 checksums
+    reduction.npz             fitted PCA projection, when the store uses one
+    shards/00000.npy          float16 embeddings as stored, one row per document
+    shards/00000.jsonl        one {"id", "document", "metadata"} object per line, same order
+
+Restoring verifies every checksum and the vector dimension before writing
+anything, then bulk-loads the vectors as they are, so Ollama is never called.
+"""
+import hashlib
+import io
+import logging
+import os
+import time
+import zipfile
+import zlib
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from services.streaming import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+REDUCTION_NAME = "reduction.npz"
+
+# Documents per shard; bounds memory on both export and import
+DEFAULT_SHARD_SIZE = 2048
+
+
+class SnapshotError(Exception):
+    """A snapshot is unreadable, corrupt, or does not fit the current index"""
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _npy_bytes(array: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    np.save(buffer, array, allow_pickle=False)
+    return buffer.getvalue()
+
+
+def export_snapshot(
+    vector_store,
+    path: str,
+    folder_path: Optional[str] = None,
+    shard_size: int = DEFAULT_SHARD_SIZE
+) -> Iterator[Dict]:
+    """Write the store, or one folder of it, to a snapshot file, yielding progress after each shard"""
+    partial = f"{path}.partial"
+    shards: List[Dict] = []
+    pending: List[Dict] = []
+    written = 0
+    dim = None
+    
+    reduction = vector_store.get_reduction()
+    state = reduction.pop("state", None)
+    
+    def flush(archive: zipfile.ZipFile) -> Dict:
+        nonlocal dim
+        vectors = np.asarray([doc["embedding"] for doc in pending], dtype=np.float16)
+        if dim is None:
+            dim = int(vectors.shape[1])
+        records = "".join(
+            dumps({"id": doc["id"], "document": doc["content"], "metadata": doc["metadata"]}) + "\n"
+            for doc in pending
+        ).encode()
+        vector_bytes = _npy_bytes(vectors)
+        
+        name = f"shards/{len(shards):05d}"
+        # Half-precision vectors barely compress, so only the text is deflated
+        archive.writestr(f"{name}.npy", vector_bytes, compress_type=zipfile.ZIP_STORED)
+        archive.writestr(f"{name}.jsonl", records, compress_type=zipfile.ZIP_DEFLATED)
+        shard = {
+            "name": name,
+            "count": len(pending),
+            "vectors_sha256": _sha256(vector_bytes),
+            "records_sha256": _sha256(records),
+        }
+        pending.clear()
+        return shard
+    
+    try:
+        with zipfile.ZipFile(partial, "w") as archive:
+            if state is not None:
+                buffer = io.BytesIO()
+                np.savez(buffer, mean=np.asarray(state["mean"]), components=np.asarray(state["components"]))
+                archive.writestr(REDUCTION_NAME, buffer.getvalue())
+                reduction["state_sha256"] = _sha256(buffer.getvalue())
+            
+            for page in vector_store.iter_documents(batch_size=shard_size, include_embeddings=True):
+                for doc in page:
+                    if folder_path is not None and doc["metadata"].get("folder_path") != folder_path:
+                        continue
+                    pending.append(doc)
+                    if len(pending) == shard_size:
+                        shards.append(flush(archive))
+                        written += shards[-1]["count"]
+                        yield {"type": "progress", "documents": written, "shards": len(shards)}
+            
+            if pending:
+                shards.append(flush(archive))
+                written += shards[-1]["count"]
+                yield {"type": "progress", "documents": written, "shards": len(shards)}
+            
+            manifest = {
+                "version": SNAPSHOT_VERSION,
+                "created_at": time.time(),
+                "folder_path": folder_path,
+                "documents": written,
+                "dim": dim,
+                "reduction": reduction,
+                "shards": shards,
+            }
+            archive.writestr(MANIFEST_NAME, dumps(manifest), compress_type=zipfile.ZIP_DEFLATED)
+        
+        os.replace(partial, path)
+    finally:
+        # Interrupted or failed exports leave nothing behind
+        if os.path.exists(partial):
+            os.remove(partial)
+    
+    logger.info(f"Exported {written} documents in {len(shards)} shards to {path}")
+    yield {"type": "done", "documents": written, "shards": len(shards), "bytes": os.path.getsize(path), "path": path}
+
+
+def _read(archive: zipfile.ZipFile, name: str) -> bytes:
+    try:
+        return archive.read(name)
+    except KeyError:
+        raise SnapshotError(f"Snapshot is missing {name}")
+    except (zipfile.BadZipFile, zlib.error) as e:
+        raise SnapshotError(f"{name} is corrupt: {e}")
+
+
+def read_manifest(archive: zipfile.ZipFile) -> Dict:
+    try:
+        manifest = loads(_read(archive, MANIFEST_NAME))
+    except ValueError:
+        raise SnapshotError(f"{MANIFEST_NAME} is not valid JSON")
+    if manifest.get("version") != SNAPSHOT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot version: {manifest.get('version')}. Expected {SNAPSHOT_VERSION}")
+    return manifest
+
+
+def _read_checked(archive: zipfile.ZipFile, name: str, expected: str) -> bytes:
+    data = _read(archive, name)
+    if _sha256(data) != expected:
+        raise SnapshotError(f"Checksum mismatch in {name}")
+    return data
+
+
+def _load_shard(archive: zipfile.ZipFile, shard: Dict, dim: Optional[int]) -> Tuple[np.ndarray, List[Dict]]:
+    """A shard's vectors and records, checked against its checksums, the manifest and each other"""
+    name = shard["name"]
+    try:
+        vectors = np.load(io.BytesIO(_read_checked(archive, f"{name}.npy", shard["vectors_sha256"])), allow_pickle=False)
+    except ValueError as e:
+        raise SnapshotError(f"{name}.npy is not a valid array: {e}")
+    if vectors.ndim != 2 or vectors.shape[1] != dim:
+        raise SnapshotError(f"{name} holds vectors of shape {vectors.shape}, expected dimension {dim}")
+    
+    lines = _read_checked(archive, f"{name}.jsonl", shard["records_sha256"]).splitlines()
+    try:
+        records = [loads(line) for line in lines if line]
+    except ValueError as e:
+        raise SnapshotError(f"{name}.jsonl is not valid JSON lines: {e}")
+    if any(not isinstance(record, dict) or not {"id", "document", "metadata"} <= record.keys() for record in records):
+        raise SnapshotError(f"{name}.jsonl has records without an id, document or metadata")
+    if len(records) != len(vectors) or len(records) != shard.get("count", len(records)):
+        raise SnapshotError(f"{name} has {len(records)} records for {len(vectors)} vectors")
+    return vectors, records
+
+
+def import_snapshot(indexer, path: str) -> Iterator[Dict]:
+    """Verify a snapshot, then load it through the indexer's stores, yielding progress after each shard"""
+    try:
+        archive = zipfile.ZipFile(path)
+    except (OSError, zipfile.BadZipFile) as e:
+        raise SnapshotError(f"Cannot open snapshot {path}: {e}")
+    
+    with archive:
+        manifest = read_manifest(archive)
+        shards = manifest["shards"]
+        
+        # Read and parse every shard once up front, so a corrupt or malformed file leaves the index untouched
+        dim = manifest.get("dim")
+        folders = set()
+        for shard in shards:
+            _, records = _load_shard(archive, shard, dim)
+            folders.update(record["metadata"].get("folder_path") for record in records)
+        folders.discard(None)
+        
+        reduction = dict(manifest["reduction"])
+        state = None
+        if "state_sha256" in reduction:
+            try:
+                with np.load(io.BytesIO(_read_checked(archive, REDUCTION_NAME, reduction.pop("state_sha256")))) as saved:
+                    state = {"mean": saved["mean"], "components": saved["components"]}
+            except (ValueError, KeyError) as e:
+                raise SnapshotError(f"{REDUCTION_NAME} is not a valid projection: {e}")
+        
+        vector_store = indexer.vector_store
+        empty = vector_store.get_document_count() == 0
+        store_dim = None if empty else vector_store.get_dimension()
+        if dim is not None and store_dim is not None and store_dim != dim:
+            raise SnapshotError(
+                f"Snapshot vectors have dimension {dim} but the index holds dimension {store_dim}; "
+                f"clear the index or re-embed with the same model"
+            )
+        yield {"type": "verified", "documents": manifest["documents"], "shards": len(shards), "folders": sorted(folders)}
+        
+        if empty:
+            # An empty store may still be fixed to an earlier dimension, so let it take the snapshot's
+            vector_store.clear_all()
+        try:
+            vector_store.adopt_reduction(reduction, state)
+        except ValueError as e:
+            raise SnapshotError(str(e))
+        
+        # Like re-indexing, a restored folder replaces what the index had for it
+        for folder_path in folders:
+            indexer.remove_folder(folder_path, save=False)
+        
+        restored = 0
+        for index, shard in enumerate(shards):
+            vectors, records = _load_shard(archive, shard, dim)
+            ids = [record["id"] for record in records]
+            documents = [record["document"] for record in records]
+            metadatas = [record["metadata"] for record in records]
+            vector_store.restore_documents(ids, vectors.astype(np.float32).tolist(), documents, metadatas)
+            for search_index in indexer.search_indexes:
+                search_index.add_documents(ids, documents, metadatas, save=False)
+            if indexer.answer_cache is not None:
+                indexer.answer_cache.invalidate_chunks(ids)
+            
+            restored += len(records)
+            yield {"type": "progress", "documents": restored, "shards": index + 1}
+        
+        for search_index in indexer.search_indexes:
+            search_index.save()
+    
+    logger.info(f"Restored {restored} documents from {path}")
+    yield {"type": "done", "documents": restored, "shards": len(shards)}
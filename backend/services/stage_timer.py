@@ -0,0 +1,71 @@
+"""
+Stage Timer - per-request timestamps for each stage of the query path
+
+Every stage and mark is also recorded in the /metrics histograms and, for
+traced requests, as a span.
+"""
+import asyncio
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Dict, TypeVar
+
+from services import tracing
+from services.metrics import QUERY_MARK_SECONDS, QUERY_STAGE_SECONDS
+
+T = TypeVar("T")
+
+
+class StageTimer:
+    """Record when each stage starts and ends, in milliseconds since the request began"""
+    
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.stages: Dict[str, Dict[str, float]] = {}
+    
+    def elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self.origin) * 1000, 2)
+    
+    @contextmanager
+    def stage(self, name: str):
+        start = self.elapsed_ms()
+        try:
+            with tracing.span(name):
+                yield
+        finally:
+            self._record(name, start)
+    
+    def mark(self, name: str) -> None:
+        """Record a point in time, such as the first generated token"""
+        at = self.elapsed_ms()
+        self.stages[name] = {"at_ms": at}
+        QUERY_MARK_SECONDS.labels(mark=name).observe(at / 1000)
+        tracing.mark(name)
+    
+    async def track(self, name: str, awaitable: Awaitable[T]) -> T:
+        """Await something as a named stage"""
+        with self.stage(name):
+            return await awaitable
+    
+    def track_task(self, name: str, task: asyncio.Future) -> None:
+        """Time a background task without waiting for it"""
+        start = self.elapsed_ms()
+        trace = tracing.current_trace()
+        trace_start = trace.elapsed_ms() if trace else None
+        
+        def done(_):
+            self._record(name, start)
+            if trace is not None:
+                trace.add_span(name, trace_start, trace.elapsed_ms(), background=True)
+        
+        task.add_done_callback(done)
+    
+    def _record(self, name: str, start: float) -> None:
+        end = self.elapsed_ms()
+        self.stages[name] = {"start_ms": start, "end_ms": end}
+        QUERY_STAGE_SECONDS.labels(stage=name).observe((end - start) / 1000)
+    
+    def to_dict(self) -> Dict[str, Dict[str, float]]:
+        return {
+            name: dict(times)
+            for name, times in sorted(self.stages.items(), key=lambda item: min(item[1].values()))
+        }
@@ -0,0 +1,38 @@
+"""
+Storage helpers for the JSON side indexes kept next to the vector store
+"""
+import json
+import logging
+import os
+from typing import Any
+
+from services.streaming import loads
+
+logger = logging.getLogger(__name__)
+
+
+def atomic_write_json(path: str, data: Any) -> None:
+    """Write JSON to a temp file and rename it over the target"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    
+    # Per process, so API workers saving the same file never share a temp file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def load_json(path: str, default: Any = None) -> Any:
+    """Load JSON from disk, returning default if missing or unreadable"""
+    if not os.path.exists(path):
+        return default
+    
+    try:
+        # orjson when installed; the lexical index file runs to tens of megabytes
+        with open(path, 'rb') as f:
+            return loads(f.read())
+    except Exception as e:
+        logger.error(f"Failed to load {path}: {e}")
+        return default
@@ -0,0 +1,109 @@
+"""
+Streaming - JSON codec and SSE framing for token streams
+
+Uses orjson when it is installed and the standard library otherwise.
+"""
+import asyncio
+import json
+import logging
+from typing import AsyncIterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    logger.info("orjson not installed, using the json module for streaming. Install with: pip install orjson")
+
+# Longest a token waits for company before its frame is sent, and the frame size that flushes early
+DEFAULT_COALESCE_MS = 50
+MAX_FRAME_CHARS = 512
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    
+    def dumps(obj) -> str:
+        return orjson.dumps(obj, option=_OPTIONS).decode()
+    
+    loads = orjson.loads
+else:
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+    
+    def dumps(obj) -> str:
+        return _encoder.encode(obj)
+    
+    loads = json.loads
+
+
+def sse_event(payload: dict) -> str:
+    """One server-sent event frame"""
+    return f"data: {dumps(payload)}\n\n"
+
+
+async def coalesce(
+    tokens: AsyncIterator[str],
+    window_ms: float = DEFAULT_COALESCE_MS,
+    max_chars: int = MAX_FRAME_CHARS
+) -> AsyncIterator[str]:
+    """Join tokens into frames sent at most every window_ms, or sooner once max_chars are waiting"""
+    if window_ms <= 0:
+        async for token in tokens:
+            yield token
+        return
+    
+    loop = asyncio.get_running_loop()
+    window = window_ms / 1000
+    buffer: List[str] = []
+    size = 0
+    finished = False
+    waiter: Optional[asyncio.Future] = None
+    timer: Optional[asyncio.TimerHandle] = None
+    
+    def wake() -> None:
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+    
+    async def pump():
+        nonlocal size, finished
+        try:
+            async for token in tokens:
+                buffer.append(token)
+                size += len(token)
+                # While the window is open its timer wakes the sender; after that the first token does
+                if size >= max_chars or (timer is None and len(buffer) == 1):
+                    wake()
+        finally:
+            finished = True
+            wake()
+    
+    # Reading runs in its own task so a quiet spell still flushes what was buffered
+    reader = asyncio.create_task(pump())
+    next_flush = loop.time()
+    try:
+        while buffer or not finished:
+            now = loop.time()
+            if buffer and (finished or size >= max_chars or now >= next_flush):
+                frame = "".join(buffer)
+                buffer.clear()
+                size = 0
+                # A token arriving after a quiet spell goes out at once
+                next_flush = now + window
+                yield frame
+                continue
+            
+            waiter = loop.create_future()
+            if now < next_flush:
+                timer = loop.call_later(next_flush - now, wake)
+            try:
+                await waiter
+            finally:
+                waiter = None
+                if timer is not None:
+                    timer.cancel()
+                    timer = None
+        
+        # Surface an error raised while reading
+        await reader
+    finally:
+        reader.cancel()
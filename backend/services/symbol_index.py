@@ -0,0 +1,289 @@
+"""
+Symbol Index - where classes, functions and other definitions in indexed code live, for instant lookup
+
+Built from chunk metadata like the other search indexes: each chunk of a code
+file lists the symbols whose definition starts in it, so a lookup lands on the
+chunk to show and retrieval can put it first. Names are matched exactly, by
+prefix, or fuzzily as a subsequence, like an editor's go-to-symbol.
+"""
+import bisect
+import logging
+import re
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from parsers.code_parser import LANGUAGES
+from services.storage import atomic_write_json, load_json
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+
+# Chunk metadata stores symbols as one string, "kind:name:start:end:container;...", since Chroma only takes scalars
+SYMBOL_SEPARATOR = ";"
+FIELD_SEPARATOR = ":"
+
+MATCH_MODES = ("exact", "prefix", "fuzzy")
+
+# (name, kind, start_line, end_line, container)
+Symbol = Tuple[str, str, int, int, Optional[str]]
+
+
+def format_symbols(symbols: List[Dict]) -> str:
+    """Serialize parsed symbols for chunk metadata"""
+    return SYMBOL_SEPARATOR.join(
+        FIELD_SEPARATOR.join((
+            symbol["kind"], symbol["name"], str(symbol["start_line"]), str(symbol["end_line"]),
+            symbol["container"] or ""
+        ))
+        for symbol in symbols
+    )
+
+
+def parse_symbols(value) -> List[Symbol]:
+    """Symbols from chunk metadata"""
+    if not value:
+        return []
+    symbols = []
+    for entry in value.split(SYMBOL_SEPARATOR):
+        try:
+            kind, name, start, end, container = entry.split(FIELD_SEPARATOR)
+            symbols.append((name, kind, int(start), int(end), container or None))
+        except ValueError:
+            continue
+    return symbols
+
+
+class SymbolIndex:
+    """Name postings over the definitions in indexed files, persisted as JSON"""
+    
+    def __init__(self, persist_path: str):
+        self.persist_path = persist_path
+        self._lock = threading.RLock()
+        
+        # file_path -> {"folder", "language", "chunks"}; every indexed file, so backfill can tell what it has seen
+        self._files: Dict[str, Dict] = {}
+        self._file_of: Dict[str, str] = {}
+        # chunk id -> symbols defined in it
+        self._symbols: Dict[str, List[Symbol]] = {}
+        # Lowercased name -> chunk ids defining it
+        self._by_name: Dict[str, Set[str]] = {}
+        # Sorted lowercased names, one per line, for prefix and fuzzy matching; rebuilt on the first lookup after a change
+        self._names: Optional[List[str]] = None
+        self._names_text: Optional[str] = None
+        
+        self._load()
+        logger.info(f"SymbolIndex loaded with {len(self._symbols)} chunks defining {len(self._by_name)} names")
+    
+    def __len__(self) -> int:
+        return len(self._file_of)
+    
+    def add_documents(self, ids: List[str], documents: List[str], metadatas: List[Dict], save: bool = True) -> None:
+        """Add chunks and the symbols defined in them, replacing earlier versions of the same IDs"""
+        if not ids:
+            return
+        
+        with self._lock:
+            for doc_id, metadata in zip(ids, metadatas):
+                metadata = metadata or {}
+                file_path = metadata.get("file_path")
+                if not file_path:
+                    continue
+                self._remove_chunk(doc_id)
+                
+                entry = self._files.get(file_path)
+                if entry is None:
+                    file_type = metadata.get("file_type", "")
+                    entry = {
+                        "folder": metadata.get("folder_path", ""),
+                        "language": LANGUAGES.get(f".{file_type}"),
+                        "chunks": set(),
+                    }
+                    self._files[file_path] = entry
+                entry["chunks"].add(doc_id)
+                self._file_of[doc_id] = file_path
+                self._add_symbols(doc_id, parse_symbols(metadata.get("symbols")))
+            if save:
+                self.save()
+    
+    def delete_ids(self, ids: List[str], save: bool = True) -> int:
+        """Remove chunks by ID"""
+        with self._lock:
+            removed = sum(1 for doc_id in ids if self._remove_chunk(doc_id))
+            if removed and save:
+                self.save()
+        return removed
+    
+    def delete_by_folder(self, folder_path: str, save: bool = True) -> int:
+        """Remove every chunk of a folder"""
+        with self._lock:
+            ids = [
+                doc_id
+                for entry in self._files.values() if entry["folder"] == folder_path
+                for doc_id in entry["chunks"]
+            ]
+        return self.delete_ids(ids, save=save)
+    
+    def lookup(
+        self,
+        query: str,
+        match: str = "prefix",
+        kind: Optional[str] = None,
+        folder_path: Optional[str] = None,
+        limit: int = 50
+    ) -> List[Dict]:
+        """Definitions whose name matches query, case-insensitively, closest matches and shortest names first"""
+        if match not in MATCH_MODES:
+            raise ValueError(f"Unknown match mode: {match}")
+        key = query.strip().lower()
+        if not key:
+            return []
+        
+        with self._lock:
+            if match == "exact":
+                names = [key] if key in self._by_name else []
+            elif match == "prefix":
+                names = self._with_prefix(key)
+            else:
+                names = self._fuzzy(key)
+            
+            results = []
+            for name in names:
+                entries = self._entries(self._by_name[name], lambda symbol_name: symbol_name.lower() == name)
+                # Exact case first, then by location
+                entries.sort(key=lambda entry: (entry["name"] != query.strip(), entry["file_path"], entry["start_line"]))
+                for entry in entries:
+                    if kind is not None and entry["kind"] != kind:
+                        continue
+                    if folder_path is not None and self._files[entry["file_path"]]["folder"] != folder_path:
+                        continue
+                    results.append(entry)
+                    if len(results) >= limit:
+                        return results
+            return results
+    
+    def definitions(
+        self,
+        names: Iterable[str],
+        ids: Optional[Iterable[str]] = None,
+        ignore_case: bool = False
+    ) -> List[Dict]:
+        """Definitions of exactly these names, optionally only in the chunks ids"""
+        names = {name.lower() for name in names} if ignore_case else set(names)
+        allowed = None if ids is None else set(ids)
+        with self._lock:
+            chunk_ids = set()
+            for name in names:
+                chunk_ids.update(self._by_name.get(name.lower(), ()))
+            if allowed is not None:
+                chunk_ids &= allowed
+            if ignore_case:
+                entries = self._entries(chunk_ids, lambda name: name.lower() in names)
+            else:
+                entries = self._entries(chunk_ids, names.__contains__)
+        entries.sort(key=lambda entry: (entry["file_path"], entry["start_line"]))
+        return entries
+    
+    def clear(self) -> None:
+        """Remove everything from the index"""
+        with self._lock:
+            for postings in (self._files, self._file_of, self._symbols, self._by_name):
+                postings.clear()
+            self._names = self._names_text = None
+            self.save()
+    
+    def save(self) -> None:
+        """Persist the index to disk"""
+        with self._lock:
+            files = {
+                file_path: [entry["folder"], entry["language"], sorted(entry["chunks"])]
+                for file_path, entry in self._files.items()
+            }
+            symbols = {
+                doc_id: [list(symbol) for symbol in chunk_symbols]
+                for doc_id, chunk_symbols in self._symbols.items()
+            }
+            try:
+                atomic_write_json(self.persist_path, {"version": INDEX_VERSION, "files": files, "symbols": symbols})
+            except Exception as e:
+                logger.error(f"Failed to save symbol index: {e}")
+    
+    def _load(self) -> None:
+        data = load_json(self.persist_path, default=None)
+        if not data or data.get("version") != INDEX_VERSION:
+            return
+        for file_path, (folder, language, chunks) in data.get("files", {}).items():
+            self._files[file_path] = {"folder": folder, "language": language, "chunks": set(chunks)}
+            self._file_of.update((doc_id, file_path) for doc_id in chunks)
+        for doc_id, chunk_symbols in data.get("symbols", {}).items():
+            if doc_id in self._file_of:
+                self._add_symbols(doc_id, [tuple(symbol) for symbol in chunk_symbols])
+    
+    def _add_symbols(self, doc_id: str, symbols: List[Symbol]) -> None:
+        if not symbols:
+            return
+        self._symbols[doc_id] = symbols
+        for symbol in symbols:
+            self._by_name.setdefault(symbol[0].lower(), set()).add(doc_id)
+        self._names = self._names_text = None
+    
+    def _remove_chunk(self, doc_id: str) -> bool:
+        file_path = self._file_of.pop(doc_id, None)
+        if file_path is None:
+            return False
+        entry = self._files[file_path]
+        entry["chunks"].discard(doc_id)
+        if not entry["chunks"]:
+            del self._files[file_path]
+        
+        for symbol in self._symbols.pop(doc_id, ()):
+            name = symbol[0].lower()
+            chunk_ids = self._by_name.get(name)
+            if chunk_ids is not None:
+                chunk_ids.discard(doc_id)
+                if not chunk_ids:
+                    del self._by_name[name]
+            self._names = self._names_text = None
+        return True
+    
+    def _sorted_names(self) -> List[str]:
+        if self._names is None:
+            self._names = sorted(self._by_name)
+            self._names_text = "\n".join(self._names)
+        return self._names
+    
+    def _with_prefix(self, prefix: str) -> List[str]:
+        names = self._sorted_names()
+        start = bisect.bisect_left(names, prefix)
+        end = bisect.bisect_left(names, prefix + "\uffff", lo=start)
+        return sorted(names[start:end], key=len)
+    
+    def _fuzzy(self, key: str) -> List[str]:
+        """Names containing the query's characters in order, like "gdc" for get_document_count"""
+        self._sorted_names()
+        # One C-level scan over every name instead of a Python loop; each gap skips up to the
+        # next wanted character without backtracking, as a lazy "[^\n]*?" would
+        pattern = "^" + "".join(f"[^\n{re.escape(char)}]*{re.escape(char)}" for char in key) + "[^\n]*$"
+        names = re.findall(pattern, self._names_text, re.MULTILINE)
+        # Whole-word starts, then substrings, then scattered matches, shortest first within each
+        return sorted(names, key=lambda name: (not name.startswith(key), key not in name, len(name), name))
+    
+    def _entries(self, chunk_ids: Iterable[str], wanted: Callable[[str], bool]) -> List[Dict]:
+        """Definitions in chunk_ids whose name passes wanted"""
+        entries = []
+        for doc_id in chunk_ids:
+            file_path = self._file_of[doc_id]
+            for name, kind, start, end, container in self._symbols.get(doc_id, ()):
+                if not wanted(name):
+                    continue
+                entries.append({
+                    "name": name,
+                    "kind": kind,
+                    "container": container,
+                    "file_path": file_path,
+                    "language": self._files[file_path]["language"],
+                    "start_line": start,
+                    "end_line": end,
+                    "chunk_id": doc_id,
+                })
+        return entries
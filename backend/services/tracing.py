@@ -0,0 +1,360 @@
+"""
+Tracing - opt-in span trees and profiles for individual requests
+
+A trace is only active for requests that ask for one, so span() costs a
+single context variable lookup otherwise.
+"""
+import asyncio
+import cProfile
+import io
+import itertools
+import logging
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Finished traces kept in memory, oldest dropped first
+DEFAULT_CAPACITY = 100
+
+# Indexing a large folder makes one embedding span per chunk; later spans are only counted
+MAX_SPANS_PER_TRACE = 5000
+
+PROFILE_MODES = ("cprofile", "stack")
+DEFAULT_SAMPLE_INTERVAL_MS = 5
+PROFILE_TOP_FUNCTIONS = 60
+
+# Requests for these paths are never traced
+UNTRACED_PREFIXES = ("/traces", "/metrics", "/health")
+
+REQUEST_ID_HEADER = "x-request-id"
+TRACE_HEADER = "x-mnemora-trace"
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("mnemora_trace", default=None)
+_current_span: ContextVar[Optional[int]] = ContextVar("mnemora_span", default=None)
+
+
+def current_trace() -> Optional["Trace"]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Record a child span of whatever span is open; yields a dict for extra attributes"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield attrs
+        return
+    with trace.span(name, **attrs) as span_attrs:
+        yield span_attrs
+
+
+def mark(name: str, **attrs) -> None:
+    """Record an instant, such as the first generated token"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.mark(name, **attrs)
+
+
+def _lane() -> str:
+    """Thread and task a span ran on, so overlapping spans get their own row"""
+    lane = threading.current_thread().name
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    if task is not None:
+        lane += f"/{task.get_name()}"
+    return lane
+
+
+class Trace:
+    """Spans recorded for one request"""
+    
+    def __init__(self, trace_id: str, name: str, attrs: Optional[Dict] = None):
+        self.id = trace_id
+        self.name = name
+        self.attrs = attrs or {}
+        self.started_at = time.time()
+        self.origin = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.spans: List[Dict] = []
+        self.marks: List[Dict] = []
+        self.profile: Optional[Dict] = None
+        self.dropped_spans = 0
+        self._ids = itertools.count(1)
+    
+    def elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self.origin) * 1000, 3)
+    
+    @contextmanager
+    def span(self, name: str, **attrs):
+        span_id = next(self._ids)
+        parent = _current_span.get()
+        start = self.elapsed_ms()
+        token = _current_span.set(span_id)
+        try:
+            yield attrs
+        except BaseException as e:
+            attrs["error"] = type(e).__name__
+            raise
+        finally:
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # Closed from another context, e.g. an abandoned generator
+                pass
+            self.add_span(name, start, self.elapsed_ms(), parent=parent, span_id=span_id, **attrs)
+    
+    def add_span(
+        self,
+        name: str,
+        start_ms: float,
+        end_ms: float,
+        parent: Optional[int] = None,
+        span_id: Optional[int] = None,
+        **attrs
+    ) -> None:
+        """Record a span whose times were measured elsewhere"""
+        if len(self.spans) >= MAX_SPANS_PER_TRACE:
+            self.dropped_spans += 1
+            return
+        self.spans.append({
+            "id": span_id or next(self._ids),
+            "parent": parent,
+            "name": name,
+            "start_ms": start_ms,
+            "end_ms": end_ms,
+            "lane": _lane(),
+            "attrs": attrs,
+        })
+    
+    def mark(self, name: str, **attrs) -> None:
+        self.marks.append({"name": name, "at_ms": self.elapsed_ms(), "parent": _current_span.get(), "lane": _lane(), "attrs": attrs})
+    
+    def finish(self) -> None:
+        self.duration_ms = self.elapsed_ms()
+    
+    def summary(self) -> Dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "spans": len(self.spans),
+            "dropped_spans": self.dropped_spans,
+            "profile": self.profile["mode"] if self.profile else None,
+        }
+    
+    def to_dict(self) -> Dict:
+        """Spans nested under their parents, children in start order"""
+        nodes = {s["id"]: {**s, "children": []} for s in self.spans}
+        roots = []
+        for node in sorted(nodes.values(), key=lambda s: s["start_ms"]):
+            parent = nodes.get(node["parent"])
+            (parent["children"] if parent else roots).append(node)
+        
+        return {
+            **self.summary(),
+            "attrs": self.attrs,
+            "spans": roots,
+            "marks": self.marks,
+            "profile": self.profile,
+        }
+    
+    def to_chrome(self) -> Dict:
+        """Chrome trace event format, for chrome://tracing or Perfetto"""
+        lanes: Dict[str, int] = {}
+        events = []
+        
+        def tid(lane: str) -> int:
+            return lanes.setdefault(lane, len(lanes) + 1)
+        
+        events.append({
+            "name": self.name, "ph": "X", "pid": 1, "tid": tid("request"),
+            "ts": 0, "dur": int((self.duration_ms or self.elapsed_ms()) * 1000), "args": self.attrs,
+        })
+        for s in sorted(self.spans, key=lambda s: s["start_ms"]):
+            events.append({
+                "name": s["name"], "ph": "X", "pid": 1, "tid": tid(s["lane"]),
+                "ts": int(s["start_ms"] * 1000), "dur": int((s["end_ms"] - s["start_ms"]) * 1000), "args": s["attrs"],
+            })
+        for m in self.marks:
+            events.append({
+                "name": m["name"], "ph": "i", "s": "t", "pid": 1, "tid": tid(m["lane"]),
+                "ts": int(m["at_ms"] * 1000), "args": m["attrs"],
+            })
+        for lane, lane_id in lanes.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": lane_id, "args": {"name": lane}})
+        
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"trace_id": self.id, "name": self.name}}
+
+
+class CProfileCapture:
+    """Deterministic profile of everything the event loop thread runs meanwhile"""
+    
+    mode = "cprofile"
+    
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+    
+    def start(self) -> None:
+        self.profiler.enable()
+    
+    def stop(self) -> Dict:
+        self.profiler.disable()
+        out = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=out)
+        stats.sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+        return {"mode": self.mode, "text": out.getvalue()}
+
+
+class StackSampler:
+    """Wall-clock sampling of every thread's stack, as collapsed flame graph lines"""
+    
+    mode = "stack"
+    
+    def __init__(self, interval_ms: float = DEFAULT_SAMPLE_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="mnemora-stack-sampler", daemon=True)
+    
+    def start(self) -> None:
+        self._thread.start()
+    
+    def stop(self) -> Dict:
+        self._stop.set()
+        self._thread.join()
+        collapsed = "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+        return {"mode": self.mode, "interval_ms": self.interval * 1000, "samples": self.samples, "text": collapsed}
+    
+    def _run(self) -> None:
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            names.update((t.ident, t.name) for t in threading.enumerate())
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                self.stacks[self._collapse(names.get(ident, str(ident)), frame)] += 1
+            self.samples += 1
+    
+    @staticmethod
+    def _collapse(thread_name: str, frame) -> str:
+        parts = []
+        while frame is not None:
+            code = frame.f_code
+            parts.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+            frame = frame.f_back
+        parts.append(thread_name)
+        return ";".join(reversed(parts))
+
+
+class Tracer:
+    """Bounded store of finished traces and profiles armed for chosen request ids"""
+    
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, trace_all: bool = False):
+        self.capacity = capacity
+        self.trace_all = trace_all
+        self._traces: "OrderedDict[str, Trace]" = OrderedDict()
+        self._armed: Dict[str, Dict] = {}
+        # cProfile and the sampler both observe the whole process, so one at a time
+        self._profile_lock = threading.Lock()
+    
+    def wants(self, request_id: str, opted_in: bool) -> bool:
+        return self.trace_all or opted_in or request_id in self._armed
+    
+    def finish(self, trace: Trace) -> None:
+        trace.finish()
+        self._traces[trace.id] = trace
+        self._traces.move_to_end(trace.id)
+        while len(self._traces) > self.capacity:
+            self._traces.popitem(last=False)
+    
+    def get(self, trace_id: str) -> Optional[Trace]:
+        return self._traces.get(trace_id)
+    
+    def list(self, limit: int = 50) -> List[Dict]:
+        """Most recent first"""
+        return [trace.summary() for trace in list(reversed(self._traces.values()))[:limit]]
+    
+    def clear(self) -> None:
+        self._traces.clear()
+    
+    def arm_profile(self, request_id: str, mode: str, interval_ms: float = DEFAULT_SAMPLE_INTERVAL_MS) -> None:
+        """Profile the request that arrives with this id"""
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode: {mode}")
+        self._armed[request_id] = {"mode": mode, "interval_ms": interval_ms}
+    
+    @contextmanager
+    def profiling(self, trace: Trace):
+        """Run the profile armed for this trace's request id, if any"""
+        armed = self._armed.pop(trace.id, None)
+        if armed is None:
+            yield
+            return
+        
+        if not self._profile_lock.acquire(blocking=False):
+            logger.warning(f"Skipped profiling request {trace.id}: another profile is running")
+            trace.profile = {"mode": armed["mode"], "error": "Another profile was already running"}
+            yield
+            return
+        
+        profiler = CProfileCapture() if armed["mode"] == "cprofile" else StackSampler(armed["interval_ms"])
+        try:
+            profiler.start()
+            yield
+        finally:
+            try:
+                trace.profile = profiler.stop()
+            finally:
+                self._profile_lock.release()
+
+
+class TracingMiddleware:
+    """ASGI middleware that traces opted-in requests until their last body byte"""
+    
+    def __init__(self, app, tracer: Tracer):
+        self.app = app
+        self.tracer = tracer
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(UNTRACED_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+        
+        headers = {key.decode().lower(): value.decode() for key, value in scope["headers"]}
+        request_id = headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+        opted_in = headers.get(TRACE_HEADER, "").lower() in ("1", "true", "yes")
+        if not self.tracer.wants(request_id, opted_in):
+            await self.app(scope, receive, send)
+            return
+        
+        async def send_with_id(message):
+            # Tell the client which id to fetch the trace under
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(REQUEST_ID_HEADER.encode(), request_id.encode())]
+            await send(message)
+        
+        trace = Trace(request_id, f"{scope['method']} {scope['path']}")
+        token = _current_trace.set(trace)
+        try:
+            with self.tracer.profiling(trace):
+                await self.app(scope, receive, send_with_id)
+        finally:
+            _current_trace.reset(token)
+            route = scope.get("route")
+            if route is not None:
+                trace.attrs["route"] = route.path
+            self.tracer.finish(trace)
@@ -0,0 +1,448 @@
+"""
+Vector Service - the vector store and search indexes in their own process, shared by API workers
+
+Chroma's embedded client cannot be opened by several processes at once, so
+running the API with more than one worker needs the stores to live elsewhere.
+This module serves them over a Unix socket (or localhost TCP) and provides
+clients with the same methods as VectorStore, LexicalIndex, MetadataIndex,
+LinkGraph and SymbolIndex:
+
+    cd backend && python -m services.vector_service --socket /tmp/mnemora-vector.sock
+    MNEMORA_VECTOR_SERVICE=unix:/tmp/mnemora-vector.sock uvicorn main:app --workers 4
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+from services.streaming import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+# Methods callable over the socket, per store
+EXPOSED_METHODS = {
+    "vector_store": (
+        "add_documents", "restore_documents", "query_batch", "get_documents", "delete_by_folder",
+        "get_document_count", "get_dimension", "get_folders", "clear_all",
+        "get_reduction", "get_reduction_status", "adopt_reduction",
+    ),
+    "lexical_index": ("add_documents", "search", "delete_ids", "delete_by_folder", "clear", "save", "count"),
+    "metadata_index": (
+        "add_documents", "resolve", "ids_with_path_prefix", "delete_ids", "delete_by_folder", "clear", "save", "count",
+    ),
+    "link_graph": (
+        "add_documents", "note", "neighbors", "linked_notes", "chunks_of", "tags", "files_with_tag",
+        "delete_ids", "delete_by_folder", "clear", "save", "count",
+    ),
+    "symbol_index": (
+        "add_documents", "lookup", "definitions", "delete_ids", "delete_by_folder", "clear", "save", "count",
+    ),
+}
+
+# Host name used in URLs sent over a Unix socket
+SOCKET_HOST = "http://vector-service"
+
+DEFAULT_TIMEOUT = httpx.Timeout(120.0, connect=5.0)
+
+
+class VectorServiceError(Exception):
+    """The vector service could not be reached or a store call failed inside it"""
+
+
+def create_app(stores: Dict[str, object]):
+    """ASGI app calling store methods by name; each call runs in a worker thread"""
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse, Response, StreamingResponse
+    
+    app = FastAPI(title="Mnemora vector service")
+    
+    def resolve(target: str, method: str):
+        store = stores.get(target)
+        if store is None or method not in EXPOSED_METHODS.get(target, ()):
+            return None
+        if method == "count":
+            return lambda: len(store)
+        return getattr(store, method)
+    
+    @app.get("/health")
+    async def health():
+        return {"status": "ok", "stores": sorted(stores)}
+    
+    @app.get("/{target}/iter_documents")
+    async def iter_documents(target: str, batch_size: int = 1000, include_embeddings: bool = False):
+        store = stores.get(target)
+        if store is None or not hasattr(store, "iter_documents"):
+            return JSONResponse({"detail": f"Unknown store: {target}"}, status_code=404)
+        # One page per line; Starlette drains the generator in a worker thread
+        pages = (
+            dumps(page) + "\n"
+            for page in store.iter_documents(batch_size=batch_size, include_embeddings=include_embeddings)
+        )
+        return StreamingResponse(pages, media_type="application/x-ndjson")
+    
+    @app.post("/{target}/{method}")
+    async def call(target: str, method: str, request: Request):
+        function = resolve(target, method)
+        if function is None:
+            return JSONResponse({"detail": f"Unknown method: {target}.{method}"}, status_code=404)
+        
+        body = await request.body()
+        kwargs = loads(body) if body else {}
+        try:
+            result = await asyncio.to_thread(function, **kwargs)
+        except Exception as e:
+            logger.error(f"{target}.{method} failed: {e}")
+            return JSONResponse({"detail": f"{type(e).__name__}: {e}"}, status_code=500)
+        return Response(dumps(result), media_type="application/json")
+    
+    return app
+
+
+class _ServiceClient:
+    """Blocking calls to one store in the vector service; safe to share between threads"""
+    
+    target = ""
+    
+    def __init__(self, address: str, timeout: httpx.Timeout = DEFAULT_TIMEOUT):
+        self.address = address
+        if address.startswith("unix:"):
+            transport = httpx.HTTPTransport(uds=address[len("unix:"):])
+            self._http = httpx.Client(transport=transport, base_url=SOCKET_HOST, timeout=timeout)
+        else:
+            self._http = httpx.Client(base_url=address, timeout=timeout)
+    
+    def wait_until_ready(self, timeout: float = 120.0) -> None:
+        """Block until the service answers, e.g. while it is still opening its stores"""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                if self._http.get("/health").status_code == 200:
+                    return
+            except httpx.TransportError as e:
+                if time.monotonic() >= deadline:
+                    raise VectorServiceError(f"Vector service at {self.address} is not reachable: {e}")
+            time.sleep(0.1)
+    
+    def _call(self, method: str, **kwargs):
+        try:
+            response = self._http.post(f"/{self.target}/{method}", content=dumps(kwargs))
+        except httpx.HTTPError as e:
+            raise VectorServiceError(f"Vector service at {self.address} is not reachable: {e}")
+        if response.status_code != 200:
+            raise VectorServiceError(f"{self.target}.{method} failed: {response.text}")
+        return loads(response.content)
+    
+    def _iter_documents(self, batch_size: int, include_embeddings: bool = False) -> Iterator[List[Dict]]:
+        params = {"batch_size": batch_size, "include_embeddings": include_embeddings}
+        with self._http.stream("GET", f"/{self.target}/iter_documents", params=params) as response:
+            for line in response.iter_lines():
+                if line:
+                    yield loads(line)
+    
+    def close(self) -> None:
+        self._http.close()
+
+
+class VectorStoreClient(_ServiceClient):
+    """VectorStore methods served by the vector service"""
+    
+    target = "vector_store"
+    
+    def add_documents(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: List[Dict]
+    ) -> None:
+        if not ids:
+            return
+        self._call("add_documents", ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+    
+    def restore_documents(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: List[Dict]
+    ) -> None:
+        if not ids:
+            return
+        self._call("restore_documents", ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+    
+    def query(
+        self,
+        query_embedding: List[float],
+        top_k: int = 5,
+        where: Optional[Dict] = None,
+        include_embeddings: bool = False,
+        ids: Optional[List[str]] = None,
+        include_payload: bool = True
+    ) -> List[Dict]:
+        if not query_embedding:
+            return []
+        return self.query_batch(
+            [query_embedding], top_k=top_k, where=where, include_embeddings=include_embeddings, ids=ids,
+            include_payload=include_payload
+        )[0]
+    
+    def query_batch(
+        self,
+        query_embeddings: List[List[float]],
+        top_k: int = 5,
+        where: Optional[Dict] = None,
+        include_embeddings: bool = False,
+        ids: Optional[List[str]] = None,
+        include_payload: bool = True
+    ) -> List[List[Dict]]:
+        if not query_embeddings:
+            return []
+        return self._call(
+            "query_batch",
+            query_embeddings=query_embeddings,
+            top_k=top_k,
+            where=where,
+            include_embeddings=include_embeddings,
+            ids=ids,
+            include_payload=include_payload
+        )
+    
+    def get_documents(self, ids: List[str], include_embeddings: bool = False, include_payload: bool = True) -> List[Dict]:
+        if not ids:
+            return []
+        return self._call(
+            "get_documents", ids=ids, include_embeddings=include_embeddings, include_payload=include_payload
+        )
+    
+    def iter_documents(self, batch_size: int = 1000, include_embeddings: bool = False) -> Iterator[List[Dict]]:
+        return self._iter_documents(batch_size, include_embeddings)
+    
+    def delete_by_folder(self, folder_path: str) -> int:
+        return self._call("delete_by_folder", folder_path=folder_path)
+    
+    def get_document_count(self) -> int:
+        return self._call("get_document_count")
+    
+    def get_dimension(self) -> Optional[int]:
+        return self._call("get_dimension")
+    
+    def get_folders(self) -> List[str]:
+        return self._call("get_folders")
+    
+    def clear_all(self) -> None:
+        self._call("clear_all")
+    
+    def get_reduction(self) -> Dict:
+        return self._call("get_reduction")
+    
+    def get_reduction_status(self) -> Dict:
+        return self._call("get_reduction_status")
+    
+    def adopt_reduction(self, metadata: Dict, state: Optional[Dict] = None) -> None:
+        self._call("adopt_reduction", metadata=metadata, state=state)
+
+
+class LexicalIndexClient(_ServiceClient):
+    """LexicalIndex methods served by the vector service"""
+    
+    target = "lexical_index"
+    
+    def __len__(self) -> int:
+        return self._call("count")
+    
+    def add_documents(self, ids: List[str], documents: List[str], metadatas: List[Dict], save: bool = True) -> None:
+        if not ids:
+            return
+        self._call("add_documents", ids=ids, documents=documents, metadatas=metadatas, save=save)
+    
+    def delete_ids(self, ids: List[str], save: bool = True) -> int:
+        return self._call("delete_ids", ids=ids, save=save)
+    
+    def delete_by_folder(self, folder_path: str, save: bool = True) -> int:
+        return self._call("delete_by_folder", folder_path=folder_path, save=save)
+    
+    def search(self, query: str, top_k: int = 5, ids: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        return [(doc_id, score) for doc_id, score in self._call("search", query=query, top_k=top_k, ids=ids)]
+    
+    def clear(self) -> None:
+        self._call("clear")
+    
+    def save(self) -> None:
+        self._call("save")
+
+
+class MetadataIndexClient(_ServiceClient):
+    """MetadataIndex methods served by the vector service"""
+    
+    target = "metadata_index"
+    
+    def __len__(self) -> int:
+        return self._call("count")
+    
+    def add_documents(self, ids: List[str], documents: List[str], metadatas: List[Dict], save: bool = True) -> None:
+        if not ids:
+            return
+        # Only metadata is indexed, so the text stays here
+        self._call("add_documents", ids=ids, documents=[], metadatas=metadatas, save=save)
+    
+    def delete_ids(self, ids: List[str], save: bool = True) -> int:
+        return self._call("delete_ids", ids=ids, save=save)
+    
+    def delete_by_folder(self, folder_path: str, save: bool = True) -> int:
+        return self._call("delete_by_folder", folder_path=folder_path, save=save)
+    
+    def resolve(self, filters: Dict) -> Optional[List[str]]:
+        return self._call("resolve", filters=filters)
+    
+    def ids_with_path_prefix(self, prefix: str) -> List[str]:
+        return self._call("ids_with_path_prefix", prefix=prefix)
+    
+    def clear(self) -> None:
+        self._call("clear")
+    
+    def save(self) -> None:
+        self._call("save")
+
+
+class LinkGraphClient(_ServiceClient):
+    """LinkGraph methods served by the vector service"""
+    
+    target = "link_graph"
+    
+    def __len__(self) -> int:
+        return self._call("count")
+    
+    def add_documents(self, ids: List[str], documents: List[str], metadatas: List[Dict], save: bool = True) -> None:
+        if not ids:
+            return
+        # Links and tags are read from metadata, so the text stays here
+        self._call("add_documents", ids=ids, documents=[], metadatas=metadatas, save=save)
+    
+    def delete_ids(self, ids: List[str], save: bool = True) -> int:
+        return self._call("delete_ids", ids=ids, save=save)
+    
+    def delete_by_folder(self, folder_path: str, save: bool = True) -> int:
+        return self._call("delete_by_folder", folder_path=folder_path, save=save)
+    
+    def note(self, file_path: str) -> Optional[Dict]:
+        return self._call("note", file_path=file_path)
+    
+    def neighbors(self, file_path: str, depth: int = 1, limit: int = 200) -> List[Dict]:
+        return self._call("neighbors", file_path=file_path, depth=depth, limit=limit)
+    
+    def linked_notes(self, file_paths: List[str], limit: int = 50) -> Dict[str, str]:
+        return self._call("linked_notes", file_paths=file_paths, limit=limit)
+    
+    def chunks_of(self, file_paths: List[str]) -> Dict[str, str]:
+        return self._call("chunks_of", file_paths=list(file_paths))
+    
+    def tags(self) -> Dict[str, int]:
+        return self._call("tags")
+    
+    def files_with_tag(self, tag: str) -> List[str]:
+        return self._call("files_with_tag", tag=tag)
+    
+    def clear(self) -> None:
+        self._call("clear")
+    
+    def save(self) -> None:
+        self._call("save")
+
+
+class SymbolIndexClient(_ServiceClient):
+    """SymbolIndex methods served by the vector service"""
+    
+    target = "symbol_index"
+    
+    def __len__(self) -> int:
+        return self._call("count")
+    
+    def add_documents(self, ids: List[str], documents: List[str], metadatas: List[Dict], save: bool = True) -> None:
+        if not ids:
+            return
+        # Symbols are read from metadata, so the text stays here
+        self._call("add_documents", ids=ids, documents=[], metadatas=metadatas, save=save)
+    
+    def delete_ids(self, ids: List[str], save: bool = True) -> int:
+        return self._call("delete_ids", ids=ids, save=save)
+    
+    def delete_by_folder(self, folder_path: str, save: bool = True) -> int:
+        return self._call("delete_by_folder", folder_path=folder_path, save=save)
+    
+    def lookup(
+        self,
+        query: str,
+        match: str = "prefix",
+        kind: Optional[str] = None,
+        folder_path: Optional[str] = None,
+        limit: int = 50
+    ) -> List[Dict]:
+        return self._call("lookup", query=query, match=match, kind=kind, folder_path=folder_path, limit=limit)
+    
+    def definitions(self, names: List[str], ids: Optional[List[str]] = None, ignore_case: bool = False) -> List[Dict]:
+        return self._call(
+            "definitions", names=list(names), ids=None if ids is None else list(ids), ignore_case=ignore_case
+        )
+    
+    def clear(self) -> None:
+        self._call("clear")
+    
+    def save(self) -> None:
+        self._call("save")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve Mnemora's vector store and search indexes to API workers")
+    parser.add_argument("--socket", help="Listen on this Unix socket")
+    parser.add_argument("--port", type=int, help="Listen on this localhost port instead")
+    args = parser.parse_args()
+    if not args.socket and not args.port:
+        parser.error("one of --socket or --port is required")
+    
+    import uvicorn
+    
+    # Opened exactly as the API opens them, from the same MNEMORA_* settings
+    from main import DATA_DIR, backfill_index, create_vector_store
+    from services.lexical_index import LexicalIndex
+    from services.link_graph import LinkGraph
+    from services.metadata_index import MetadataIndex
+    from services.symbol_index import SymbolIndex
+    
+    os.makedirs(DATA_DIR, exist_ok=True)
+    vector_store = create_vector_store(DATA_DIR)
+    lexical_index = LexicalIndex(persist_path=os.path.join(DATA_DIR, 'lexical_index.json'))
+    if len(lexical_index) == 0:
+        backfill_index(lexical_index, vector_store)
+    metadata_index = MetadataIndex(persist_path=os.path.join(DATA_DIR, 'metadata_index.json'))
+    if len(metadata_index) == 0:
+        backfill_index(metadata_index, vector_store)
+    link_graph = LinkGraph(persist_path=os.path.join(DATA_DIR, 'link_graph.json'))
+    if len(link_graph) == 0:
+        backfill_index(link_graph, vector_store)
+    symbol_index = SymbolIndex(persist_path=os.path.join(DATA_DIR, 'symbol_index.json'))
+    if len(symbol_index) == 0:
+        backfill_index(symbol_index, vector_store)
+    
+    app = create_app({
+        "vector_store": vector_store,
+        "lexical_index": lexical_index,
+        "metadata_index": metadata_index,
+        "link_graph": link_graph,
+        "symbol_index": symbol_index,
+    })
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        logger.info(f"Vector service listening on {args.socket}")
+        uvicorn.run(app, uds=args.socket, log_level="warning")
+    else:
+        logger.info(f"Vector service listening on 127.0.0.1:{args.port}")
+        uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,40 @@
 """
 ChromaDB Vector Store for document embeddings
 """
+import inspect
 import logging
 import os
 from typing import Dict, List, Optional
 
-import chromadb
-from chromadb.config import Settings
+import numpy as np
+
+from services.embedding_reduction import EmbeddingReducer, METADATA_MODE_KEY, METADATA_DIM_KEY, resolve_reducer
 
 logger = logging.getLogger(__name__)
 
+COLLECTION_NAME = "mnemora_documents"
+
+# Up to this many candidate ids are scored directly instead of through a filtered HNSW search
+EXACT_SEARCH_MAX_IDS = 64
+
+# Chroma caps the rows per write, so a rebuild re-adds vectors in batches
+REBUILD_BATCH = 5000
+
+# Where a collection being rebuilt lives until it replaces the main one
+REBUILD_COLLECTION_NAME = f"{COLLECTION_NAME}_rebuild"
+
 
 class VectorStore:
     """Wrapper for ChromaDB vector database operations"""
     
-    def __init__(self, persist_directory: str):
+    def __init__(self, persist_directory: str, reducer: Optional[EmbeddingReducer] = None):
         self.persist_directory = persist_directory
         os.makedirs(persist_directory, exist_ok=True)
         
+        # Imported here: chromadb takes most of a second to import, which would delay startup
+        import chromadb
+        from chromadb.config import Settings
+        
         # Initialize ChromaDB
         self.client = chromadb.PersistentClient(
             path=persist_directory,
@@ -28,9 +45,36 @@ class VectorStore:
         )
         
         # Get or create the main collection
+        requested = reducer or EmbeddingReducer()
         self.collection = self.client.get_or_create_collection(
-            name="mnemora_documents",
-            metadata={"hnsw:space": "cosine"}
+            name=COLLECTION_NAME,
+            metadata=self._collection_metadata(requested)
+        )
+        
+        # Reduction is fixed at creation, so rebuild an empty collection that records another one
+        state_path = os.path.join(persist_directory, 'reduction.npz')
+        self._state_path = state_path
+        if self.collection.count() == 0:
+            recorded = self.collection.metadata or {}
+            if (recorded.get(METADATA_MODE_KEY), recorded.get(METADATA_DIM_KEY)) != (requested.mode, requested.dim or 0):
+                self.client.delete_collection(COLLECTION_NAME)
+                self.collection = self.client.create_collection(
+                    name=COLLECTION_NAME,
+                    metadata=self._collection_metadata(requested)
+                )
+            # A projection fitted for an earlier corpus does not carry over
+            EmbeddingReducer(state_path=state_path).reset()
+        
+        # Older Chroma releases cannot restrict query() to ids; such searches then score the candidates locally
+        self._query_takes_ids = "ids" in inspect.signature(self.collection.query).parameters
+        if not self._query_takes_ids:
+            logger.info("Installed chromadb has no query(ids=...), id-restricted searches score candidates directly")
+        
+        self.reducer = resolve_reducer(
+            self.collection.metadata,
+            requested,
+            self.collection.count(),
+            state_path=state_path
         )
         
         logger.info(f"VectorStore initialized at {persist_directory}")
@@ -47,6 +91,8 @@ class VectorStore:
         if not ids:
             return
         
+        embeddings = self.reducer.project_documents(embeddings)
+        
         self.collection.add(
             ids=ids,
             embeddings=embeddings,
@@ -54,37 +100,192 @@ class VectorStore:
             metadatas=metadatas
         )
         logger.info(f"Added {len(ids)} documents to vector store")
+        if not self.reducer.fitted:
+            self._fit_reduction()
+    
+    def restore_documents(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: List[Dict]
+    ) -> None:
+        """Add documents whose embeddings are already projected, e.g. from a snapshot"""
+        if not ids:
+            return
+        
+        self.collection.upsert(
+            ids=ids,
+            embeddings=embeddings,
+            documents=documents,
+            metadatas=metadatas
+        )
     
     def query(
         self,
         query_embedding: List[float],
         top_k: int = 5,
-        where: Optional[Dict] = None
+        where: Optional[Dict] = None,
+        include_embeddings: bool = False,
+        ids: Optional[List[str]] = None,
+        include_payload: bool = True
     ) -> List[Dict]:
         """Query the collection for similar documents"""
         if not query_embedding:
             return []
+        return self.query_batch(
+            [query_embedding], top_k=top_k, where=where, include_embeddings=include_embeddings, ids=ids,
+            include_payload=include_payload
+        )[0]
+    
+    def query_batch(
+        self,
+        query_embeddings: List[List[float]],
+        top_k: int = 5,
+        where: Optional[Dict] = None,
+        include_embeddings: bool = False,
+        ids: Optional[List[str]] = None,
+        include_payload: bool = True
+    ) -> List[List[Dict]]:
+        """Query the collection for several embeddings in one call, only among ids when given
+        
+        Without include_payload, results carry only ids and scores, so a caller can rank
+        many candidates and fetch text and metadata for the few it keeps with get_documents.
+        """
+        if not query_embeddings:
+            return []
+        if ids is not None and not ids:
+            return [[] for _ in query_embeddings]
+        
+        query_embeddings = self.reducer.project_queries(query_embeddings)
+        if ids is not None and (len(ids) <= EXACT_SEARCH_MAX_IDS or not self._query_takes_ids):
+            return self._query_ids_exactly(query_embeddings, top_k, where, include_embeddings, ids, include_payload)
+        
+        include = _include(include_payload, include_embeddings) + ["distances"]
         
+        # Chroma scores only the listed ids, rather than searching everything and filtering after;
+        # ids is left out entirely otherwise, since releases without it reject the argument
+        restrict = {"ids": ids} if ids is not None else {}
         results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k,
+            query_embeddings=query_embeddings,
+            n_results=min(top_k, len(ids)) if ids is not None else top_k,
             where=where,
-            include=["documents", "metadatas", "distances"]
+            include=include,
+            **restrict
         )
         
-        # Format results
-        formatted = []
-        if results and results["ids"] and results["ids"][0]:
-            for i, doc_id in enumerate(results["ids"][0]):
+        # Format results, one list per query embedding
+        batches = []
+        for q in range(len(query_embeddings)):
+            formatted = []
+            if results and results["ids"] and results["ids"][q]:
+                for i, doc_id in enumerate(results["ids"][q]):
+                    formatted.append({
+                        "id": doc_id,
+                        "distance": results["distances"][q][i] if results["distances"] else 0,
+                        "score": 1 - (results["distances"][q][i] if results["distances"] else 0)  # Convert distance to similarity
+                    })
+                    if include_payload:
+                        formatted[-1]["content"] = results["documents"][q][i] if results["documents"] else ""
+                        formatted[-1]["metadata"] = results["metadatas"][q][i] if results["metadatas"] else {}
+                    if include_embeddings:
+                        formatted[-1]["embedding"] = results["embeddings"][q][i]
+            batches.append(formatted)
+        
+        return batches
+    
+    def _query_ids_exactly(
+        self,
+        query_embeddings: List[List[float]],
+        top_k: int,
+        where: Optional[Dict],
+        include_embeddings: bool,
+        ids: List[str],
+        include_payload: bool
+    ) -> List[List[Dict]]:
+        """Cosine-score a few candidates in numpy; a filtered HNSW search costs the same however few pass"""
+        results = self.collection.get(ids=ids, where=where, include=_include(include_payload, True))
+        if not results or not results["ids"]:
+            return [[] for _ in query_embeddings]
+        
+        vectors = np.asarray(results["embeddings"], dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        
+        batches = []
+        for similarities in queries @ vectors.T:
+            formatted = []
+            for i in np.argsort(-similarities)[:top_k]:
                 formatted.append({
-                    "id": doc_id,
-                    "content": results["documents"][0][i] if results["documents"] else "",
-                    "metadata": results["metadatas"][0][i] if results["metadatas"] else {},
-                    "distance": results["distances"][0][i] if results["distances"] else 0,
-                    "score": 1 - (results["distances"][0][i] if results["distances"] else 0)  # Convert distance to similarity
+                    "id": results["ids"][i],
+                    "distance": float(1 - similarities[i]),
+                    "score": float(similarities[i])
                 })
+                if include_payload:
+                    formatted[-1]["content"] = results["documents"][i] if results["documents"] else ""
+                    formatted[-1]["metadata"] = results["metadatas"][i] if results["metadatas"] else {}
+                if include_embeddings:
+                    formatted[-1]["embedding"] = results["embeddings"][i]
+            batches.append(formatted)
         
-        return formatted
+        return batches
+    
+    def get_documents(self, ids: List[str], include_embeddings: bool = False, include_payload: bool = True) -> List[Dict]:
+        """Fetch documents by ID, preserving the requested order; without include_payload only ids and embeddings"""
+        if not ids:
+            return []
+        
+        include = _include(include_payload, include_embeddings)
+        
+        results = self.collection.get(
+            ids=ids,
+            include=include
+        )
+        
+        by_id = {}
+        if results and results["ids"]:
+            for i, doc_id in enumerate(results["ids"]):
+                by_id[doc_id] = {"id": doc_id}
+                if include_payload:
+                    by_id[doc_id]["content"] = results["documents"][i] if results["documents"] else ""
+                    by_id[doc_id]["metadata"] = results["metadatas"][i] if results["metadatas"] else {}
+                if include_embeddings:
+                    by_id[doc_id]["embedding"] = results["embeddings"][i]
+        
+        return [by_id[doc_id] for doc_id in ids if doc_id in by_id]
+    
+    def iter_documents(self, batch_size: int = 1000, include_embeddings: bool = False):
+        """Yield pages of stored documents with their metadata, and stored embeddings if asked"""
+        include = ["documents", "metadatas"]
+        if include_embeddings:
+            include.append("embeddings")
+        
+        offset = 0
+        while True:
+            results = self.collection.get(
+                include=include,
+                limit=batch_size,
+                offset=offset
+            )
+            
+            if not results or not results["ids"]:
+                return
+            
+            page = [
+                {
+                    "id": doc_id,
+                    "content": results["documents"][i] if results["documents"] else "",
+                    "metadata": results["metadatas"][i] if results["metadatas"] else {},
+                }
+                for i, doc_id in enumerate(results["ids"])
+            ]
+            if include_embeddings:
+                for i, doc in enumerate(page):
+                    doc["embedding"] = results["embeddings"][i]
+            yield page
+            
+            offset += len(results["ids"])
     
     def delete_by_folder(self, folder_path: str) -> int:
         """Delete all documents from a specific folder"""
@@ -109,6 +310,13 @@ class VectorStore:
         """Get total number of documents in the collection"""
         return self.collection.count()
     
+    def get_dimension(self) -> Optional[int]:
+        """Width of the stored vectors, None while the collection is empty"""
+        results = self.collection.get(limit=1, include=["embeddings"])
+        if results is None or not len(results["ids"]):
+            return None
+        return len(results["embeddings"][0])
+    
     def get_folders(self) -> List[str]:
         """Get list of indexed folders"""
         try:
@@ -127,11 +335,98 @@ class VectorStore:
     def clear_all(self) -> None:
         """Clear all documents from the collection"""
         try:
-            self.client.delete_collection("mnemora_documents")
+            self.client.delete_collection(COLLECTION_NAME)
+            self.reducer.reset()
             self.collection = self.client.create_collection(
-                name="mnemora_documents",
-                metadata={"hnsw:space": "cosine"}
+                name=COLLECTION_NAME,
+                metadata=self._collection_metadata(self.reducer)
             )
             logger.info("Cleared all documents from vector store")
         except Exception as e:
             logger.error(f"Error clearing vector store: {e}")
+    
+    def get_reduction(self) -> Dict:
+        """The reduction stored vectors were projected with, including a fitted PCA projection"""
+        return {**self.reducer.to_metadata(), "state": self.reducer.get_state()}
+    
+    def get_reduction_status(self) -> Dict:
+        """Whether stored vectors are reduced yet"""
+        return self.reducer.status()
+    
+    def adopt_reduction(self, metadata: Dict, state: Optional[Dict] = None) -> None:
+        """Take over another store's reduction so its projected vectors can be restored here"""
+        if self.reducer.matches(metadata, state):
+            return
+        if self.collection.count() > 0:
+            raise ValueError(
+                f"Index holds vectors reduced with {self.reducer.mode}/{self.reducer.dim}; "
+                f"clear it before restoring vectors reduced with {metadata.get(METADATA_MODE_KEY, 'none')}"
+            )
+        
+        reducer = EmbeddingReducer.from_metadata(metadata, state_path=self._state_path)
+        reducer.reset()
+        if state is not None:
+            reducer.set_state(state["mean"], state["components"])
+        
+        self.client.delete_collection(COLLECTION_NAME)
+        self.collection = self.client.create_collection(
+            name=COLLECTION_NAME,
+            metadata=self._collection_metadata(reducer)
+        )
+        self.reducer = reducer
+        logger.info(f"Vector store now uses reduction {reducer.mode}/{reducer.dim}")
+    
+    def _fit_reduction(self) -> None:
+        """Fit PCA once enough full-width vectors are stored, then rebuild the collection projected, page by page
+        
+        The collection's dimension is fixed by its first vectors, so the projected ones go into a
+        new collection under a temporary name, swapped in only once it holds every document.
+        """
+        total = self.collection.count()
+        if total < self.reducer.min_samples:
+            return
+        
+        def pages():
+            for offset in range(0, total, REBUILD_BATCH):
+                results = self.collection.get(include=["embeddings"], limit=REBUILD_BATCH, offset=offset)
+                if results and len(results["ids"]):
+                    yield np.asarray(results["embeddings"], dtype=np.float32)
+        
+        # Fitted apart from the store's reducer, so queries keep matching the old collection meanwhile
+        fitted = EmbeddingReducer(mode=self.reducer.mode, dim=self.reducer.dim)
+        if not fitted.fit(pages(), total):
+            return
+        
+        try:
+            self.client.delete_collection(REBUILD_COLLECTION_NAME)
+        except Exception:
+            pass
+        rebuilt = self.client.create_collection(name=REBUILD_COLLECTION_NAME, metadata=self._collection_metadata(fitted))
+        for page in self.iter_documents(batch_size=REBUILD_BATCH, include_embeddings=True):
+            rebuilt.upsert(
+                ids=[doc["id"] for doc in page],
+                embeddings=fitted.project_documents([doc["embedding"] for doc in page]),
+                documents=[doc["content"] for doc in page],
+                metadatas=[doc["metadata"] for doc in page]
+            )
+        
+        state = fitted.get_state()
+        reducer = EmbeddingReducer(mode=fitted.mode, dim=fitted.dim, state_path=self._state_path)
+        reducer.set_state(state["mean"], state["components"])
+        previous = self.collection
+        self.reducer, self.collection = reducer, rebuilt
+        self.client.delete_collection(previous.name)
+        rebuilt.modify(name=COLLECTION_NAME)
+        logger.info(f"Re-projected {rebuilt.count()} stored vectors to {self.reducer.dim} dimensions")
+    
+    @staticmethod
+    def _collection_metadata(reducer: EmbeddingReducer) -> Dict:
+        return {"hnsw:space": "cosine", **reducer.to_metadata()}
+
+
+def _include(include_payload: bool, include_embeddings: bool) -> List[str]:
+    """Chroma include fields; metadata costs more to read than the text, so both are skipped together"""
+    include = ["documents", "metadatas"] if include_payload else []
+    if include_embeddings:
+        include.append("embeddings")
+    return include
@@ -0,0 +1,102 @@
+"""
+Warmup - load heavy services in the background after the server starts accepting requests
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from services.metrics import STARTUP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class ComponentFailed(Exception):
+    """A component needed by a request could not be loaded"""
+    
+    def __init__(self, name: str, error: BaseException):
+        super().__init__(f"{name} failed to load: {error}")
+        self.name = name
+        self.error = error
+
+
+class Warmup:
+    """Build named components as background tasks and publish each on app state once ready"""
+    
+    def __init__(self, state):
+        self.state = state
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._seconds: Dict[str, float] = {}
+    
+    def start(self, name: str, build: Callable[[], Awaitable], on_ready: Optional[Callable] = None) -> None:
+        """Run build() in the background; its result becomes state.<name>"""
+        task = asyncio.create_task(self._build(name, build, on_ready))
+        # Failures are reported through get() and status(); mark them retrieved for asyncio
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        self._tasks[name] = task
+    
+    async def _build(self, name: str, build: Callable[[], Awaitable], on_ready: Optional[Callable]):
+        start = time.monotonic()
+        try:
+            component = await build()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to load {name}: {e}")
+            raise
+        
+        setattr(self.state, name, component)
+        if on_ready is not None:
+            on_ready(component)
+        self._seconds[name] = time.monotonic() - start
+        STARTUP_SECONDS.labels(component=name).set(self._seconds[name])
+        logger.info(f"{name} ready in {self._seconds[name]:.2f}s")
+        return component
+    
+    async def get(self, name: str):
+        """Wait for one component; raises ComponentFailed if it could not be loaded"""
+        task = self._tasks.get(name)
+        if task is None:
+            return getattr(self.state, name)
+        try:
+            # Shielded so a caller giving up does not cancel the load for everyone else
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.cancelled():
+                raise ComponentFailed(name, RuntimeError("loading was cancelled"))
+            raise
+        except Exception as e:
+            raise ComponentFailed(name, e)
+    
+    async def require(self, *names: str) -> None:
+        """Wait until every named component is ready"""
+        for name in names:
+            await self.get(name)
+    
+    @property
+    def ready(self) -> bool:
+        return all(task.done() for task in self._tasks.values()) and not self.failed
+    
+    @property
+    def failed(self) -> List[str]:
+        return [
+            name for name, task in self._tasks.items()
+            if task.done() and (task.cancelled() or task.exception() is not None)
+        ]
+    
+    def status(self) -> Dict:
+        components = {}
+        for name, task in self._tasks.items():
+            if not task.done():
+                components[name] = {"status": "warming"}
+            elif task.cancelled() or task.exception() is not None:
+                components[name] = {"status": "failed", "error": "cancelled" if task.cancelled() else str(task.exception())}
+            else:
+                components[name] = {"status": "ready", "seconds": round(self._seconds[name], 3)}
+        return components
+    
+    async def stop(self) -> None:
+        """Cancel loads still running at shutdown"""
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
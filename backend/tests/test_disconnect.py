@@ -0,0 +1,79 @@
+"""
+Disconnect tests - a client hanging up stops the upstream Ollama request
+
+Runs the fake Ollama server and a backend in subprocesses, reads a query stream
+until a few tokens arrived, hangs up, and checks that the fake server saw its
+chat stream close and the backend's in-flight Ollama gauge went back to zero.
+
+    cd backend && python -m pytest tests
+"""
+import argparse
+import asyncio
+import shutil
+import tempfile
+
+import httpx
+import pytest
+
+from benchmarks.check_disconnect import hang_up_after, metric, ollama_stats, wait_for
+from benchmarks.load_test import index_folder, spawned_stack, wait_until_up
+from benchmarks.synthetic_corpus import generate_corpus
+
+# Upstream work may outlive its client by at most this long
+BOUND_SECONDS = 2.0
+
+# Slow enough that every answer is still streaming when the client leaves
+STACK_ARGS = argparse.Namespace(
+    chat_ttft_ms=100.0,
+    tokens_per_sec=10.0,
+    embed_latency_ms=0.0,
+    error_rate=0.0,
+    cold_start_ms=0.0,
+    ollama_parallel=4,
+    backend_log=None,
+)
+
+
+@pytest.fixture(scope="module")
+def stack():
+    folder = tempfile.mkdtemp(prefix="mnemora-test-corpus-")
+    try:
+        generate_corpus(folder, 20)
+        with spawned_stack(STACK_ARGS) as (backend_url, ollama_url):
+            asyncio.run(_index(backend_url, folder))
+            yield backend_url, ollama_url
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+async def _index(backend_url: str, folder: str) -> None:
+    await wait_until_up(f"{backend_url}/health")
+    async with httpx.AsyncClient(timeout=300) as client:
+        error = await index_folder(client, backend_url, folder)
+    assert error is None, error
+
+
+@pytest.mark.parametrize("path, body", [
+    ("/query", {"query": "what is indexed", "use_cache": False}),
+    ("/query/batch", {"queries": ["one", "two", "three"], "format": "sse", "use_cache": False}),
+])
+def test_hang_up_closes_upstream_request(stack, path, body):
+    backend_url, ollama_url = stack
+    
+    async def check():
+        async with httpx.AsyncClient(timeout=60) as client:
+            disconnects = await metric(client, backend_url, "mnemora_http_client_disconnects_total")
+            
+            await hang_up_after(backend_url, path, body, "token", count=3)
+            
+            async def chats_closed():
+                return (await ollama_stats(client, ollama_url))["chats_active"] == 0
+            
+            async def nothing_in_flight():
+                return await metric(client, backend_url, "mnemora_ollama_requests_in_flight") == 0
+            
+            assert await wait_for(chats_closed, BOUND_SECONDS) is not None
+            assert await wait_for(nothing_in_flight, BOUND_SECONDS) is not None
+            assert await metric(client, backend_url, "mnemora_http_client_disconnects_total") > disconnects
+    
+    asyncio.run(check())